@@ -13,35 +13,68 @@ Final iteration of the snake program.  This last iteration implements the event
 handler functions in the controller (the Snake class) that were created
 as stub functions in iteration 4.
 """
-import tkinter as tk
-from tkinter.font import Font
 from enum import IntEnum
 import unittest
 import random as rand
 import collections
+import array
+import os
+import time
 from datetime import datetime
 import math
 
+#tkinter is only imported once a window is built, so the model and the
+#headless engine work on machines with no display or no Tk installed
+tk = None
+
+def load_tk():
+    """ Import tkinter on first use of the GUI """
+    global tk
+    if tk is None:
+        import tkinter
+        tk = tkinter
+    return tk
+
 class GameOver(Exception):
+    """ Raised by SnakeModel.one_step when the game ends, the message says
+    why: 'wall', 'self' or 'full' """
     pass
 class snake:
     """ This is the controller """
-    def __init__(self):
-        """ Initializes the snake game """
+    def __init__(self, view_class=None, mainloop=True, replay_dir=None,
+                 num_rows=30, num_cols=30, scores_path=None):
+        """ Initializes the snake game, view_class picks the view backend
+        (SnakeView by default, CanvasSnakeView for large boards, or
+        ViewportSnakeView for boards too large to show whole).
+        With mainloop False the event loop is left for the caller to run.
+        Every game is recorded, and saved to replay_dir if one is given.
+        Finished games are added to the leaderboard at scores_path."""
         #define parameters
-        self.NUM_ROWS = 30
-        self.NUM_COLS = 30
+        self.NUM_ROWS = num_rows
+        self.NUM_COLS = num_cols
         self.model = None
         self.mode = Mode.Norm
         self.GameState = GameState.Initial
         self.DEFAULT_STEP_TIME_MILLIS = 500
 
         # Create view
-        self.view = SnakeView(self.NUM_ROWS, self.NUM_COLS) #initialize snakeview object
-        #create model
-        self.model = SnakeModel(self.NUM_ROWS, self.NUM_COLS)
+        if view_class is None:
+            view_class = SnakeView
+        self.view = view_class(self.NUM_ROWS, self.NUM_COLS) #initialize snakeview object
         #time step length variable
         self.step_time_millis = self.DEFAULT_STEP_TIME_MILLIS
+        self.scheduler = TickScheduler(self.step_time_millis)
+        self.last_tick_time = 0
+        self.profiler = None
+        self.replay_dir = replay_dir
+        self.recorder = None
+        self.autopilot = None
+        self.scores = None
+        if scores_path is not None:
+            import SnakeScores
+            self.scores = SnakeScores.ScoreWriter(scores_path)
+        #create model
+        self.new_game()
         # Start
         self.view.set_start_handler(self.start_handler)
         # Pause
@@ -62,15 +95,24 @@ class snake:
         self.view.set_right_arrow_handler(self.right_handler)
         #left key
         self.view.set_left_arrow_handler(self.left_handler)
+        #autopilot
+        self.view.set_autopilot_handler(self.autopilot_handler)
+        #profile dump key
+        self.view.set_dump_profile_handler(self.dump_profile_handler)
 
         self.time_elapsed = 0
+        self.view.reset()
+        self.draw_model()
         # Start the simulation
-        self.view.window.mainloop()
+        if mainloop:
+            self.view.window.mainloop()
 
     def start_handler(self):
         if self.GameState != GameState.Playing and self.GameState != GameState.Ended:
             self.GameState = GameState.Playing
-            self.view.schedule_next_step(self.step_time_millis, 
+            self.scheduler.start()
+            self.last_tick_time = self.scheduler.clock()
+            self.view.schedule_next_step(self.scheduler.delay_millis(), 
                                         self.continue_simulation)
         print("Start simulation")
         
@@ -84,10 +126,11 @@ class snake:
     def reset_handler(self):
         """ Reset simulation """
         self.pause_handler()
+        self.end_recording('unfinished')
         self.view.reset()
         self.mode = self.model.mode #save game mode for after reset
-        self.model = SnakeModel(self.NUM_ROWS, self.NUM_COLS)
-        self.model.mode = self.mode
+        self.new_game()
+        self.draw_model()
         self.GameState = GameState.Initial
         self.view.time_diff.set('Time: 00.00')
         self.time_elapsed = 0
@@ -96,11 +139,64 @@ class snake:
 
     def quit_handler(self):
         """ Quit life program """
+        self.end_recording('unfinished')
+        if self.scores is not None:
+            self.scores.close()
         self.view.window.destroy()
 
+    def new_game(self):
+        """ Start a freshly seeded game in the current mode and start
+        recording it.  After the first game the model is restarted in
+        place rather than rebuilt. """
+        self.seed = rand.randrange(2**63)
+        if self.model is None:
+            self.model = SnakeModel(self.NUM_ROWS, self.NUM_COLS, self.seed)
+            if self.profiler is not None:
+                self.profiler.instrument(self.model, 'place_food', 'food')
+        else:
+            self.model.restart(self.seed)
+        self.model.mode = self.mode
+        import SnakeReplay
+        #keyframes only matter in a replay that gets saved
+        self.recorder = SnakeReplay.ReplayRecorder(self.model, self.seed,
+                        None if self.replay_dir is not None else 0)
+
+    def end_recording(self, cause):
+        """ Close the replay of the current game and save it if wanted,
+        returns the path it was saved to """
+        if self.recorder is None or self.recorder.cause is not None:
+            return None
+        self.recorder.finish(cause)
+        if self.replay_dir is not None:
+            os.makedirs(self.replay_dir, exist_ok = True)
+            name = 'snake-%s-%d.snkr' % (time.strftime('%Y%m%d-%H%M%S'), self.seed)
+            path = os.path.join(self.replay_dir, name)
+            self.recorder.save(path)
+            return path
+        return None
+
+    def record_score(self, cause, replay):
+        """ Queue the finished game for the leaderboard, off the tick path """
+        if self.scores is None:
+            return
+        import SnakeScores
+        points = self.model.points_earned
+        steps = self.recorder.tick if self.recorder is not None else 0
+        pace = points / self.time_elapsed if self.time_elapsed else 0.0
+        self.scores.submit(SnakeScores.ScoreRecord(points, steps, self.time_elapsed, pace,
+                           self.model.mode.name, self.NUM_ROWS, self.NUM_COLS, self.seed,
+                           cause, 'autopilot' if self.autopilot is not None else 'human',
+                           replay))
+
     def step_speed_handler(self, value):
         """ Adjust simulation speed"""
         self.step_time_millis = int(self.DEFAULT_STEP_TIME_MILLIS/int(value))
+        self.scheduler.set_period(self.step_time_millis)
+        if self.GameState == GameState.Playing:
+            #the pending timer was set for the old period
+            self.view.cancel_next_step()
+            self.view.schedule_next_step(self.scheduler.delay_millis(),
+                                         self.continue_simulation)
         print("Step speed: Value = %s" % self.step_time_millis)
 
     def wraparound_handler(self):
@@ -113,74 +209,154 @@ class snake:
              pass
         else:
             self.model.mode = self.mode
+            if self.recorder is not None:
+                self.recorder.record_mode(self.mode)
         
     def up_handler(self, event):
         """up button"""
-        if self.model.direction != DirectionState.down or len(self.model.snake) == 1:
-            self.model.direction = DirectionState.up
+        self.steer(DirectionState.up)
         
     def down_handler(self, event):
         """down button"""
-        if self.model.direction != DirectionState.up or len(self.model.snake) == 1:
-            self.model.direction = DirectionState.down
+        self.steer(DirectionState.down)
 
     def left_handler(self, event):
         """left button"""
-        if self.model.direction != DirectionState.right or len(self.model.snake) == 1:
-            self.model.direction = DirectionState.left
+        self.steer(DirectionState.left)
 
     def right_handler(self, event):
         """right button"""
-        if self.model.direction != DirectionState.left or len(self.model.snake) == 1:    
-            self.model.direction = DirectionState.right
+        self.steer(DirectionState.right)
+
+    def autopilot_handler(self):
+        """ Toggle the autopilot, arrow keys are ignored while it drives """
+        if self.autopilot is None:
+            import SnakeAutopilot
+            self.autopilot = SnakeAutopilot.Autopilot()
+        else:
+            self.autopilot = None
+
+    def steer(self, direction):
+        """ Turn the snake from an arrow key """
+        if self.autopilot is not None:
+            return
+        if self.profiler is not None:
+            start = self.profiler.clock()
+        if self.model.queue_direction(direction) and self.recorder is not None:
+            self.recorder.record_direction(direction)
+        if self.profiler is not None:
+            self.profiler.lap('input', start)
+
+    def enable_profiling(self, path = None, interval = 10.0):
+        """ Time every phase of each tick, writing the summary to path
+        every interval seconds if a path is given """
+        import SnakeProfile
+        self.profiler = SnakeProfile.TickProfiler(path, interval)
+        self.profiler.instrument(self.model, 'place_food', 'food')
+
+    def dump_profile_handler(self, event = None):
+        """ Print the tick profile so far """
+        if self.profiler is not None:
+            print(self.profiler.report())
+            if self.profiler.path is not None:
+                self.profiler.write()
 
     def continue_simulation(self):
-        """ Perform another step of the simulation, and schedule the next step."""
+        """ Perform the steps that are due, and schedule the next step.
+        When the timer fires late every missed step is still simulated,
+        but the view is only repainted once."""
         if self.GameState == GameState.Playing:
-            self.one_step()
-            self.view.schedule_next_step(self.step_time_millis, self.continue_simulation)
-            self.time_elapsed += self.step_time_millis/1000
+            ticks = self.scheduler.ticks_due()
+            if ticks and self.profiler is not None:
+                self.profiler.record('schedule_delay', self.scheduler.jitter[-1])
+            now = self.scheduler.clock()
+            self.time_elapsed += now - self.last_tick_time
+            self.last_tick_time = now
+            if ticks:
+                self.advance(ticks)
+            if self.GameState == GameState.Playing:
+                self.view.schedule_next_step(self.scheduler.delay_millis(),
+                                             self.continue_simulation)
     
     def one_step(self):
         """ Simulate one step """
+        self.advance(1)
+
+    def advance(self, ticks):
+        """ Simulate ticks steps, then repaint the cells they changed """
+        profiler = self.profiler
+        if profiler is not None:
+            start = t = profiler.clock()
+        changed = {}
+        head = None
         try:
             # Update the model
-            self.model.one_step()
-            # Update the view
-            for row in range(self.NUM_ROWS):
-                for col in range(self.NUM_COLS):
-                    #print(row, col)
-                    if self.model.state[row][col] == CellState.Snake:
-                        self.view.make_snake_body(row, col)
-                        #check for snake head
-                    elif self.model.state[row][col] == CellState.Food:
-                        self.view.make_food(row, col)
-                    else:
-                        self.view.make_nothing(row, col)
-            head = self.model.snake[-1]
-            self.view.make_snake_head(head[0], head[1])
-            self.view.points_earned.set('Points: ' + str(self.model.points_earned))
-            if self.time_elapsed != 0:
-                self.view.score_per_second.set('Points per second: ' + str(round(self.model.points_earned/self.time_elapsed, 2)))
-            self.view.time_diff.set('Time: ' + str(round(self.time_elapsed, 2)) + 's')
-
-        except GameOver:
+            for i in range(ticks):
+                if self.autopilot is not None:
+                    direction = self.autopilot.steer(self.model)
+                    if direction is not None and self.recorder is not None:
+                        self.recorder.record_direction(direction)
+                delta = self.model.one_step()
+                if self.recorder is not None:
+                    self.recorder.record_step()
+                for row, col, cell in delta.changes:
+                    changed[(row, col)] = cell
+                head = delta.new_head
+        except GameOver as end:
             self.GameState = GameState.Ended
             self.view.game_over.set('Game Over')
+            self.record_score(str(end), self.end_recording(str(end)))
+        if profiler is not None:
+            t = profiler.lap('model_step', t)
+        # Update the view, only repainting the cells that changed, the head once
+        for position, cell in changed.items():
+            if position != head:
+                self.draw_cell(position[0], position[1], cell)
+        if head is not None:
+            self.view.make_snake_head(head[0], head[1])
+        if profiler is not None:
+            t = profiler.lap('view_update', t)
+        self.view.points_earned.set('Points: ' + str(self.model.points_earned))
+        if self.time_elapsed != 0:
+            self.view.score_per_second.set('Points per second: ' + str(round(self.model.points_earned/self.time_elapsed, 2)))
+        self.view.time_diff.set('Time: ' + str(round(self.time_elapsed, 2)) + 's')
+        if profiler is not None:
+            profiler.lap('label_update', t)
+            profiler.end_tick(start)
+
+    def draw_cell(self, row, col, cell):
+        """ Paint a single cell of the view to match a model cell state """
+        if cell == CellState.Snake:
+            self.view.make_snake_body(row, col)
+        elif cell == CellState.Food:
+            self.view.make_food(row, col)
+        else:
+            self.view.make_nothing(row, col)
+
+    def draw_model(self):
+        """ Paint the snake and food of a fresh model onto a blank view """
+        for row, col in self.model.snake:
+            self.view.make_snake_body(row, col)
+        if self.model.food_location:
+            self.view.make_food(*self.model.food_location)
+        head = self.model.snake[-1]
+        self.view.make_snake_head(head[0], head[1])
 
 class SnakeView:
-    def __init__(self, num_rows, num_cols):
+    def __init__(self, num_rows, num_cols, cell_size = 20):
         """ Initialize view of the game """
        # Constants
-        self.cell_size = 20
+        self.cell_size = cell_size
         self.control_frame_height = 100
         self.score_frame_width = 200
 
         # Size of grid
         self.num_rows = num_rows
         self.num_cols = num_cols
+        view_rows, view_cols = self.view_size()
 
         # Create window
+        load_tk()
         self.window = tk.Tk()
         self.window.title("Greedy Snake")
 
@@ -196,9 +372,12 @@ class SnakeView:
         self.score_per_second.set('Points per second:     ')
         
  
+        #cells not drawn white, so reset only has to repaint those
+        self.painted = set()
+
         # Create frame for grid of cells
-        self.grid_frame = tk.Frame(self.window, height = num_rows * self.cell_size,
-                                width = num_cols * self.cell_size)
+        self.grid_frame = tk.Frame(self.window, height = view_rows * self.cell_size,
+                                width = view_cols * self.cell_size)
         self.grid_frame.grid(row = 1, column = 1) # use grid layout manager
         self.cells = self.add_cells()
 
@@ -212,13 +391,17 @@ class SnakeView:
 
         #Create frame for score 
         self.score_frame = tk.Frame(self.window, width = self.score_frame_width, 
-                                height = num_rows * self.cell_size)
+                                height = view_rows * self.cell_size)
         self.score_frame.grid(row = 1, column = 2) # use grid layout manager
         self.score_frame.grid_propagate(False)
         (self.score_label, self.points_frame, self.time_frame,
                 self.points_per_second_frame, self.gameover_label) = self.add_score()
 
 
+    def view_size(self):
+        """ Rows and columns of cells on screen, the whole board here """
+        return self.num_rows, self.num_cols
+
     def add_cells(self):
         """ Add cells to the grid frame """
         cells = []
@@ -227,7 +410,7 @@ class SnakeView:
             for c in range(self.num_cols):
                 frame = tk.Frame(self.grid_frame, width = self.cell_size, 
                            height = self.cell_size, borderwidth = 1, 
-                           relief = "solid") 
+                           relief = "solid", bg = 'white') 
                 frame.grid(row = r, column = c) # use grid layout manager
                 row.append(frame)
             cells.append(row)
@@ -248,11 +431,13 @@ class SnakeView:
         quit_button.grid(row=1, column=6, padx = 20)
         wraparound_check = tk.Checkbutton(self.control_frame, text = 'Wraparound')
         wraparound_check.grid(row = 1, column = 7, padx = 20)
+        self.autopilot_check = tk.Checkbutton(self.control_frame, text = 'Autopilot')
+        self.autopilot_check.grid(row = 1, column = 8, padx = 20)
         # Vertically center the controls in the control frame
         self.control_frame.grid_rowconfigure(1, weight = 1) 
         # Horizontally center the controls in the control frame
         self.control_frame.grid_columnconfigure(0, weight = 1) 
-        self.control_frame.grid_columnconfigure(7, weight = 1) 
+        self.control_frame.grid_columnconfigure(8, weight = 1) 
                                                             
         return (start_button, pause_button, step_speed_slider, 
                 reset_button, quit_button, wraparound_check)
@@ -285,24 +470,27 @@ class SnakeView:
     def make_snake_body(self, row, column):
         """ Make cell in row, column into snake """
         self.cells[row][column]['bg'] = 'blue'
+        self.painted.add((row, column))
 
     def make_snake_head(self, row, column):
         """ Make cell in row, column into snake head """
         self.cells[row][column]['bg'] = 'black'
+        self.painted.add((row, column))
 
     def make_nothing(self, row, column):
         """ Make cell in row, column nothing"""
         self.cells[row][column]['bg'] = 'white'
+        self.painted.discard((row, column))
 
     def make_food(self, row, column):
         """ Make cell in row, column food """
         self.cells[row][column]['bg'] = 'red'
+        self.painted.add((row, column))
 
     def reset(self):
-        """reset all cells to nothing"""
-        for r in range(self.num_rows):
-            for c in range(self.num_cols):
-                self.make_nothing(r, c)
+        """reset all cells to nothing, repainting only the cells in use"""
+        for row, column in list(self.painted):
+            self.make_nothing(row, column)
         self.game_over.set(" ")
         self.points_earned.set("Points: 0")
 
@@ -330,6 +518,10 @@ class SnakeView:
         """ set handler for pressing on the left key to the function handler """
         self.window.bind('<Left>', handler)
 
+    def set_dump_profile_handler(self, handler):
+        """ set handler for pressing F12 to the function handler """
+        self.window.bind('<F12>', handler)
+
     def set_start_handler(self, handler):
         """ set handler for clicking on start button to the function handler """
         self.start_button.configure(command = handler)
@@ -354,36 +546,676 @@ class SnakeView:
         """set handler for clicking the wraparound check box to the function handler"""
         self.wraparound_check.configure(command = handler)
 
+    def set_autopilot_handler(self, handler):
+        """set handler for clicking the autopilot check box to the function handler"""
+        self.autopilot_check.configure(command = handler)
+
+class FreeCells:
+    """
+    Index of the empty cells on the board.
+
+    Cells are kept as flat indices (row*num_cols+col) in a dense array
+    alongside a position table mapping each cell to its slot in that array,
+    so insert, delete, membership and uniform random sampling are all O(1).
+    Deleting swaps the last entry into the freed slot.
+
+    Starting from the identity order, a discard only ever writes the slot
+    of a cell discarded since, or a slot at or past the shortest length
+    the array has had, so the index keeps both and clear() can put the
+    identity order back by rewriting just those slots.
+    """
+
+    def __init__(self, num_rows, num_cols):
+        """ Start with every cell on the board free """
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cells = array.array('i', range(num_rows * num_cols))
+        self.position = array.array('i', range(num_rows * num_cols))
+        #cells discarded since the identity order, each once, and the
+        #shortest length of cells since then
+        self.touched = bytearray(num_rows * num_cols)
+        self.footprint = array.array('i')
+        self.low = num_rows * num_cols
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.position[cell[0] * self.num_cols + cell[1]] != -1
+
+    def __iter__(self):
+        for index in self.cells:
+            yield divmod(index, self.num_cols)
+
+    def add(self, row, col):
+        """ Mark cell in row, col as free, does nothing if it already is """
+        self.add_index(row * self.num_cols + col)
+
+    def discard(self, row, col):
+        """ Mark cell in row, col as taken, does nothing if it already is """
+        self.discard_index(row * self.num_cols + col)
+
+    def add_index(self, index):
+        """ Mark the cell with flat index as free """
+        if self.position[index] == -1:
+            self.position[index] = len(self.cells)
+            self.cells.append(index)
+
+    def discard_index(self, index):
+        """ Mark the cell with flat index as taken """
+        slot = self.position[index]
+        if slot != -1:
+            cells = self.cells
+            last = cells.pop()
+            if last != index:
+                cells[slot] = last
+                self.position[last] = slot
+            self.position[index] = -1
+            if len(cells) < self.low:
+                self.low = len(cells)
+            if not self.touched[index]:
+                self.touched[index] = 1
+                self.footprint.append(index)
+
+    def insert_index(self, index, slot):
+        """ Put a taken cell back at slot, moving the cell there to the end.
+        Undoes discard_index exactly, so later samples are unchanged. """
+        cells = self.cells
+        if slot < len(cells):
+            moved = cells[slot]
+            self.position[moved] = len(cells)
+            cells.append(moved)
+            cells[slot] = index
+        else:
+            cells.append(index)
+        self.position[index] = slot
+
+    def copy(self):
+        free = FreeCells.__new__(FreeCells)
+        free.num_rows = self.num_rows
+        free.num_cols = self.num_cols
+        free.cells = array.array('i', self.cells)
+        free.position = array.array('i', self.position)
+        free.touched = bytearray(self.touched)
+        free.footprint = array.array('i', self.footprint)
+        free.low = self.low
+        return free
+
+    def clear(self):
+        """ Mark every cell free again, in the order of a new index.  Costs
+        O(cells discarded since the last clear) rather than O(board). """
+        size = self.num_rows * self.num_cols
+        cells = self.cells
+        position = self.position
+        low = self.low
+        #everything from low on may have moved, the rest only where touched,
+        #and low is never past the end so this also regrows cells
+        cells[low:] = position[low:] = array.array('i', range(low, size))
+        touched = self.touched
+        for index in self.footprint:
+            cells[index] = index
+            position[index] = index
+            touched[index] = 0
+        del self.footprint[:]
+        self.low = size
+
+    def sample(self, rng):
+        """ Return a uniformly random free cell as (row, col) """
+        return divmod(self.sample_index(rng), self.num_cols)
+
+    def sample_index(self, rng):
+        """ Return the flat index of a uniformly random free cell """
+        return self.cells[rng.randrange(len(self.cells))]
+
+    def rebuild(self, grid):
+        """ Refill the index from a flat grid of cell states """
+        self.cells = array.array('i', (i for i, cell in enumerate(grid)
+                                       if cell == CellState.Nothing))
+        self.position = array.array('i', [-1]) * len(grid)
+        for slot, index in enumerate(self.cells):
+            self.position[index] = slot
+        #nothing is known about the order any more, clear() redoes it all
+        self.low = 0
+
+StepDelta = collections.namedtuple('StepDelta', ['changes', 'old_head', 'new_head'])
+StepDelta.__doc__ = """ Cells changed by one step, as (row, col, CellState) tuples,
+plus the snake head before and after the step """
+
+class CanvasSnakeView(SnakeView):
+    """
+    View that draws the whole board on a single canvas, one rectangle
+    item per cell, instead of creating a bordered frame widget per cell.
+    Startup and memory stay reasonable on boards of 100x100 and beyond.
+    """
+
+    def add_cells(self):
+        """ Add a canvas with one rectangle per cell to the grid frame """
+        self.canvas = tk.Canvas(self.grid_frame, width = self.num_cols * self.cell_size,
+                                height = self.num_rows * self.cell_size,
+                                highlightthickness = 0, background = 'white')
+        self.canvas.grid(row = 0, column = 0)
+        #skip the cell outlines once they would swamp the cells themselves
+        outline = 'black' if self.cell_size >= 6 else ''
+        cells = []
+        size = self.cell_size
+        for r in range(self.num_rows):
+            row = []
+            for c in range(self.num_cols):
+                rect = self.canvas.create_rectangle(c * size, r * size,
+                            (c + 1) * size, (r + 1) * size, fill = 'white',
+                            outline = outline, tags = 'cell')
+                row.append(rect)
+            cells.append(row)
+        return cells
+
+    def make_snake_body(self, row, column):
+        """ Make cell in row, column into snake """
+        self.canvas.itemconfigure(self.cells[row][column], fill = 'blue')
+        self.painted.add((row, column))
+
+    def make_snake_head(self, row, column):
+        """ Make cell in row, column into snake head """
+        self.canvas.itemconfigure(self.cells[row][column], fill = 'black')
+        self.painted.add((row, column))
+
+    def make_nothing(self, row, column):
+        """ Make cell in row, column nothing"""
+        self.canvas.itemconfigure(self.cells[row][column], fill = 'white')
+        self.painted.discard((row, column))
+
+    def make_food(self, row, column):
+        """ Make cell in row, column food """
+        self.canvas.itemconfigure(self.cells[row][column], fill = 'red')
+        self.painted.add((row, column))
+
+    def reset(self):
+        """reset all cells to nothing, repainting only the cells in use"""
+        for row, column in list(self.painted):
+            self.make_nothing(row, column)
+        self.game_over.set(" ")
+        self.points_earned.set("Points: 0")
+
+class Camera:
+    """
+    The window of view_rows x view_cols cells of the board that is on
+    screen, with its top left corner at (top, left).  The window stays put
+    while the followed cell is more than margin cells inside it, and jumps
+    to recenter on the cell once it comes closer to an edge, so the screen
+    is redrawn every few steps rather than scrolled every step.
+    """
+
+    def __init__(self, num_rows, num_cols, view_rows, view_cols, margin = None):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.view_rows = min(view_rows, num_rows)
+        self.view_cols = min(view_cols, num_cols)
+        if margin is None:
+            margin = min(self.view_rows, self.view_cols) // 4
+        self.margin = margin
+        self.top = 0
+        self.left = 0
+
+    def shift(self, pos, start, size, limit):
+        """ New start of the window along one axis so pos is well inside it """
+        margin = min(self.margin, (size - 1) // 2)
+        if start + margin <= pos < start + size - margin:
+            return start
+        return max(0, min(pos - size // 2, limit - size))
+
+    def follow(self, row, col):
+        """ Move the window to keep row, col in view, returns True if it moved """
+        top = self.shift(row, self.top, self.view_rows, self.num_rows)
+        left = self.shift(col, self.left, self.view_cols, self.num_cols)
+        moved = top != self.top or left != self.left
+        self.top = top
+        self.left = left
+        return moved
+
+    def contains(self, row, col):
+        return (self.top <= row < self.top + self.view_rows and
+                self.left <= col < self.left + self.view_cols)
+
+class ViewportSnakeView(SnakeView):
+    """
+    View for boards too large to draw whole.  Only a view_rows x view_cols
+    window around the snake head is drawn, on a canvas with one rectangle
+    per visible cell, and it follows the head through a Camera.  The view
+    keeps a byte per board cell recording what it shows there, so moving
+    the camera repaints the window from that record without asking the
+    model, and only items whose color changes are touched.  Drawing costs
+    depend on the window size, not on the board size.
+
+    With minimap True a downsampled picture of the whole board is shown
+    beside the window, with the window outlined on it.
+    """
+
+    #codes kept per cell, and the colors they are drawn in
+    EMPTY = 0
+    BODY = 1
+    FOOD = 2
+    HEAD = 3
+    COLORS = ('white', 'blue', 'red', 'black')
+    MINIMAP_SIZE = 200
+
+    def __init__(self, num_rows, num_cols, cell_size = 20, view_rows = 30,
+                 view_cols = 30, minimap = True):
+        self.camera = Camera(num_rows, num_cols, view_rows, view_cols)
+        self.shadow = bytearray(num_rows * num_cols)
+        self.minimap = minimap
+        SnakeView.__init__(self, num_rows, num_cols, cell_size)
+        if minimap:
+            self.add_minimap()
+
+    def view_size(self):
+        return self.camera.view_rows, self.camera.view_cols
+
+    def add_cells(self):
+        """ Add a canvas with one rectangle per visible cell to the grid frame """
+        rows, cols = self.view_size()
+        size = self.cell_size
+        self.canvas = tk.Canvas(self.grid_frame, width = cols * size, height = rows * size,
+                                highlightthickness = 0, background = 'white')
+        self.canvas.grid(row = 0, column = 0)
+        outline = 'black' if size >= 6 else ''
+        #code currently shown by each visible item
+        self.shown = bytearray(rows * cols)
+        cells = []
+        for r in range(rows):
+            for c in range(cols):
+                cells.append(self.canvas.create_rectangle(c * size, r * size,
+                             (c + 1) * size, (r + 1) * size, fill = 'white',
+                             outline = outline, tags = 'cell'))
+        return cells
+
+    def add_minimap(self):
+        """ Add a downsampled picture of the whole board beside the grid """
+        #each minimap block covers block x block cells and is drawn pixel pixels wide
+        self.block = max(1, math.ceil(max(self.num_rows, self.num_cols) / self.MINIMAP_SIZE))
+        self.pixel = max(1, self.MINIMAP_SIZE // max(self.num_rows, self.num_cols))
+        self.block_rows = math.ceil(self.num_rows / self.block)
+        self.block_cols = math.ceil(self.num_cols / self.block)
+        blocks = self.block_rows * self.block_cols
+        self.block_snake = array.array('i', [0]) * blocks
+        self.block_food = array.array('i', [0]) * blocks
+        self.block_shown = bytearray(blocks)
+        width = self.block_cols * self.pixel
+        height = self.block_rows * self.pixel
+        self.minimap_canvas = tk.Canvas(self.window, width = width, height = height,
+                                        highlightthickness = 1, background = 'white')
+        self.minimap_canvas.grid(row = 1, column = 3, padx = 10)
+        self.minimap_image = tk.PhotoImage(width = width, height = height)
+        self.minimap_image.put('white', to = (0, 0, width, height))
+        self.minimap_canvas.create_image(0, 0, image = self.minimap_image, anchor = 'nw')
+        self.minimap_outline = self.minimap_canvas.create_rectangle(0, 0, 0, 0,
+                                                                    outline = 'green')
+        self.update_outline()
+
+    def update_outline(self):
+        scale = self.pixel / self.block
+        camera = self.camera
+        self.minimap_canvas.coords(self.minimap_outline, camera.left * scale,
+                                   camera.top * scale,
+                                   (camera.left + camera.view_cols) * scale,
+                                   (camera.top + camera.view_rows) * scale)
+
+    def update_block(self, row, col, old, new):
+        """ Keep the minimap block of a cell in step with a change of code """
+        block = (row // self.block) * self.block_cols + col // self.block
+        if old == self.FOOD:
+            self.block_food[block] -= 1
+        elif old != self.EMPTY:
+            self.block_snake[block] -= 1
+        if new == self.FOOD:
+            self.block_food[block] += 1
+        elif new != self.EMPTY:
+            self.block_snake[block] += 1
+        if self.block_food[block]:
+            code = self.FOOD
+        elif self.block_snake[block]:
+            code = self.BODY
+        else:
+            code = self.EMPTY
+        if code != self.block_shown[block]:
+            self.block_shown[block] = code
+            x = (col // self.block) * self.pixel
+            y = (row // self.block) * self.pixel
+            self.minimap_image.put(self.COLORS[code],
+                                   to = (x, y, x + self.pixel, y + self.pixel))
+
+    def set_cell(self, row, col, code):
+        """ Record the code of a board cell, and paint it if it is in view """
+        index = row * self.num_cols + col
+        old = self.shadow[index]
+        if old == code:
+            return
+        self.shadow[index] = code
+        if self.minimap:
+            self.update_block(row, col, old, code)
+        camera = self.camera
+        if camera.contains(row, col):
+            item = (row - camera.top) * camera.view_cols + col - camera.left
+            self.shown[item] = code
+            self.canvas.itemconfigure(self.cells[item], fill = self.COLORS[code])
+
+    def repaint(self):
+        """ Paint the window from the recorded codes after the camera moved """
+        camera = self.camera
+        shadow = self.shadow
+        shown = self.shown
+        cols = camera.view_cols
+        item = 0
+        for r in range(camera.view_rows):
+            start = (camera.top + r) * self.num_cols + camera.left
+            line = shadow[start:start + cols]
+            if line != shown[item:item + cols]:
+                for c in range(cols):
+                    if line[c] != shown[item + c]:
+                        shown[item + c] = line[c]
+                        self.canvas.itemconfigure(self.cells[item + c],
+                                                  fill = self.COLORS[line[c]])
+            item += cols
+        if self.minimap:
+            self.update_outline()
+
+    def make_snake_body(self, row, column):
+        """ Make cell in row, column into snake """
+        self.set_cell(row, column, self.BODY)
+
+    def make_snake_head(self, row, column):
+        """ Make cell in row, column into snake head, keeping it in view """
+        self.set_cell(row, column, self.HEAD)
+        if self.camera.follow(row, column):
+            self.repaint()
+
+    def make_nothing(self, row, column):
+        """ Make cell in row, column nothing"""
+        self.set_cell(row, column, self.EMPTY)
+
+    def make_food(self, row, column):
+        """ Make cell in row, column food """
+        self.set_cell(row, column, self.FOOD)
+
+    def reset(self):
+        """reset all cells to nothing"""
+        self.shadow[:] = bytes(len(self.shadow))
+        self.shown[:] = bytes(len(self.shown))
+        self.canvas.itemconfigure('cell', fill = 'white')
+        if self.minimap:
+            blocks = len(self.block_shown)
+            self.block_snake[:] = array.array('i', [0]) * blocks
+            self.block_food[:] = array.array('i', [0]) * blocks
+            self.block_shown[:] = bytes(blocks)
+            self.minimap_image.put('white', to = (0, 0, self.block_cols * self.pixel,
+                                                  self.block_rows * self.pixel))
+        self.game_over.set(" ")
+        self.points_earned.set("Points: 0")
+
+class SnakeBody:
+    """
+    The snake as a ring buffer of flat cell indices, tail first and head
+    last.  Indexing and iteration give (row, col) tuples so it reads like
+    the deque of positions the model used to keep.
+    """
+
+    def __init__(self, num_cols, positions = ()):
+        self.num_cols = num_cols
+        self.ring = array.array('i', [0]) * 8
+        self.start = 0
+        self.length = 0
+        self.head = -1
+        for row, col in positions:
+            self.push(row * num_cols + col)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('snake index out of range')
+        return divmod(self.ring[(self.start + i) % len(self.ring)], self.num_cols)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield divmod(self.ring[(self.start + i) % len(self.ring)], self.num_cols)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def append(self, position):
+        """ Add a new head at (row, col) """
+        self.push(position[0] * self.num_cols + position[1])
+
+    def popleft(self):
+        """ Remove the tail and return it as (row, col) """
+        return divmod(self.pop_tail(), self.num_cols)
+
+    def push(self, index):
+        """ Add a new head by flat index, growing the ring when it is full """
+        size = len(self.ring)
+        if self.length == size:
+            self.ring = (self.ring[self.start:] + self.ring[:self.start]
+                         + array.array('i', [0]) * size)
+            self.start = 0
+            size *= 2
+        self.ring[(self.start + self.length) % size] = index
+        self.length += 1
+        self.head = index
+
+    def pop_tail(self):
+        """ Remove the tail and return its flat index """
+        index = self.ring[self.start]
+        self.start = (self.start + 1) % len(self.ring)
+        self.length -= 1
+        return index
+
+    def pop_head(self):
+        """ Remove the head and return its flat index, undoes push """
+        index = self.head
+        self.length -= 1
+        if self.length:
+            self.head = self.ring[(self.start + self.length - 1) % len(self.ring)]
+        else:
+            self.head = -1
+        return index
+
+    def clear(self):
+        """ Empty the snake, keeping the ring for the next one """
+        self.start = 0
+        self.length = 0
+        self.head = -1
+
+    def push_tail(self, index):
+        """ Add a cell behind the tail, undoes pop_tail """
+        self.start = (self.start - 1) % len(self.ring)
+        self.ring[self.start] = index
+        self.length += 1
+
+    def copy(self):
+        body = SnakeBody.__new__(SnakeBody)
+        body.num_cols = self.num_cols
+        body.ring = array.array('i', self.ring)
+        body.start = self.start
+        body.length = self.length
+        body.head = self.head
+        return body
+
+    def indices(self):
+        """ Flat cell indices from tail to head """
+        size = len(self.ring)
+        return [self.ring[(self.start + i) % size] for i in range(self.length)]
+
+class StateRow:
+    """ One row of a StateView """
+
+    def __init__(self, grid, offset, num_cols):
+        self.grid = grid
+        self.offset = offset
+        self.num_cols = num_cols
+
+    def __len__(self):
+        return self.num_cols
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return [self.grid[self.offset + c] for c in range(*col.indices(self.num_cols))]
+        if col < 0:
+            col += self.num_cols
+        return self.grid[self.offset + col]
+
+    def __setitem__(self, col, value):
+        self.grid[self.offset + col] = value
+
+    def __iter__(self):
+        return iter(self.grid[self.offset:self.offset + self.num_cols])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+class StateView:
+    """
+    Compatibility view of a model's flat grid as rows of cells, so
+    state[row][col] reads and writes and comparisons against lists of
+    lists behave as they did when state was a list of lists.
+    """
+
+    def __init__(self, grid, num_rows, num_cols):
+        self.grid = grid
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.num_rows
+        return StateRow(self.grid, row * self.num_cols, self.num_cols)
+
+    def __iter__(self):
+        for row in range(self.num_rows):
+            yield self[row]
+
+    def __eq__(self, other):
+        return [list(row) for row in self] == [list(row) for row in other]
+
+    def __repr__(self):
+        return repr([list(row) for row in self])
+
+neighbor_cache = {}
+
+def neighbor_tables(num_rows, num_cols):
+    """
+    Precomputed moves for a board size, shared by every model of that size.
+    tables[mode][direction][cell] is the flat index the head moves to, or
+    -1 when the move runs into a wall.
+    """
+    key = (num_rows, num_cols)
+    if key not in neighbor_cache:
+        tables = []
+        for mode in Mode:
+            moves = []
+            for dr, dc in ((-1, 0), (1, 0), (0, 1), (0, -1)):   #DirectionState order
+                table = array.array('i', [-1]) * (num_rows * num_cols)
+                for row in range(num_rows):
+                    for col in range(num_cols):
+                        r = row + dr
+                        c = col + dc
+                        if mode == Mode.Wrap:
+                            r %= num_rows
+                            c %= num_cols
+                        if 0 <= r < num_rows and 0 <= c < num_cols:
+                            table[row * num_cols + col] = r * num_cols + c
+                moves.append(table)
+            tables.append(tuple(moves))
+        neighbor_cache[key] = tuple(tables)
+    return neighbor_cache[key]
+
 class SnakeModel:
     """ The model """
 
-    def __init__(self, num_rows, num_cols):
-        """ initialize the snake model """
+    def __init__(self, num_rows, num_cols, seed = None):
+        """ initialize the snake model, seed makes the game reproducible """
         self.num_rows = num_rows
         self.num_cols = num_cols
+        self.rng = rand.Random(seed)
         self.points_earned = 0
         self.mode = Mode.Norm
         self.food_location = ()
-        self.open_cells = []
-        self.snake = collections.deque()
-        self.state = [[CellState.Nothing for c in range(self.num_cols)] 
-                        for r in range(self.num_rows)]
-        
+        self.open_cells = FreeCells(self.num_rows, self.num_cols)
+        self.body = SnakeBody(self.num_cols)
+        #one byte per cell, indexed by row*num_cols+col
+        self.grid = bytearray(self.num_rows * self.num_cols)
+        self.state_view = StateView(self.grid, self.num_rows, self.num_cols)
+        self.neighbors = neighbor_tables(self.num_rows, self.num_cols)
+        #turns waiting to be applied, one per step
+        self.inputs = collections.deque(maxlen = INPUT_QUEUE_SIZE)
+        #number of restarts, so caches keyed on the model can tell games apart
+        self.games = 0
+        self.start_game()
+
+    def start_game(self):
+        """ Place the snake and food and pick the first direction """
         #random food and snake start positions
-        self.col = rand.randrange(0,self.num_cols)
-        self.row = rand.randrange(0,self.num_rows)
+        self.col = self.rng.randrange(0,self.num_cols)
+        self.row = self.rng.randrange(0,self.num_rows)
         self.state = self.make_snake(self.row, self.col, self.state)
         self.snake.append((self.row, self.col))
-        for c in range(self.num_cols):
-            for r in range(self.num_rows):
-                if r != self.row and c != self.col:
-                    self.open_cells.append((r,c))
         self.state = self.make_food(self.state)
         
         #choose direction
         self.direction = None
         self.first_direction()
 
+    def restart(self, seed = None):
+        """
+        Start over in place with the game SnakeModel(num_rows, num_cols,
+        seed) would start, keeping the mode.  Only the cells of the last
+        snake and its food are cleared, and the grid, free cell index and
+        snake ring are reused, so this costs O(cells the last game used)
+        rather than O(board).  grid stays the same object.
+        """
+        grid = self.grid
+        if self.open_cells.low == 0:
+            #the grid was replaced wholesale, the body may not cover it
+            grid[:] = bytes(len(grid))
+        else:
+            for index in self.body.indices():
+                grid[index] = NOTHING
+            if self.food_location:
+                grid[self.food_location[0] * self.num_cols + self.food_location[1]] = NOTHING
+        self.open_cells.clear()
+        self.body.clear()
+        self.rng.seed(seed)
+        self.points_earned = 0
+        self.food_location = ()
+        self.inputs.clear()
+        self.games += 1
+        self.start_game()
+
+    @property
+    def state(self):
+        """ The board as rows of CellState values, backed by grid """
+        return self.state_view
+
+    @state.setter
+    def state(self, rows):
+        if rows is self.state_view:
+            return
+        self.grid[:] = bytes(cell for row in rows for cell in row)
+        self.open_cells.rebuild(self.grid)
+
+    @property
+    def snake(self):
+        """ The snake positions as (row, col), tail first """
+        return self.body
+
+    @snake.setter
+    def snake(self, positions):
+        if positions is not self.body:
+            self.body = SnakeBody(self.num_cols, positions)
+
     def first_direction(self):
         '''Chooses an initial direction based on starting position of snake'''
         distance_edge = 0
@@ -400,29 +1232,54 @@ class SnakeModel:
             self.direction = DirectionState.down
             distance_edge = self.num_rows-self.row
 
+    def turn(self, direction):
+        """ Change direction unless it would reverse the snake into itself,
+        returns whether the turn was taken """
+        if self.direction != OPPOSITE[direction] or len(self.snake) == 1:
+            self.direction = direction
+            return True
+        return False
+
+    def queue_direction(self, direction):
+        """ Queue a turn to be applied on a coming step, one turn per step.
+        Turns that would be no-ops or reversals after the turns already
+        queued are refused; when the queue is full the oldest turn is
+        dropped.  Returns whether the turn was queued. """
+        last = self.inputs[-1] if self.inputs else self.direction
+        if direction == last or (direction == OPPOSITE[last] and len(self.snake) > 1):
+            return False
+        self.inputs.append(direction)
+        return True
+
     def make_snake(self, row, col, state):
         "make square into snake"
-        state[row][col] = CellState.Snake
-        if row != self.row and col != self.col:
-            if (row, col) in self.open_cells:
-                self.open_cells.remove((row, col))
+        index = row * self.num_cols + col
+        self.grid[index] = SNAKE
+        self.open_cells.discard_index(index)
         return state
     
     def make_food(self, state):
         "make square into food"
-        randcell = rand.randrange(len(self.open_cells))
-        row = self.open_cells[randcell][0]
-        col = self.open_cells[randcell][1]
-        self.food_location = (row, col)
-        state[row][col] = CellState.Food
+        self.place_food()
         return state
 
     def make_nothing(self, row, col, state):
         "make square into nothing"
-        state[row][col] = CellState.Nothing
-        self.open_cells.append((row, col))
+        index = row * self.num_cols + col
+        self.grid[index] = NOTHING
+        self.open_cells.add_index(index)
         return state
 
+    def place_food(self):
+        """ Put food on a random empty cell, returns its flat index """
+        if len(self.open_cells) == 0:
+            raise GameOver('full')  #board is full, nowhere left to put food
+        index = self.open_cells.sample_index(self.rng)
+        self.open_cells.discard_index(index)
+        self.grid[index] = FOOD
+        self.food_location = divmod(index, self.num_cols)
+        return index
+
     def reset(self):
         """ Resets all cells to nothing"""
         for r in range(self.num_rows):
@@ -430,61 +1287,271 @@ class SnakeModel:
                 self.make_nothing(r, c, self.state)
 
     def one_step(self):
-        """ Simulates one time step of simulation """
-        # Make array for state in next timestep
-
-        next_state = [[CellState.Nothing for c in range(self.num_cols)] 
-                        for r in range(self.num_rows)]
-        snake_head = self.snake[-1]
-        if self.direction == DirectionState.up and snake_head[0] != 0:
-            r = -1
-            c = 0
-        elif self.direction == DirectionState.down and snake_head[0] != self.num_rows-1:
-            r = 1
-            c = 0
-        elif self.direction == DirectionState.left and snake_head[1] != 0:
-            r = 0
-            c = -1
-        elif self.direction == DirectionState.right and snake_head[1] != self.num_cols-1:
-            r = 0
-            c = 1  
-        elif self.mode == Mode.Wrap: #check for wraparound
-            if self.direction == DirectionState.up and snake_head[0] == 0:
-                r = self.num_rows -1
-                c = 0
-            if self.direction == DirectionState.down and snake_head[0] == self.num_rows - 1:
-                r = -self.num_rows +1
-                c = 0
-            if self.direction == DirectionState.left and snake_head[1] == 0:
-                r = 0
-                c = self.num_cols -1
-            if self.direction == DirectionState.right and snake_head[1] == self.num_cols - 1:
-                r = 0
-                c = -self.num_cols + 1
-            else:
-                pass
+        """ Simulates one time step of simulation, updating state in place.
+        Only the new head cell, the vacated tail cell and the food cell are
+        touched, and the head moves by a single neighbor table lookup, so a
+        step costs the same regardless of board size or snake length.
+        """
+        inputs = self.inputs
+        while inputs:
+            #checked again against the direction actually being applied
+            if self.turn(inputs.popleft()):
+                break
+        body = self.body
+        grid = self.grid
+        head = body.head
+        new_head = self.neighbors[self.mode][self.direction][head]
+        if new_head < 0:
+            raise GameOver('wall')  #you lose
+        target = grid[new_head]
+        if target == SNAKE:
+            raise GameOver('self')         #end game
+
+        grid[new_head] = SNAKE
+        body.push(new_head)
+        new_position = divmod(new_head, self.num_cols)
+        changes = [(new_position[0], new_position[1], SNAKE)]
+        if target == FOOD:
+            self.points_earned +=1
+            self.place_food()
+            changes.append((self.food_location[0], self.food_location[1], FOOD))
         else:
-            raise GameOver  #you lose
+            #move the head forward and free the old tail cell
+            self.open_cells.discard_index(new_head)
+            tail = body.pop_tail()
+            grid[tail] = NOTHING
+            self.open_cells.add_index(tail)
+            tail_row, tail_col = divmod(tail, self.num_cols)
+            changes.append((tail_row, tail_col, NOTHING))
+        old_position = divmod(head, self.num_cols)
+        if body.length > 1:
+            #the old head is now part of the body
+            changes.append((old_position[0], old_position[1], SNAKE))
+        return StepDelta(changes, old_position, new_position)
 
-        if self.state[snake_head[0]+r][snake_head[1]+c] == CellState.Snake:
-            raise GameOver         #end game
+    def clone(self):
+        """
+        An independent copy of the model, RNG state included, so the copy
+        plays on exactly as the original would.  The flat arrays are copied
+        whole and the neighbor tables are shared, which makes this far
+        cheaper than copy.deepcopy.
+        """
+        model = SnakeModel.__new__(SnakeModel)
+        model.num_rows = self.num_rows
+        model.num_cols = self.num_cols
+        model.rng = rand.Random()
+        model.rng.setstate(self.rng.getstate())
+        model.points_earned = self.points_earned
+        model.mode = self.mode
+        model.food_location = self.food_location
+        model.open_cells = self.open_cells.copy()
+        model.body = self.body.copy()
+        model.grid = bytearray(self.grid)
+        model.state_view = StateView(model.grid, self.num_rows, self.num_cols)
+        model.neighbors = self.neighbors
+        model.row = self.row
+        model.col = self.col
+        model.direction = self.direction
+        model.inputs = collections.deque(self.inputs, maxlen = INPUT_QUEUE_SIZE)
+        model.games = self.games
+        return model
 
-        if self.state[snake_head[0]+r][snake_head[1]+c] == CellState.Food:
-            next_state = self.make_snake(snake_head[0]+r, snake_head[1]+c, next_state)
-            self.snake.append((snake_head[0]+r, snake_head[1]+c)) 
-            next_state = self.make_food(next_state)
-            self.points_earned +=1
+    def restore(self, snapshot):
+        """ Return to the position of snapshot, a clone of a model of the
+        same size.  grid is updated in place, so views of it stay valid. """
+        self.rng.setstate(snapshot.rng.getstate())
+        self.points_earned = snapshot.points_earned
+        self.mode = snapshot.mode
+        self.food_location = snapshot.food_location
+        self.open_cells = snapshot.open_cells.copy()
+        self.body = snapshot.body.copy()
+        self.grid[:] = snapshot.grid
+        self.direction = snapshot.direction
+        self.inputs.clear()
+        self.inputs.extend(snapshot.inputs)
+
+    def make_step(self):
+        """
+        one_step that can be taken back with unmake_step, for lookahead
+        search.  Returns the undo record; if the step ends the game
+        GameOver is raised and the model is left as it was.  The RNG state
+        is only saved on steps that eat, as only placing food draws from it.
+        """
+        saved = (self.direction, tuple(self.inputs), self.points_earned, self.food_location)
+        inputs = self.inputs
+        while inputs:
+            if self.turn(inputs.popleft()):
+                break
+        body = self.body
+        grid = self.grid
+        open_cells = self.open_cells
+        new_head = self.neighbors[self.mode][self.direction][body.head]
+        target = grid[new_head] if new_head >= 0 else SNAKE
+        if new_head < 0 or target == SNAKE or (target == FOOD and len(open_cells) == 0):
+            self.direction = saved[0]
+            inputs.clear()
+            inputs.extend(saved[1])
+            raise GameOver('wall' if new_head < 0 else 'self' if target == SNAKE else 'full')
+        grid[new_head] = SNAKE
+        body.push(new_head)
+        if target == FOOD:
+            rng_state = self.rng.getstate()
+            self.points_earned += 1
+            #place_food swaps the last free cell into the slot of the food
+            last = open_cells.cells[-1]
+            food = self.place_food()
+            slot = len(open_cells) if last == food else open_cells.position[last]
+            return (saved, new_head, FOOD, food, slot, rng_state)
+        slot = open_cells.position[new_head]
+        open_cells.discard_index(new_head)
+        tail = body.pop_tail()
+        grid[tail] = NOTHING
+        open_cells.add_index(tail)
+        return (saved, new_head, NOTHING, tail, slot, None)
+
+    def unmake_step(self, undo):
+        """ Take back the step that returned undo, the last one made """
+        saved, new_head, target, cell, slot, rng_state = undo
+        grid = self.grid
+        body = self.body
+        open_cells = self.open_cells
+        if target == FOOD:
+            #cell is the food placed by the step
+            grid[cell] = NOTHING
+            open_cells.insert_index(cell, slot)
+            self.rng.setstate(rng_state)
+        else:
+            #cell is the tail freed by the step, added last to open_cells
+            open_cells.discard_index(cell)
+            grid[cell] = SNAKE
+            body.push_tail(cell)
+            open_cells.insert_index(new_head, slot)
+        body.pop_head()
+        grid[new_head] = target
+        self.direction, inputs, self.points_earned, self.food_location = saved
+        self.inputs.clear()
+        self.inputs.extend(inputs)
 
-        if self.state[snake_head[0]+r][snake_head[1]+c] == CellState.Nothing:
-            next_state = self.make_snake(snake_head[0]+r, snake_head[1]+c, next_state)
-            next_state = self.make_nothing(self.snake[0][0], self.snake[0][1], next_state)
-            self.snake.append((snake_head[0]+r, snake_head[1]+c))
-            a = self.snake.popleft()
-            next_state[self.food_location[0]][self.food_location[1]] = CellState.Food
+class TickScheduler:
+    """
+    Fixed timestep clock for the game loop.
+
+    Ticks are due at absolute deadlines start + n * period on a monotonic
+    clock, so time spent stepping and painting does not push later ticks
+    back.  When the loop falls behind, all missed ticks are reported due at
+    once and the lateness of each wakeup is kept as tick jitter.
+
+    Beyond max_catch_up missed ticks the rest are dropped, not simulated,
+    and the schedule is restarted from now.  This is deliberate: after a
+    long stall (the window dragged, the machine suspended) simulating the
+    whole backlog would take long enough to fall behind again, and the
+    snake would cross the board in one frame anyway.
+    """
 
-        for i in self.snake:        #updates snake squares into next state
-            next_state = self.make_snake(i[0], i[1], next_state)
-        self.state = next_state
+    def __init__(self, step_time_millis, clock = time.monotonic, max_catch_up = 10):
+        self.period = step_time_millis / 1000
+        self.clock = clock
+        self.max_catch_up = max_catch_up
+        self.next_deadline = None
+        self.jitter = collections.deque(maxlen = 256)
+        self.dropped_ticks = 0
+
+    def start(self):
+        """ Start the schedule, the first tick is due one period from now """
+        self.next_deadline = self.clock() + self.period
+
+    def set_period(self, step_time_millis):
+        """ Change the step time, keeping the next deadline as the anchor.
+        Speeding up never moves the deadline into the past, so the ticks of
+        the new period that fit in the old wait are not all due at once. """
+        period = step_time_millis / 1000
+        if self.next_deadline is not None:
+            self.next_deadline = max(self.next_deadline + period - self.period,
+                                     self.clock())
+        self.period = period
+
+    def ticks_due(self):
+        """ Number of ticks whose deadline has passed, advancing the schedule """
+        now = self.clock()
+        if self.next_deadline is None or now < self.next_deadline:
+            return 0
+        late = now - self.next_deadline
+        self.jitter.append(late)
+        ticks = int(late // self.period) + 1
+        if ticks > self.max_catch_up:
+            #too far behind to catch up, drop the backlog and start over
+            self.dropped_ticks += ticks - self.max_catch_up
+            ticks = self.max_catch_up
+            self.next_deadline = now + self.period
+        else:
+            self.next_deadline += ticks * self.period
+        return ticks
+
+    def delay_millis(self):
+        """ Milliseconds until the next deadline, rounded up """
+        if self.next_deadline is None:
+            return int(self.period * 1000)
+        #the small allowance keeps float noise from adding a whole millisecond
+        return max(0, math.ceil((self.next_deadline - self.clock()) * 1000 - 1e-6))
+
+    def jitter_stats(self):
+        """ Mean and max lateness of recent wakeups, in milliseconds """
+        if not self.jitter:
+            return (0.0, 0.0)
+        return (1000 * sum(self.jitter) / len(self.jitter), 1000 * max(self.jitter))
+
+class SnakeEngine:
+    """
+    Headless driver for a SnakeModel.  Steps the game, takes direction
+    changes and exposes the board without ever importing tkinter.
+    """
+
+    def __init__(self, num_rows = 30, num_cols = 30, mode = None, seed = None):
+        """ Start a new game on a num_rows x num_cols board """
+        self.model = SnakeModel(num_rows, num_cols, seed)
+        if mode is not None:
+            self.model.mode = mode
+        self.game_over = False
+        self.cause = None
+        self.steps = 0
+
+    def restart(self, seed = None, mode = None):
+        """ Start a new game on the same board, reusing the model """
+        self.model.restart(seed)
+        if mode is not None:
+            self.model.mode = mode
+        self.game_over = False
+        self.cause = None
+        self.steps = 0
+
+    def set_direction(self, direction):
+        """ Queue a turn for the next step, returns False if it was refused """
+        return self.model.queue_direction(direction)
+
+    def step(self):
+        """ Advance one step, returns the StepDelta or None once the game is over """
+        if self.game_over:
+            return None
+        try:
+            delta = self.model.one_step()
+        except GameOver as end:
+            self.game_over = True
+            self.cause = str(end)
+            return None
+        self.steps += 1
+        return delta
+
+    @property
+    def state(self):
+        return self.model.state
+
+    @property
+    def snake(self):
+        return self.model.snake
+
+    @property
+    def score(self):
+        return self.model.points_earned
 
 class CellState(IntEnum):
     """ 
@@ -495,12 +1562,26 @@ class CellState(IntEnum):
     Snake = 1
     Food = 2
 
+#plain int copies of the cell states for the stepping code, where the enum
+#attribute lookups cost more than the rest of the work
+NOTHING = int(CellState.Nothing)
+SNAKE = int(CellState.Snake)
+FOOD = int(CellState.Food)
+
+#turns a player can get in ahead of the snake
+INPUT_QUEUE_SIZE = 3
+
 class DirectionState(IntEnum):
     up = 0
     down = 1 
     right = 2
     left = 3
 
+OPPOSITE = {DirectionState.up: DirectionState.down,
+            DirectionState.down: DirectionState.up,
+            DirectionState.right: DirectionState.left,
+            DirectionState.left: DirectionState.right}
+
 class Mode(IntEnum):
     Norm = 0
     Wrap = 1
@@ -586,8 +1667,352 @@ class SnakeModelTest(unittest.TestCase):
                                   [0,0,0,0,0]]
         self.model.one_step()
         self.assertEqual(self.model.state, self.correct_next_state)    
+
+class SnakeModelIncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.model = SnakeModel(5, 5)
+        self.model.snake = collections.deque([(2,1), (2,2)])
+        self.model.state = [[0,0,0,0,0],
+                            [0,0,0,0,2],
+                            [0,1,1,0,0],
+                            [0,0,0,0,0],
+                            [0,0,0,0,0]]
+        self.model.food_location = (1,4)
+
+    def test_one_step_in_place(self):
+        # The step mutates the existing grid rather than building a new one
+        state = self.model.state
+        self.model.direction = DirectionState.right
+        self.model.one_step()
+        self.assertIs(self.model.state, state)
+        self.assertEqual(self.model.state, [[0,0,0,0,0],
+                                            [0,0,0,0,2],
+                                            [0,0,1,1,0],
+                                            [0,0,0,0,0],
+                                            [0,0,0,0,0]])
+        self.assertEqual(list(self.model.snake), [(2,2), (2,3)])
+
+    def test_one_step_delta(self):
+        # The change set lists exactly the cells that differ after the step
+        before = [row[:] for row in self.model.state]
+        self.model.direction = DirectionState.up
+        delta = self.model.one_step()
+        self.assertEqual(delta.old_head, (2,2))
+        self.assertEqual(delta.new_head, (1,2))
+        for row, col, cell in delta.changes:
+            self.assertEqual(self.model.state[row][col], cell)
+        changed = {(r, c) for r in range(5) for c in range(5)
+                   if self.model.state[r][c] != before[r][c]}
+        self.assertTrue(changed <= {(row, col) for row, col, cell in delta.changes})
+
+    def test_one_step_into_self(self):
+        self.model.direction = DirectionState.left
+        self.assertRaises(GameOver, self.model.one_step)
+
+class FreeCellsTest(unittest.TestCase):
+    def test_matches_empty_cells(self):
+        # The index always holds exactly the cells that are Nothing
+        model = SnakeModel(6, 6)
+        model.mode = Mode.Wrap
+        for i in range(200):
+            try:
+                model.one_step()
+            except GameOver:
+                break
+            empty = {(r, c) for r in range(6) for c in range(6)
+                     if model.state[r][c] == CellState.Nothing}
+            self.assertEqual(set(model.open_cells), empty)
+            self.assertEqual(len(model.open_cells), len(empty))
+
+    def test_add_discard(self):
+        cells = FreeCells(2, 2)
+        cells.discard(0, 1)
+        cells.discard(0, 1)
+        self.assertNotIn((0, 1), cells)
+        self.assertEqual(len(cells), 3)
+        cells.add(0, 1)
+        cells.add(0, 1)
+        self.assertIn((0, 1), cells)
+        self.assertEqual(sorted(cells), [(0,0), (0,1), (1,0), (1,1)])
+
+class CompactBoardTest(unittest.TestCase):
+    def test_state_view(self):
+        # state reads and writes through to the flat grid
+        model = SnakeModel(3, 4)
+        model.state = [[0,0,0,0],
+                       [0,1,0,2],
+                       [0,0,0,0]]
+        self.assertEqual(model.grid, bytearray([0,0,0,0, 0,1,0,2, 0,0,0,0]))
+        self.assertEqual(model.state[1][3], CellState.Food)
+        self.assertEqual(len(model.open_cells), 10)
+        model.state[2][0] = CellState.Snake
+        self.assertEqual(model.grid[8], CellState.Snake)
+
+    def test_body_ring_grows(self):
+        body = SnakeBody(10)
+        for i in range(20):
+            body.push(i)
+            if i % 3 == 0:
+                body.pop_tail()
+        self.assertEqual(body.indices(), list(range(7, 20)))
+        self.assertEqual(body[-1], (1, 9))
+        self.assertEqual(body[0], (0, 7))
+
+    def test_neighbor_tables(self):
+        norm, wrap = neighbor_tables(3, 4)
+        self.assertEqual(norm[DirectionState.up][1], -1)
+        self.assertEqual(wrap[DirectionState.up][1], 9)
+        self.assertEqual(wrap[DirectionState.right][7], 4)
+        self.assertEqual(norm[DirectionState.down][5], 9)
+
+class InputQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.model = SnakeModel(6, 6)
+        self.model.state = [[0,0,0,0,0,0],
+                            [0,0,0,0,0,0],
+                            [0,0,0,0,0,0],
+                            [1,1,1,0,0,0],
+                            [0,0,0,0,0,0],
+                            [0,0,0,0,0,2]]
+        self.model.snake = [(3,0), (3,1), (3,2)]
+        self.model.direction = DirectionState.right
+
+    def test_quick_turns(self):
+        # "up then left" inside one tick turns twice instead of reversing
+        self.assertTrue(self.model.queue_direction(DirectionState.up))
+        self.assertTrue(self.model.queue_direction(DirectionState.left))
+        self.model.one_step()
+        self.assertEqual(self.model.snake[-1], (2,2))
+        self.model.one_step()
+        self.assertEqual(self.model.snake[-1], (2,1))
+
+    def test_refused(self):
+        self.assertFalse(self.model.queue_direction(DirectionState.left))
+        self.assertFalse(self.model.queue_direction(DirectionState.right))
+        self.assertTrue(self.model.queue_direction(DirectionState.down))
+        self.assertFalse(self.model.queue_direction(DirectionState.up))
+
+    def test_full_queue_drops_oldest(self):
+        for direction in (DirectionState.up, DirectionState.left,
+                          DirectionState.down, DirectionState.right):
+            self.assertTrue(self.model.queue_direction(direction))
+        self.assertEqual(list(self.model.inputs), [DirectionState.left,
+                         DirectionState.down, DirectionState.right])
+        #left would reverse the snake now, so it is skipped for down
+        self.model.one_step()
+        self.assertEqual(self.model.direction, DirectionState.down)
+
+class TickSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.scheduler = TickScheduler(100, clock = lambda: self.now, max_catch_up = 5)
+        self.scheduler.start()
+
+    def test_deadlines_do_not_drift(self):
+        # Waking a little late every time does not push the schedule back
+        for i in range(1, 11):
+            self.now = i * 0.1 + 0.03
+            self.assertEqual(self.scheduler.ticks_due(), 1)
+            self.assertEqual(self.scheduler.delay_millis(), 70)
+        self.assertAlmostEqual(self.scheduler.jitter_stats()[1], 30)
+
+    def test_catch_up(self):
+        self.now = 0.05
+        self.assertEqual(self.scheduler.ticks_due(), 0)
+        self.now = 0.35
+        self.assertEqual(self.scheduler.ticks_due(), 3)
+        self.now = 2.0
+        self.assertEqual(self.scheduler.ticks_due(), 5)
+        self.assertEqual(self.scheduler.dropped_ticks, 12)
+        self.assertEqual(self.scheduler.delay_millis(), 100)
+
+    def test_speed_up(self):
+        # Speeding up part way through a wait makes one tick due, not a burst
+        scheduler = TickScheduler(500, clock = lambda: self.now)
+        scheduler.start()
+        self.now = 0.5
+        self.assertEqual(scheduler.ticks_due(), 1)
+        self.now = 0.8
+        scheduler.set_period(50)
+        self.assertEqual(scheduler.delay_millis(), 0)
+        self.assertEqual(scheduler.ticks_due(), 1)
+        self.assertEqual(scheduler.delay_millis(), 50)
+        # Slowing down still keeps the old deadline as the anchor
+        scheduler.set_period(100)
+        self.assertEqual(scheduler.delay_millis(), 100)
+
+class SnakeEngineTest(unittest.TestCase):
+    def test_no_tkinter(self):
+        # The model and engine must be usable without loading tkinter
+        import subprocess, sys
+        code = ("import sys, Snake; e = Snake.SnakeEngine(10, 10); e.step(); "
+                "print('tkinter' in sys.modules)")
+        out = subprocess.run([sys.executable, '-c', code], capture_output = True,
+                             text = True, cwd = os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out.stdout.strip(), 'False')
+
+    def test_play_to_end(self):
+        engine = SnakeEngine(8, 8, Mode.Norm)
+        while engine.step() is not None:
+            pass
+        self.assertTrue(engine.game_over)
+        self.assertIsNone(engine.step())
+
+    def test_no_reversal(self):
+        engine = SnakeEngine(8, 8)
+        engine.model.snake = collections.deque([(4,3), (4,4)])
+        engine.model.direction = DirectionState.right
+        self.assertFalse(engine.set_direction(DirectionState.left))
+        self.assertTrue(engine.set_direction(DirectionState.up))
      
+class SnapshotTest(unittest.TestCase):
+    def fingerprint(self, model):
+        return (bytes(model.grid), model.body.indices(), model.open_cells.cells.tobytes(),
+                model.open_cells.position.tobytes(), model.rng.getstate(),
+                model.direction, tuple(model.inputs), model.points_earned,
+                model.food_location)
+
+    def play(self, model, rng, steps):
+        for i in range(steps):
+            model.queue_direction(DirectionState(rng.randrange(4)))
+            try:
+                model.one_step()
+            except GameOver:
+                return
+
+    def test_clone(self):
+        model = SnakeModel(8, 8, 3)
+        model.mode = Mode.Wrap
+        self.play(model, rand.Random(0), 200)
+        before = self.fingerprint(model)
+        snapshot = model.clone()
+        branch = model.clone()
+        self.assertEqual(self.fingerprint(branch), before)
+        self.play(branch, rand.Random(1), 200)
+        self.assertEqual(self.fingerprint(model), before)
+        # Restoring keeps the grid object and replays the same future
+        grid = model.grid
+        self.play(model, rand.Random(2), 200)
+        model.restore(snapshot)
+        self.assertIs(model.grid, grid)
+        self.assertEqual(self.fingerprint(model), before)
+        self.play(model, rand.Random(1), 200)
+        self.assertEqual(self.fingerprint(model), self.fingerprint(branch))
+
+    def test_make_unmake(self):
+        def search(model, depth):
+            if depth == 0:
+                return 1
+            nodes = 0
+            for direction in DirectionState:
+                before = self.fingerprint(model)
+                model.queue_direction(direction)
+                queued = self.fingerprint(model)
+                expected = model.clone()
+                try:
+                    undo = model.make_step()
+                except GameOver:
+                    self.assertEqual(self.fingerprint(model), queued)
+                    model.inputs.clear()
+                    continue
+                #a made step is the same as one_step
+                expected.one_step()
+                self.assertEqual(self.fingerprint(model), self.fingerprint(expected))
+                nodes += search(model, depth - 1)
+                model.unmake_step(undo)
+                model.inputs.clear()
+                self.assertEqual(self.fingerprint(model), before)
+            return nodes
+        rng = rand.Random(5)
+        for seed in range(4):
+            model = SnakeModel(6, 6, seed)
+            model.mode = Mode(seed % 2)
+            for i in range(5):
+                self.play(model, rng, 15)
+                self.assertGreater(search(model, 3), 0)
+
+    def test_restart(self):
+        # A restarted model is the same as a new one with that seed
+        rng = rand.Random(7)
+        model = SnakeModel(9, 7, 0)
+        grid = model.grid
+        for seed in range(1, 40):
+            model.mode = Mode(seed % 2)
+            self.play(model, rng, rng.randrange(300))
+            if seed % 5 == 0:
+                model.restore(model.clone())
+                try:
+                    model.unmake_step(model.make_step())
+                except GameOver:
+                    pass
+            if seed % 7 == 0:
+                model.state = [[0] * 7] * 8 + [[0, 0, 1, 1, 0, 0, 2]]
+                model.snake = [(8, 2), (8, 3)]
+            model.restart(seed)
+            self.assertIs(model.grid, grid)
+            fresh = SnakeModel(9, 7, seed)
+            fresh.mode = model.mode
+            self.assertEqual(self.fingerprint(model), self.fingerprint(fresh))
+            self.assertLessEqual(len(model.open_cells.footprint), 2)
+            self.play(model, rand.Random(seed), 100)
+            self.play(fresh, rand.Random(seed), 100)
+            self.assertEqual(self.fingerprint(model), self.fingerprint(fresh))
+
+class CameraTest(unittest.TestCase):
+    def test_follow(self):
+        camera = Camera(1000, 1000, 40, 30)
+        self.assertFalse(camera.follow(5, 5))
+        self.assertTrue(camera.contains(39, 29))
+        self.assertFalse(camera.contains(40, 0))
+        # Nearing the bottom edge recenters the window on the cell
+        self.assertTrue(camera.follow(35, 5))
+        self.assertEqual((camera.top, camera.left), (15, 0))
+        # The window never leaves the board
+        self.assertTrue(camera.follow(999, 999))
+        self.assertEqual((camera.top, camera.left), (960, 970))
+        for row, col in ((0, 0), (500, 3), (17, 998)):
+            camera.follow(row, col)
+            self.assertTrue(camera.contains(row, col))
+
+    def test_small_board(self):
+        camera = Camera(10, 10, 40, 40)
+        self.assertEqual((camera.view_rows, camera.view_cols), (10, 10))
+        self.assertFalse(camera.follow(9, 9))
+
 if __name__ == "__main__":
     #play of the game
-    snake_game = snake()
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Greedy Snake')
+    parser.add_argument('--rows', type = int, default = 30)
+    parser.add_argument('--cols', type = int, default = 30)
+    parser.add_argument('--view', choices = ['frames', 'canvas', 'viewport', 'curses'],
+                        help = 'frames suits small boards, viewport very large ones')
+    parser.add_argument('--cell-size', type = int, default = 20)
+    parser.add_argument('--no-minimap', action = 'store_true')
+    parser.add_argument('--replay-dir')
+    parser.add_argument('--scores', help = 'leaderboard database for finished games')
+    parser.add_argument('--profile', metavar = 'PATH',
+                        help = 'time each tick, writing the summary to PATH (F12 prints it)')
+    parser.add_argument('--profile-interval', type = float, default = 10.0, metavar = 'S',
+                        help = 'seconds between profile writes')
+    args = parser.parse_args()
+    view = args.view
+    if view is None:
+        view = 'frames' if args.rows * args.cols <= 2500 else 'viewport'
+    if view == 'curses':
+        import SnakeCurses
+        view_class = SnakeCurses.CursesSnakeView
+    elif view == 'viewport':
+        view_class = lambda rows, cols: ViewportSnakeView(rows, cols, args.cell_size,
+                                                          minimap = not args.no_minimap)
+    elif view == 'canvas':
+        view_class = lambda rows, cols: CanvasSnakeView(rows, cols, args.cell_size)
+    else:
+        view_class = lambda rows, cols: SnakeView(rows, cols, args.cell_size)
+    snake_game = snake(view_class, replay_dir = args.replay_dir,
+                       num_rows = args.rows, num_cols = args.cols,
+                       scores_path = args.scores, mainloop = False)
+    if args.profile is not None:
+        snake_game.enable_profiling(args.profile, args.profile_interval)
+    snake_game.view.window.mainloop()
     #unittest.main()
@@ -0,0 +1,336 @@
+"""
+Module: SnakeArena
+
+Description:
+Many snakes sharing one board.  Every snake moves at once each tick, there
+can be several food items, and collisions are settled by these rules:
+    - a head leaving the board in Mode.Norm dies ('wall')
+    - heads meeting in one cell, or two heads swapping cells, is a
+      head-to-head: the longer snake survives, equal lengths both die
+      ('head')
+    - a head entering a cell held by any snake dies ('body', or 'self' for
+      its own), except a tail cell that is being vacated this tick
+    - dead snakes are cleared from the board at the end of the tick
+
+The board keeps an occupancy index, owner, giving the snake id holding
+each cell (EMPTY or FOOD_OWNER otherwise), plus a FreeCells index of the
+empty cells.  A tick looks up one cell per snake and places food in O(1),
+so it costs O(number of snakes) plus the length of any snake that died,
+whatever the board size.
+"""
+import array
+import collections
+import random as rand
+import unittest
+
+from Snake import (FreeCells, SnakeBody, neighbor_tables, DirectionState, Mode,
+                   OPPOSITE, INPUT_QUEUE_SIZE, NOTHING, SNAKE, FOOD)
+
+EMPTY = -1
+FOOD_OWNER = -2
+
+class ArenaSnake:
+    """ One snake of an arena """
+
+    def __init__(self, id, num_cols, head, direction):
+        self.id = id
+        self.body = SnakeBody(num_cols)
+        self.body.push(head)
+        self.direction = direction
+        self.inputs = collections.deque(maxlen = INPUT_QUEUE_SIZE)
+        self.alive = True
+        self.cause = None
+        self.score = 0
+
+    def __len__(self):
+        return len(self.body)
+
+    def queue_direction(self, direction):
+        """ Same rules as SnakeModel.queue_direction """
+        last = self.inputs[-1] if self.inputs else self.direction
+        if direction == last or (direction == OPPOSITE[last] and len(self.body) > 1):
+            return False
+        self.inputs.append(direction)
+        return True
+
+    def next_direction(self):
+        """ Apply the first queued turn that is still legal """
+        inputs = self.inputs
+        while inputs:
+            direction = inputs.popleft()
+            if direction != OPPOSITE[self.direction] or len(self.body) == 1:
+                self.direction = direction
+                break
+        return self.direction
+
+ArenaStep = collections.namedtuple('ArenaStep', ['changes', 'deaths', 'eaten'])
+ArenaStep.__doc__ = """ What one tick did: changed cells as (row, col, CellState),
+snakes that died as (id, cause), and ids of the snakes that ate """
+
+class SnakeArena:
+    """ A num_rows x num_cols board shared by any number of snakes """
+
+    def __init__(self, num_rows, num_cols, num_food = 1, mode = Mode.Norm, seed = None):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.num_food = num_food
+        self.mode = mode
+        self.rng = rand.Random(seed)
+        self.grid = bytearray(num_rows * num_cols)
+        self.owner = array.array('i', [EMPTY]) * (num_rows * num_cols)
+        self.open_cells = FreeCells(num_rows, num_cols)
+        self.neighbors = neighbor_tables(num_rows, num_cols)
+        self.snakes = {}
+        self.alive = []
+        self.food = set()
+        self.next_id = 0
+        self.ticks = 0
+        self.place_food()
+
+    def add_snake(self, head = None, direction = None):
+        """ Add a one cell snake on head, a flat cell index, or on a random
+        empty cell.  Returns its id. """
+        if head is None:
+            if len(self.open_cells) == 0:
+                raise ValueError('no room for another snake')
+            head = self.open_cells.sample_index(self.rng)
+        elif self.owner[head] != EMPTY:
+            raise ValueError('cell %d is taken' % head)
+        if direction is None:
+            direction = DirectionState(self.rng.randrange(4))
+        snake = ArenaSnake(self.next_id, self.num_cols, head, direction)
+        self.next_id += 1
+        self.snakes[snake.id] = snake
+        self.alive.append(snake)
+        self.take(head, snake.id)
+        return snake.id
+
+    def take(self, cell, id):
+        self.owner[cell] = id
+        self.grid[cell] = SNAKE
+        self.open_cells.discard_index(cell)
+
+    def free(self, cell):
+        self.owner[cell] = EMPTY
+        self.grid[cell] = NOTHING
+        self.open_cells.add_index(cell)
+
+    def set_direction(self, id, direction):
+        """ Queue a turn for snake id, returns False if it was refused """
+        return self.snakes[id].queue_direction(direction)
+
+    def place_food(self):
+        """ Top the food back up to num_food items, returns the cells used """
+        placed = []
+        while len(self.food) < self.num_food and len(self.open_cells):
+            cell = self.open_cells.sample_index(self.rng)
+            self.open_cells.discard_index(cell)
+            self.owner[cell] = FOOD_OWNER
+            self.grid[cell] = FOOD
+            self.food.add(cell)
+            placed.append(cell)
+        return placed
+
+    def safe_directions(self, id):
+        """ Directions that do not run snake id into a wall or a body next tick,
+        ignoring where the other heads go """
+        snake = self.snakes[id]
+        moves = self.neighbors[self.mode]
+        owner = self.owner
+        safe = []
+        for direction in DirectionState:
+            cell = moves[direction][snake.body.head]
+            if cell >= 0 and owner[cell] < 0:
+                safe.append(direction)
+        return safe
+
+    def kill(self, snake, cause, deaths):
+        if snake.alive:
+            snake.alive = False
+            snake.cause = cause
+            deaths.append((snake.id, cause))
+
+    def step(self):
+        """ Move every live snake at once, returns an ArenaStep """
+        moves = self.neighbors[self.mode]
+        owner = self.owner
+        deaths = []
+        #where every head is going, and how many heads go to each cell
+        targets = []
+        target_of = {}
+        arrivals = {}
+        old_heads = {}
+        for snake in self.alive:
+            cell = moves[snake.next_direction()][snake.body.head]
+            targets.append(cell)
+            target_of[snake.id] = cell
+            old_heads[snake.body.head] = snake
+            if cell < 0:
+                self.kill(snake, 'wall', deaths)
+            else:
+                arrivals.setdefault(cell, []).append(snake)
+        #tails move on unless the snake eats this tick
+        eating = {snake.id for snake, cell in zip(self.alive, targets)
+                  if cell >= 0 and owner[cell] == FOOD_OWNER}
+        vacated = {snake.body.ring[snake.body.start] for snake in self.alive
+                   if snake.id not in eating}
+        for snake, cell in zip(self.alive, targets):
+            if cell < 0:
+                continue
+            #one contest per cell: every head arriving there, plus the snake
+            #leaving it if it swaps places with one of them
+            rivals = arrivals[cell]
+            other = old_heads.get(cell)
+            swapped = None
+            if other is not None and old_heads.get(target_of[other.id]) in rivals:
+                rivals = rivals + [other]
+                swapped = other.id
+            if len(rivals) > 1:
+                longest = max(len(rival) for rival in rivals)
+                if len(snake) < longest or sum(len(rival) == longest for rival in rivals) > 1:
+                    self.kill(snake, 'head', deaths)
+                    continue
+            #the winner of a head-to-head still dies on a body, except on the
+            #old head of the snake it swapped with, which died
+            holder = owner[cell]
+            if holder >= 0 and cell not in vacated and holder != swapped:
+                self.kill(snake, 'self' if holder == snake.id else 'body', deaths)
+
+        changes = []
+        num_cols = self.num_cols
+        survivors = []
+        for snake, cell in zip(self.alive, targets):
+            if snake.alive:
+                survivors.append((snake, cell))
+                if snake.id not in eating:
+                    tail = snake.body.pop_tail()
+                    if owner[tail] == snake.id:
+                        self.free(tail)
+                        changes.append(divmod(tail, num_cols) + (NOTHING,))
+        for id, cause in deaths:
+            for cell in self.snakes[id].body.indices():
+                if owner[cell] == id:
+                    self.free(cell)
+                    changes.append(divmod(cell, num_cols) + (NOTHING,))
+        eaten = []
+        for snake, cell in survivors:
+            if owner[cell] == FOOD_OWNER:
+                self.food.discard(cell)
+                snake.score += 1
+                eaten.append(snake.id)
+            self.take(cell, snake.id)
+            snake.body.push(cell)
+            changes.append(divmod(cell, num_cols) + (SNAKE,))
+        for cell in self.place_food():
+            changes.append(divmod(cell, num_cols) + (FOOD,))
+        self.alive = [snake for snake, cell in survivors]
+        self.ticks += 1
+        return ArenaStep(changes, deaths, eaten)
+
+class SnakeArenaTest(unittest.TestCase):
+    def check_index(self, arena):
+        # owner, grid and open_cells always agree with the snakes and food
+        expected = array.array('i', [EMPTY]) * len(arena.owner)
+        for snake in arena.alive:
+            for cell in snake.body.indices():
+                self.assertEqual(expected[cell], EMPTY)
+                expected[cell] = snake.id
+        for cell in arena.food:
+            expected[cell] = FOOD_OWNER
+        self.assertEqual(arena.owner, expected)
+        for cell, holder in enumerate(expected):
+            state = NOTHING if holder == EMPTY else FOOD if holder == FOOD_OWNER else SNAKE
+            self.assertEqual(arena.grid[cell], state)
+        self.assertEqual(sorted(arena.open_cells.cells),
+                         [cell for cell, holder in enumerate(expected) if holder == EMPTY])
+
+    def test_head_to_head(self):
+        arena = SnakeArena(5, 5, num_food = 0, seed = 0)
+        a = arena.add_snake(2 * 5 + 0, DirectionState.right)
+        b = arena.add_snake(2 * 5 + 4, DirectionState.left)
+        arena.step()
+        result = arena.step()
+        self.assertEqual(sorted(result.deaths), [(a, 'head'), (b, 'head')])
+        self.assertEqual(arena.alive, [])
+        self.assertEqual(bytes(arena.grid), bytes(25))
+
+    def test_longer_wins_and_body(self):
+        arena = SnakeArena(5, 5, num_food = 0, seed = 0)
+        a = arena.add_snake(0, DirectionState.right)
+        arena.snakes[a].body.push(1)
+        arena.take(1, a)
+        b = arena.add_snake(3, DirectionState.left)
+        result = arena.step()
+        self.assertEqual(result.deaths, [(b, 'head')])
+        c = arena.add_snake(7, DirectionState.up)
+        result = arena.step()
+        self.assertEqual(result.deaths, [(c, 'body')])
+        self.check_index(arena)
+
+    def test_head_to_head_on_body(self):
+        # Heads meeting on a third snake's body both die, the longer on the body
+        arena = SnakeArena(5, 5, num_food = 0, seed = 0)
+        b = arena.add_snake(2, DirectionState.down)
+        for cell in (7, 12):
+            arena.snakes[b].body.push(cell)
+            arena.take(cell, b)
+        a = arena.add_snake(5, DirectionState.right)
+        arena.snakes[a].body.push(6)
+        arena.take(6, a)
+        c = arena.add_snake(8, DirectionState.left)
+        result = arena.step()
+        self.assertEqual(sorted(result.deaths), sorted([(a, 'body'), (c, 'head')]))
+        self.assertEqual(arena.owner[7], b)
+        self.check_index(arena)
+
+    def test_swap_and_meet(self):
+        # A swap and a meeting on the same cell are one contest
+        arena = SnakeArena(3, 3, num_food = 0, seed = 0)
+        a = arena.add_snake(0, DirectionState.right)
+        arena.snakes[a].body.push(3)
+        arena.take(3, a)
+        b = arena.add_snake(4, DirectionState.left)
+        c = arena.add_snake(7, DirectionState.left)
+        for cell in (8, 5):
+            arena.snakes[c].body.push(cell)
+            arena.take(cell, c)
+        result = arena.step()
+        self.assertEqual(sorted(result.deaths), sorted([(a, 'head'), (b, 'head')]))
+        self.assertEqual(arena.snakes[c].body.indices(), [8, 5, 4])
+        self.check_index(arena)
+
+    def test_chase_tail(self):
+        # A head may follow a tail into the cell it leaves
+        arena = SnakeArena(1, 6, num_food = 0, mode = Mode.Wrap, seed = 0)
+        a = arena.add_snake(1, DirectionState.right)
+        b = arena.add_snake(0, DirectionState.right)
+        for i in range(12):
+            self.assertEqual(arena.step().deaths, [])
+        self.check_index(arena)
+
+    def test_many_snakes(self):
+        for mode in Mode:
+            arena = SnakeArena(40, 40, num_food = 20, mode = mode, seed = 1)
+            rng = rand.Random(2)
+            for i in range(30):
+                arena.add_snake()
+            eaten = 0
+            for tick in range(300):
+                for snake in arena.alive:
+                    safe = arena.safe_directions(snake.id)
+                    if safe and (rng.random() < 0.2 or snake.direction not in safe):
+                        arena.set_direction(snake.id, rng.choice(safe))
+                result = arena.step()
+                eaten += len(result.eaten)
+                self.assertEqual(len(arena.food), 20)
+                if tick % 50 == 0:
+                    self.check_index(arena)
+                if len(arena.alive) < 10:
+                    arena.add_snake()
+            self.check_index(arena)
+            self.assertGreater(eaten, 0)
+            self.assertEqual(sum(len(snake) - 1 for snake in arena.alive),
+                             sum(snake.score for snake in arena.alive))
+
+if __name__ == "__main__":
+    unittest.main()
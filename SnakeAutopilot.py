@@ -0,0 +1,255 @@
+"""
+Module: SnakeAutopilot
+
+Description:
+An AI player for the snake game.  It steers through the same turn queue
+the arrow keys use (SnakeModel.queue_direction), so it drives the Tk
+controller and headless games alike.
+
+The autopilot keeps a breadth-first distance field grown outwards from the
+food and walks the head down it.  The field stays valid while the food
+stays put: the only cells that become blocked are the ones the head moves
+into, and those are behind it on a downhill path.  So the search is not
+redone every tick; it is resumed across ticks within a time budget, and
+only thrown away when the food moves, the mode changes or a cell the snake
+moved into blocks the way.  Before committing to a path it checks that the
+tail can still be reached once the food is eaten, and otherwise follows
+its tail until a safe path opens up.
+"""
+import array
+import collections
+import time
+import unittest
+
+from Snake import SnakeEngine, SnakeModel, DirectionState, Mode, SNAKE
+
+class Autopilot:
+    """
+    Chooses a direction for a SnakeModel each tick.  time_budget is the
+    most time in seconds one call to choose() may spend searching; work
+    that does not fit is carried over to the next tick.  With time_budget
+    None every search runs to the end, so play is reproducible.
+    """
+
+    def __init__(self, time_budget = 0.002, clock = time.perf_counter):
+        self.time_budget = time_budget
+        self.clock = clock
+        self.model = None
+        self.games = -1
+        self.food = -1
+        self.mode = None
+        self.dist = None
+        self.moves = None
+        self.frontier = collections.deque()
+        self.safe = None
+
+    def __call__(self, model, rng = None):
+        """ Policy interface used by SnakeTournament """
+        return self.choose(model)
+
+    def start_field(self, model):
+        """ Begin a new distance field from the current food """
+        self.model = model
+        self.games = model.games
+        self.food = model.food_location[0] * model.num_cols + model.food_location[1]
+        self.mode = model.mode
+        self.moves = model.neighbors[model.mode]
+        self.dist = array.array('i', [-1]) * len(model.grid)
+        self.dist[self.food] = 0
+        self.frontier = collections.deque([self.food])
+        self.safe = None
+
+    def expand(self, head, deadline):
+        """ Grow the field until a neighbor of head is on it or time runs out.
+        Returns True once the head is connected to the food. """
+        dist = self.dist
+        grid = self.model.grid
+        moves = self.moves
+        if self.connected(head):
+            return True
+        frontier = self.frontier
+        count = 0
+        while frontier:
+            cell = frontier.popleft()
+            step = dist[cell] + 1
+            found = False
+            for table in moves:
+                nxt = table[cell]
+                if nxt >= 0 and dist[nxt] < 0 and grid[nxt] != SNAKE:
+                    dist[nxt] = step
+                    frontier.append(nxt)
+                elif nxt == head:
+                    found = True
+            if found:
+                return True
+            count += 1
+            if count & 63 == 0 and self.clock() > deadline:
+                return False
+        return False
+
+    def connected(self, head):
+        for table in self.moves:
+            nxt = table[head]
+            if nxt >= 0 and self.dist[nxt] >= 0 and self.model.grid[nxt] != SNAKE:
+                return True
+        return False
+
+    def downhill(self, cell, grid):
+        """ Open neighbor of cell closest to the food, as (direction, cell) """
+        best = None
+        for direction, table in enumerate(self.moves):
+            nxt = table[cell]
+            if nxt >= 0 and self.dist[nxt] >= 0 and (grid is None or grid[nxt] != SNAKE):
+                if best is None or self.dist[nxt] < self.dist[best[1]]:
+                    best = (direction, nxt)
+        return best
+
+    def path_is_safe(self, model, deadline):
+        """
+        Walk the field to the food and check that after eating there the
+        new tail can still be reached from the new head.  If the check runs
+        out of time the path is trusted.
+        """
+        body = model.body.indices()
+        path = []
+        cell = body[-1]
+        while cell != self.food:
+            step = self.downhill(cell, None)
+            if step is None:
+                return False
+            cell = step[1]
+            path.append(cell)
+        #eating grows the snake by one, so it keeps one more cell than it had
+        virtual = (body + path)[-(len(body) + 1):]
+        blocked = set(virtual)
+        tail = virtual[0]
+        return self.reachable(virtual[-1], tail, blocked, None, len(virtual),
+                              deadline) is not False
+
+    def reachable(self, start, target, blocked, grid, room, deadline):
+        """
+        Flood fill from start avoiding blocked cells, and snake cells of
+        grid unless grid is None.  Returns True if target is next to the
+        filled area or at least room cells are free, False if not, and None
+        if the deadline passed first.
+        """
+        moves = self.moves
+        seen = {start}
+        queue = collections.deque([start])
+        count = 0
+        while queue:
+            cell = queue.popleft()
+            for table in moves:
+                nxt = table[cell]
+                if nxt == target:
+                    return True
+                if (nxt >= 0 and nxt not in seen and nxt not in blocked
+                        and (grid is None or grid[nxt] != SNAKE)):
+                    seen.add(nxt)
+                    queue.append(nxt)
+            count += 1
+            if len(seen) >= room:
+                return True
+            if count & 63 == 0 and self.clock() > deadline:
+                return None
+        return False
+
+    def fallback(self, model, deadline):
+        """
+        Pick a move without a trusted path: prefer moves that keep the tail
+        reachable, then moves that leave room for the snake, then moves
+        that get closer to the food.
+        """
+        grid = model.grid
+        body = model.body
+        head = body.head
+        tail = body.indices()[0] if len(body) > 1 else -1
+        food_row, food_col = model.food_location
+        best = None
+        best_score = None
+        for direction, table in enumerate(self.moves):
+            nxt = table[head]
+            if nxt < 0 or grid[nxt] == SNAKE:
+                continue
+            found = self.reachable(nxt, tail, (), grid, len(body) + 1, deadline)
+            row, col = divmod(nxt, model.num_cols)
+            score = (found is not False, -abs(row - food_row) - abs(col - food_col))
+            if best_score is None or score > best_score:
+                best = direction
+                best_score = score
+        return None if best is None else DirectionState(best)
+
+    def choose(self, model):
+        """ Direction to take on the next step, or None to go straight """
+        if self.time_budget is None:
+            deadline = float('inf')
+        else:
+            deadline = self.clock() + self.time_budget
+        food = model.food_location[0] * model.num_cols + model.food_location[1]
+        if model is not self.model or model.games != self.games or food != self.food or \
+                model.mode != self.mode:
+            self.start_field(model)
+        head = model.body.head
+        if self.expand(head, deadline):
+            if self.safe is None:
+                self.safe = self.path_is_safe(model, deadline)
+            if self.safe:
+                step = self.downhill(head, model.grid)
+                if step is not None:
+                    return DirectionState(step[0])
+                #the snake has moved across the field, search again next tick
+                self.start_field(model)
+            else:
+                #recheck once the tail has moved on
+                self.safe = None
+        return self.fallback(model, deadline)
+
+    def steer(self, model):
+        """ Choose and queue the next turn, returns the direction queued or None """
+        direction = self.choose(model)
+        if direction is not None and model.queue_direction(direction):
+            return direction
+        return None
+
+def play(engine, autopilot = None, max_steps = 100000):
+    """ Let the autopilot play a headless game, returns the final score """
+    if autopilot is None:
+        autopilot = Autopilot()
+    while engine.steps < max_steps:
+        autopilot.steer(engine.model)
+        if engine.step() is None:
+            break
+    return engine.score
+
+class AutopilotTest(unittest.TestCase):
+    def test_plays_well(self):
+        # The autopilot clears a fair share of a small board
+        for seed in range(3):
+            for mode in Mode:
+                engine = SnakeEngine(10, 10, mode, seed)
+                score = play(engine, Autopilot(time_budget = 1.0), 5000)
+                self.assertGreater(score, 25)
+
+    def test_budget(self):
+        # A tiny budget still yields a legal move on a large board
+        engine = SnakeEngine(300, 300, Mode.Norm, 1)
+        autopilot = Autopilot(time_budget = 1e-5)
+        for i in range(50):
+            autopilot.steer(engine.model)
+            self.assertIsNotNone(engine.step())
+
+    def test_straight_path(self):
+        model = SnakeModel(5, 5, 0)
+        model.state = [[0,0,0,0,0],
+                       [0,0,0,0,0],
+                       [1,1,0,0,2],
+                       [0,0,0,0,0],
+                       [0,0,0,0,0]]
+        model.snake = [(2,0), (2,1)]
+        model.food_location = (2,4)
+        model.direction = DirectionState.right
+        autopilot = Autopilot(time_budget = 1.0)
+        self.assertEqual(autopilot.choose(model), DirectionState.right)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+"""
+Module: SnakeBatch
+
+Description:
+Batched snake simulator for evaluating policies.  Many games of the same
+board size are stored together in NumPy arrays (boards, snake bodies,
+directions, food and scores) and every game is advanced in lockstep by a
+single vectorized step() call, following the same movement, death and
+eating rules as SnakeModel.one_step in both Mode.Norm and Mode.Wrap.
+Finished games are reset automatically so the batch never stalls.
+"""
+import unittest
+import numpy as np
+
+from Snake import SnakeModel, GameOver, CellState, DirectionState, Mode
+
+#row and column offsets indexed by DirectionState value
+ROW_STEP = np.array([-1, 1, 0, 0], dtype = np.int64)
+COL_STEP = np.array([0, 0, 1, -1], dtype = np.int64)
+OPPOSITE = np.array([DirectionState.down, DirectionState.up,
+                     DirectionState.left, DirectionState.right], dtype = np.int8)
+
+class BatchSnake:
+    """
+    num_games snake games on num_rows x num_cols boards, stepped together.
+
+    Each snake body is a ring buffer of flat cell indices (row*num_cols+col)
+    of board size capacity: head_ptr points at the head and the tail sits
+    length-1 slots behind it.
+    """
+
+    def __init__(self, num_games, num_rows, num_cols, mode = Mode.Norm, seed = None):
+        """ Create and reset num_games games, mode may be one Mode or one per game """
+        self.num_games = num_games
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.num_cells = num_rows * num_cols
+        self.rng = np.random.default_rng(seed)
+        self.wrap = np.broadcast_to(np.asarray(mode) == Mode.Wrap, (num_games,)).copy()
+
+        self.boards = np.zeros((num_games, self.num_cells), dtype = np.uint8)
+        self.body = np.zeros((num_games, self.num_cells), dtype = np.int32)
+        self.head_ptr = np.zeros(num_games, dtype = np.int64)
+        self.length = np.ones(num_games, dtype = np.int64)
+        self.direction = np.zeros(num_games, dtype = np.int8)
+        self.food = np.zeros(num_games, dtype = np.int64)
+        self.score = np.zeros(num_games, dtype = np.int64)
+        self.steps = np.zeros(num_games, dtype = np.int64)
+        self.games = np.arange(num_games)
+        self.reset_games(self.games)
+
+    @property
+    def heads(self):
+        """ Flat cell index of every snake head """
+        return self.body[self.games, self.head_ptr]
+
+    def reset_games(self, games):
+        """ Start fresh games in the given slots """
+        if len(games) == 0:
+            return
+        self.boards[games] = CellState.Nothing
+        start = self.rng.integers(0, self.num_cells, size = len(games))
+        self.head_ptr[games] = 0
+        self.length[games] = 1
+        self.score[games] = 0
+        self.steps[games] = 0
+        self.body[games, 0] = start
+        self.boards[games, start] = CellState.Snake
+        self.direction[games] = self.first_direction(start)
+        self.place_food(games)
+
+    def first_direction(self, cells):
+        """ Same initial direction rule as SnakeModel.first_direction """
+        row, col = np.divmod(cells, self.num_cols)
+        direction = np.full(len(cells), -1, dtype = np.int8)
+        distance = np.zeros(len(cells), dtype = np.int64)
+        for candidate, gap in ((DirectionState.left, col),
+                               (DirectionState.right, self.num_cols - col),
+                               (DirectionState.up, row),
+                               (DirectionState.down, self.num_rows - row)):
+            better = gap > distance
+            direction[better] = candidate
+            distance = np.where(better, gap, distance)
+        return direction
+
+    def place_food(self, games):
+        """
+        Put food on a uniformly random empty cell of each given game.
+        Rejection sampling handles the common case in a few vectorized
+        rounds; the few games still unplaced fall back to an exact scan.
+        Returns the games whose board had no empty cell left.
+        """
+        pending = np.asarray(games)
+        for attempt in range(8):
+            if len(pending) == 0:
+                return pending
+            cells = self.rng.integers(0, self.num_cells, size = len(pending))
+            empty = self.boards[pending, cells] == CellState.Nothing
+            placed = pending[empty]
+            self.food[placed] = cells[empty]
+            self.boards[placed, cells[empty]] = CellState.Food
+            pending = pending[~empty]
+        full = []
+        for game in pending:
+            free = np.flatnonzero(self.boards[game] == CellState.Nothing)
+            if len(free) == 0:
+                full.append(game)
+                continue
+            cell = free[self.rng.integers(len(free))]
+            self.food[game] = cell
+            self.boards[game, cell] = CellState.Food
+        return np.array(full, dtype = np.int64)
+
+    def step(self, actions = None):
+        """
+        Advance every game by one step.  actions holds one DirectionState
+        value per game, or -1 to keep going straight; reversals into the
+        body are ignored like SnakeModel.turn.  Returns (done, final_score):
+        done flags the games that ended this step (and were reset), and
+        final_score holds their score before the reset.
+        """
+        games = self.games
+        if actions is not None:
+            actions = np.asarray(actions, dtype = np.int8)
+            turn = (actions >= 0) & ((actions != OPPOSITE[self.direction]) | (self.length == 1))
+            self.direction = np.where(turn, actions, self.direction)
+
+        head = self.body[games, self.head_ptr]
+        row, col = np.divmod(head, self.num_cols)
+        row = row + ROW_STEP[self.direction]
+        col = col + COL_STEP[self.direction]
+        outside = (row < 0) | (row >= self.num_rows) | (col < 0) | (col >= self.num_cols)
+        row %= self.num_rows
+        col %= self.num_cols
+        new_head = row * self.num_cols + col
+        target = self.boards[games, new_head]
+
+        done = (outside & ~self.wrap) | (target == CellState.Snake)
+        eat = ~done & (target == CellState.Food)
+        move = ~done & ~eat
+
+        #free the tail cell of snakes that moved without eating
+        movers = games[move]
+        tail_ptr = (self.head_ptr[movers] - self.length[movers] + 1) % self.num_cells
+        self.boards[movers, self.body[movers, tail_ptr]] = CellState.Nothing
+
+        #advance the head of every surviving snake
+        alive = games[~done]
+        self.head_ptr[alive] = (self.head_ptr[alive] + 1) % self.num_cells
+        self.body[alive, self.head_ptr[alive]] = new_head[alive]
+        self.boards[alive, new_head[alive]] = CellState.Snake
+        self.steps[alive] += 1
+
+        eaters = games[eat]
+        self.length[eaters] += 1
+        self.score[eaters] += 1
+        full = self.place_food(eaters)
+        if len(full):
+            done[full] = True
+
+        final_score = np.where(done, self.score, 0)
+        self.reset_games(games[done])
+        return done, final_score
+
+    def load_model(self, game, model):
+        """ Copy the position of a SnakeModel into slot game """
+        self.boards[game] = np.frombuffer(model.grid, dtype = np.uint8)
+        cells = [r * self.num_cols + c for r, c in model.snake]
+        self.body[game, :len(cells)] = cells
+        self.head_ptr[game] = len(cells) - 1
+        self.length[game] = len(cells)
+        self.direction[game] = model.direction
+        self.food[game] = model.food_location[0] * self.num_cols + model.food_location[1]
+        self.score[game] = model.points_earned
+        self.wrap[game] = model.mode == Mode.Wrap
+
+    def snake_cells(self, game):
+        """ Body of one game as (row, col) tuples from tail to head """
+        ptr = (self.head_ptr[game] - np.arange(self.length[game])[::-1]) % self.num_cells
+        return [divmod(int(cell), self.num_cols) for cell in self.body[game, ptr]]
+
+class BatchSnakeTest(unittest.TestCase):
+    def test_matches_snake_model(self):
+        # Games loaded from SnakeModel positions follow the same rules
+        rng = np.random.default_rng(1)
+        batch = BatchSnake(16, 7, 7, seed = 2)
+        models = []
+        for game in range(16):
+            model = SnakeModel(7, 7)
+            model.mode = Mode.Wrap if game % 2 else Mode.Norm
+            batch.load_model(game, model)
+            models.append(model)
+        for i in range(60):
+            actions = rng.integers(0, 4, size = 16)
+            expected = []
+            for game, model in enumerate(models):
+                model.turn(DirectionState(int(actions[game])))
+                try:
+                    model.one_step()
+                    expected.append(False)
+                except GameOver:
+                    expected.append(True)
+            done, final_score = batch.step(actions)
+            for game, model in enumerate(models):
+                self.assertEqual(bool(done[game]), expected[game])
+                if expected[game]:
+                    self.assertEqual(final_score[game], model.points_earned)
+                    models[game] = SnakeModel(7, 7)
+                    models[game].mode = model.mode
+                else:
+                    self.assertEqual(batch.snake_cells(game), list(models[game].snake))
+                #keep food placement identical to the model
+                batch.load_model(game, models[game])
+
+    def test_invariants(self):
+        batch = BatchSnake(64, 6, 6, mode = Mode.Wrap, seed = 3)
+        rng = np.random.default_rng(4)
+        for i in range(300):
+            batch.step(rng.integers(-1, 4, size = 64))
+            snake = (batch.boards == CellState.Snake).sum(axis = 1)
+            food = (batch.boards == CellState.Food).sum(axis = 1)
+            self.assertTrue((snake == batch.length).all())
+            self.assertTrue((food == 1).all())
+            self.assertTrue((batch.boards[batch.games, batch.food] == CellState.Food).all())
+
+if __name__ == "__main__":
+    unittest.main()
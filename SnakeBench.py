@@ -0,0 +1,475 @@
+"""
+Module: SnakeBench
+
+Description:
+Benchmark suite for the snake game.  Measures SnakeModel steps per second
+across board sizes, snake lengths and modes, the cost of placing food as
+the board fills up, the make/unmake and clone operations used by lookahead
+search, starting a new game by construction and by in-place restart, the
+SnakeEnv and SnakeVectorEnv loops, SnakeArena ticks with 100
+snakes, controller frame time in snake.one_step for each view backend, and
+memory per game.  Results are written as JSON records so two
+runs can be compared and regressions caught.
+
+The Tk view backends need a display (a virtual X server such as Xvfb will
+do); without one the frame benchmark runs against NullView only.
+
+Usage:
+    python SnakeBench.py --output run.json
+    python SnakeBench.py --quick --compare baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import unittest
+
+import Snake
+from Snake import SnakeModel, DirectionState, Mode, NOTHING, SNAKE
+
+SIZES = [10, 30, 100, 300, 1000]
+QUICK_SIZES = [10, 30, 100]
+LENGTHS = [1, 0.1, 0.5]     #absolute length, or a fraction of the board
+FILL_LEVELS = [0.0, 0.5, 0.9, 0.99]
+
+class NullVar:
+    """ Stand-in for tk.StringVar """
+    def __init__(self):
+        self.value = ''
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class NullWindow:
+    def mainloop(self):
+        pass
+
+    def destroy(self):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+class NullView:
+    """ View with the SnakeView interface that draws nothing, for timing
+    the controller without a display """
+
+    def __init__(self, num_rows, num_cols, cell_size = 20):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.window = NullWindow()
+        self.points_earned = NullVar()
+        self.game_over = NullVar()
+        self.time_diff = NullVar()
+        self.score_per_second = NullVar()
+
+    def make_snake_body(self, row, column):
+        pass
+
+    def make_snake_head(self, row, column):
+        pass
+
+    def make_nothing(self, row, column):
+        pass
+
+    def make_food(self, row, column):
+        pass
+
+    def reset(self):
+        pass
+
+    def schedule_next_step(self, step_time_millis, step_handler):
+        pass
+
+    def cancel_next_step(self):
+        pass
+
+    def __getattr__(self, name):
+        #every set_*_handler is a no-op
+        if name.startswith('set_') and name.endswith('_handler'):
+            return lambda handler: None
+        raise AttributeError(name)
+
+def hamiltonian_cycle(num_rows, num_cols):
+    """
+    Flat cell indices of a cycle through every cell of a board with an even
+    number of rows: along the top row, snaking down the other columns and
+    back up the first column.
+    """
+    cycle = [c for c in range(num_cols)]
+    for r in range(1, num_rows):
+        cols = range(num_cols - 1, 0, -1) if r % 2 else range(1, num_cols)
+        cycle.extend(r * num_cols + c for c in cols)
+    cycle.extend(r * num_cols for r in range(num_rows - 1, 0, -1))
+    return cycle
+
+def cycle_directions(num_rows, num_cols, cycle):
+    """ Direction to take from every cell to follow the cycle """
+    directions = [None] * (num_rows * num_cols)
+    for i, cell in enumerate(cycle):
+        nxt = cycle[(i + 1) % len(cycle)]
+        row, col = divmod(cell, num_cols)
+        next_row, next_col = divmod(nxt, num_cols)
+        if next_row < row:
+            directions[cell] = DirectionState.up
+        elif next_row > row:
+            directions[cell] = DirectionState.down
+        elif next_col > col:
+            directions[cell] = DirectionState.right
+        else:
+            directions[cell] = DirectionState.left
+    return directions
+
+def model_with_snake(size, length, mode, cycle, seed = 0):
+    """ A size x size model whose snake of given length lies along cycle """
+    model = SnakeModel(size, size, seed)
+    model.mode = mode
+    model.grid[:] = bytes(len(model.grid))
+    for cell in cycle[:length]:
+        model.grid[cell] = SNAKE
+    model.snake = [divmod(cell, size) for cell in cycle[:length]]
+    model.open_cells.rebuild(model.grid)
+    model.place_food()
+    return model
+
+def best_rate(run, repeat):
+    """ Best operations per second over repeat runs of run(), which returns
+    the number of operations it did """
+    best = 0
+    for i in range(repeat):
+        start = time.perf_counter()
+        ops = run()
+        elapsed = time.perf_counter() - start
+        best = max(best, ops / elapsed)
+    return best
+
+def bench_steps(sizes, steps, repeat):
+    """ SnakeModel.one_step throughput, snake following a Hamiltonian cycle """
+    records = []
+    for size in sizes:
+        cycle = hamiltonian_cycle(size, size)
+        directions = cycle_directions(size, size, cycle)
+        for length in LENGTHS:
+            cells = length if isinstance(length, int) else int(length * size * size)
+            cells = max(1, min(cells, size * size - 2))
+            for mode in Mode:
+                def run():
+                    model = model_with_snake(size, cells, mode, cycle)
+                    body = model.body
+                    done = 0
+                    try:
+                        for i in range(steps):
+                            model.direction = directions[body.head]
+                            model.one_step()
+                            done += 1
+                    except Snake.GameOver:
+                        pass
+                    return max(done, 1)
+                records.append(dict(bench = 'model_steps', size = size, length = cells,
+                                    mode = mode.name, value = best_rate(run, repeat),
+                                    unit = 'steps/s'))
+    return records
+
+def bench_food(sizes, placements, repeat):
+    """ Cost of SnakeModel.place_food as the board fills with snake """
+    records = []
+    for size in sizes:
+        for fill in FILL_LEVELS:
+            model = SnakeModel(size, size, 0)
+            filled = int(fill * size * size)
+            model.grid[:] = bytes([SNAKE]) * filled + bytes(size * size - filled)
+            model.open_cells.rebuild(model.grid)
+            def run():
+                for i in range(placements):
+                    index = model.place_food()
+                    model.grid[index] = NOTHING
+                    model.open_cells.add_index(index)
+                return placements
+            rate = best_rate(run, repeat)
+            records.append(dict(bench = 'place_food', size = size, fill = fill,
+                                value = 1e6 / rate, unit = 'us/call'))
+    return records
+
+def bench_lookahead(sizes, steps, repeat):
+    """ Cost of the search primitives: make_step/unmake_step pairs per
+    second, and SnakeModel.clone time """
+    records = []
+    for size in sizes:
+        cycle = hamiltonian_cycle(size, size)
+        directions = cycle_directions(size, size, cycle)
+        model = model_with_snake(size, max(1, size * size // 4), Mode.Norm, cycle)
+        body = model.body
+        def run():
+            for i in range(steps):
+                model.direction = directions[body.head]
+                model.unmake_step(model.make_step())
+            return steps
+        records.append(dict(bench = 'make_unmake', size = size,
+                            value = best_rate(run, repeat), unit = 'steps/s'))
+        def run():
+            for i in range(100):
+                model.clone()
+            return 100
+        records.append(dict(bench = 'clone', size = size,
+                            value = 1e6 / best_rate(run, repeat), unit = 'us/call'))
+    return records
+
+def bench_restart(sizes, games, repeat, steps = 50):
+    """ Time to start a new game: building a SnakeModel against restarting
+    one in place after a game of steps steps """
+    records = []
+    for size in sizes:
+        def run():
+            for seed in range(games):
+                SnakeModel(size, size, seed)
+            return games
+        records.append(dict(bench = 'new_game', kind = 'construct', size = size,
+                            value = 1e6 / best_rate(run, repeat), unit = 'us/call'))
+        directions = cycle_directions(size, size, hamiltonian_cycle(size, size))
+        model = SnakeModel(size, size, 0)
+        best = None
+        for i in range(repeat):
+            elapsed = 0.0
+            for seed in range(games):
+                try:
+                    for step in range(steps):
+                        model.direction = directions[model.body.head]
+                        model.one_step()
+                except Snake.GameOver:
+                    pass
+                start = time.perf_counter()
+                model.restart(seed)
+                elapsed += time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        records.append(dict(bench = 'new_game', kind = 'restart', size = size,
+                            value = 1e6 * best / games, unit = 'us/call'))
+    return records
+
+def bench_env(sizes, steps, repeat):
+    """ Env loop throughput of SnakeEnv and of a 256 game SnakeVectorEnv,
+    skipped without NumPy """
+    try:
+        import SnakeEnv
+    except ImportError:
+        return []
+    records = []
+    for size in sizes:
+        env = SnakeEnv.SnakeEnv(size, size)
+        def run():
+            SnakeEnv.rollout(env, steps)
+            return steps
+        records.append(dict(bench = 'env_steps', kind = 'SnakeEnv', size = size,
+                            value = best_rate(run, repeat), unit = 'steps/s'))
+        vector = SnakeEnv.SnakeVectorEnv(256, size, size, seed = 0)
+        count = max(1, steps // 256)
+        def run():
+            SnakeEnv.rollout(vector, count)
+            return 256 * count
+        records.append(dict(bench = 'env_steps', kind = 'SnakeVectorEnv', size = size,
+                            value = best_rate(run, repeat), unit = 'steps/s'))
+    return records
+
+def bench_arena(sizes, ticks, repeat, num_snakes = 100):
+    """ SnakeArena tick time with num_snakes snakes, topped up as they die """
+    import SnakeArena
+    records = []
+    for size in sizes:
+        if size * size < 4 * num_snakes:
+            continue
+        arena = SnakeArena.SnakeArena(size, size, num_food = num_snakes // 2, seed = 0)
+        def run():
+            for i in range(ticks):
+                while len(arena.alive) < num_snakes:
+                    arena.add_snake()
+                for snake in arena.alive:
+                    safe = arena.safe_directions(snake.id)
+                    if safe and snake.direction not in safe:
+                        arena.set_direction(snake.id, safe[0])
+                arena.step()
+            return ticks
+        records.append(dict(bench = 'arena_tick', size = size, snakes = num_snakes,
+                            value = 1e6 / best_rate(run, repeat), unit = 'us/call'))
+    return records
+
+def available_views():
+    """ View backends that can be built here """
+    views = [NullView]
+    if os.environ.get('DISPLAY'):
+        try:
+            Snake.load_tk()
+            views.extend([Snake.SnakeView, Snake.CanvasSnakeView, Snake.ViewportSnakeView])
+        except ImportError:
+            pass
+    return views
+
+def bench_frames(sizes, frames, views):
+    """ Controller startup and frame time in snake.one_step per view backend """
+    records = []
+    for view_class in views:
+        for size in sizes:
+            cell_size = max(2, min(20, 800 // size))
+            start = time.perf_counter()
+            game = make_controller(view_class, size, cell_size)
+            game.view.window.update_idletasks()
+            startup = time.perf_counter() - start
+            cycle = hamiltonian_cycle(size, size)
+            directions = cycle_directions(size, size, cycle)
+            game.model = model_with_snake(size, max(1, size // 2), Mode.Wrap, cycle)
+            game.time_elapsed = 1
+            times = []
+            for i in range(frames):
+                game.model.direction = directions[game.model.body.head]
+                start = time.perf_counter()
+                game.one_step()
+                game.view.window.update_idletasks()
+                times.append(time.perf_counter() - start)
+            times.sort()
+            records.append(dict(bench = 'view_startup', view = view_class.__name__,
+                                size = size, value = startup * 1000, unit = 'ms'))
+            records.append(dict(bench = 'frame_time', view = view_class.__name__,
+                                size = size, value = times[len(times) // 2] * 1000,
+                                p95 = times[int(len(times) * 0.95)] * 1000, unit = 'ms'))
+            game.view.window.destroy()
+    return records
+
+def make_controller(view_class, size, cell_size):
+    """ Build a controller on a size x size board without entering mainloop """
+    game = Snake.snake.__new__(Snake.snake)
+    game.NUM_ROWS = size
+    game.NUM_COLS = size
+    game.view = view_class(size, size, cell_size)
+    game.model = SnakeModel(size, size)
+    game.GameState = Snake.GameState.Playing
+    game.time_elapsed = 0
+    game.profiler = None
+    game.recorder = None
+    game.autopilot = None
+    game.scores = None
+    return game
+
+def bench_memory(sizes):
+    """ Bytes allocated per SnakeModel, and per BatchSnake game if NumPy is present """
+    records = []
+    for size in sizes:
+        Snake.neighbor_tables(size, size)    #shared by every game of this size
+        count = max(1, min(100, 10 ** 6 // (size * size)))
+        gc.collect()
+        tracemalloc.start()
+        models = [SnakeModel(size, size) for i in range(count)]
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        records.append(dict(bench = 'memory', kind = 'SnakeModel', size = size,
+                            value = used / count, unit = 'bytes/game'))
+        del models
+    try:
+        import SnakeBatch
+    except ImportError:
+        return records
+    for size in sizes:
+        count = max(1, min(1000, 10 ** 7 // (size * size)))
+        batch = SnakeBatch.BatchSnake(count, size, size, seed = 0)
+        used = sum(value.nbytes for value in vars(batch).values() if hasattr(value, 'nbytes'))
+        records.append(dict(bench = 'memory', kind = 'BatchSnake', size = size,
+                            value = used / count, unit = 'bytes/game'))
+    return records
+
+def record_key(record):
+    """ Identify a record across runs by everything except its measurements """
+    return tuple(sorted((k, v) for k, v in record.items()
+                        if k not in ('value', 'p95')))
+
+def compare(old_records, new_records, threshold = 0.1):
+    """
+    Records that got worse by more than threshold (as a fraction).  Higher
+    is better for rates, lower is better for times and memory.
+    """
+    old = {record_key(record): record for record in old_records}
+    regressions = []
+    for record in new_records:
+        before = old.get(record_key(record))
+        if before is None or before['value'] == 0:
+            continue
+        change = record['value'] / before['value'] - 1
+        if record['unit'] == 'steps/s':
+            change = -change
+        if change > threshold:
+            regressions.append(dict(record, baseline = before['value'], change = change))
+    return regressions
+
+def run_all(quick = False):
+    sizes = QUICK_SIZES if quick else SIZES
+    steps = 2000 if quick else 20000
+    repeat = 2 if quick else 5
+    records = []
+    records.extend(bench_steps(sizes, steps, repeat))
+    records.extend(bench_food(sizes, 200 if quick else 2000, repeat))
+    records.extend(bench_lookahead(sizes, steps, repeat))
+    records.extend(bench_restart(sizes, 20 if quick else 100, repeat))
+    records.extend(bench_env(sizes, steps, repeat))
+    records.extend(bench_arena(sizes, steps // 10, repeat))
+    records.extend(bench_frames([s for s in sizes if s <= 200] + ([] if quick else [200]),
+                                50 if quick else 300, available_views()))
+    records.extend(bench_memory(sizes))
+    return records
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the snake game')
+    parser.add_argument('--quick', action = 'store_true', help = 'small sizes, few repeats')
+    parser.add_argument('--output', help = 'write results here instead of stdout')
+    parser.add_argument('--compare', help = 'earlier results to check for regressions')
+    parser.add_argument('--threshold', type = float, default = 0.1)
+    args = parser.parse_args(argv)
+
+    records = run_all(args.quick)
+    result = dict(python = sys.version.split()[0], time = time.time(), results = records)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 1)
+    else:
+        json.dump(result, sys.stdout, indent = 1)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f)['results'], records, args.threshold)
+        for regression in regressions:
+            sys.stderr.write('regression: %s\n' % json.dumps(regression))
+        return 1 if regressions else 0
+    return 0
+
+class SnakeBenchTest(unittest.TestCase):
+    def test_cycle(self):
+        # Following the cycle never dies until the snake fills the board
+        self.assertEqual(sorted(hamiltonian_cycle(4, 5)), list(range(20)))
+        cycle = hamiltonian_cycle(4, 4)
+        directions = cycle_directions(4, 4, cycle)
+        model = model_with_snake(4, 5, Mode.Norm, cycle)
+        for i in range(1000):
+            model.direction = directions[model.body.head]
+            try:
+                model.one_step()
+            except Snake.GameOver as end:
+                self.assertEqual(str(end), 'full')
+                break
+        self.assertEqual(len(model.snake), 16)
+
+    def test_records(self):
+        records = bench_steps([10], 50, 1) + bench_food([10], 10, 1)
+        records += bench_lookahead([10], 50, 1) + bench_env([10], 300, 1)
+        records += bench_restart([10], 5, 1)
+        records += bench_arena([30], 20, 1)
+        records += bench_frames([10], 5, [NullView]) + bench_memory([10])
+        self.assertTrue(all(record['value'] > 0 for record in records))
+        self.assertEqual(compare(records, records), [])
+        slower = [dict(record, value = record['value'] / 2) for record in records
+                  if record['unit'] == 'steps/s']
+        self.assertEqual(len(compare(records, slower)), len(slower))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+"""
+Module: SnakeCurses
+
+Description:
+Terminal frontend for the snake game, for playing over SSH where the Tk
+view is too slow.  CursesSnakeView has the same interface as SnakeView, so
+the snake controller drives it unchanged: it takes the same handlers and
+gets the same make_* calls, which the controller only makes for cells that
+changed.  Each cell is written to the screen only when what it shows
+changes, and the screen is flushed once per pass of the event loop, so a
+tick sends a handful of cells and the labels that moved, whatever the
+board size.
+
+Keys:
+    arrows  steer               s  start        p  pause
+    r       reset               w  wraparound   a  autopilot
+    1-9, 0  step speed 1-10     d  dump profile q  quit
+
+Usage:
+    python SnakeCurses.py --rows 30 --cols 30 [--no-color]
+"""
+import argparse
+import curses
+import re
+import sys
+import time
+import unittest
+
+import Snake
+
+EMPTY = 0
+BODY = 1
+FOOD = 2
+HEAD = 3
+#two characters per cell keeps cells roughly square in a terminal
+CELL_TEXT = ('  ', '[]', '<>', '@@')
+#any cell code but EMPTY
+DRAWN = re.compile(b'[^\x00]')
+
+class TextVar:
+    """ Stand-in for tk.StringVar, marks the labels for redrawing when set """
+
+    def __init__(self, view, value = ''):
+        self.view = view
+        self.value = value
+
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.view.labels_changed = True
+
+    def get(self):
+        return self.value
+
+class CursesWindow:
+    """ The part of a Tk window the controller uses """
+
+    def __init__(self, view):
+        self.view = view
+
+    def mainloop(self):
+        curses.wrapper(self.view.run)
+
+    def destroy(self):
+        self.view.running = False
+
+    def update_idletasks(self):
+        self.view.flush()
+
+class StatusLine:
+    """ Stands in for sys.stdout while curses owns the terminal, showing
+    the last line printed on the bottom row """
+
+    def __init__(self, view):
+        self.view = view
+        self.text = ''
+
+    def write(self, text):
+        lines = (self.text + text).split('\n')
+        self.text = lines[-1]
+        shown = lines[-1] or (lines[-2] if len(lines) > 1 else '')
+        self.view.draw_status(shown)
+        return len(text)
+
+    def flush(self):
+        pass
+
+class CursesSnakeView:
+    """
+    View of a num_rows x num_cols board in a terminal.  Until mainloop()
+    starts curses, drawing only updates the record of what each cell
+    shows; the whole board is painted from it once the screen exists.
+    """
+
+    KEYS = {ord('s'): 'start', ord('p'): 'pause', ord('r'): 'reset', ord('q'): 'quit',
+            ord('w'): 'wraparound', ord('a'): 'autopilot'}
+
+    def __init__(self, num_rows, num_cols, cell_size = None, colors = True):
+        """ cell_size is accepted for compatibility with SnakeView and ignored """
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.use_colors = colors
+        self.shown = bytearray(num_rows * num_cols)
+        self.head = -1
+        self.window = CursesWindow(self)
+        self.screen = None
+        self.running = False
+        self.attrs = [0] * len(CELL_TEXT)
+        self.handlers = {}
+        self.timer = None
+        self.speed = 1
+        self.labels_changed = False
+        self.points_earned = TextVar(self, 'Points: 0 ')
+        self.game_over = TextVar(self, ' ')
+        self.time_diff = TextVar(self, 'Time: 00:00')
+        self.score_per_second = TextVar(self, 'Points per second:     ')
+
+    #drawing
+
+    def cell_position(self, row, column):
+        #one line of labels and the top border above the board
+        return row + 2, 2 * column + 1
+
+    def draw_cell(self, row, column, code):
+        if self.screen is not None:
+            y, x = self.cell_position(row, column)
+            self.screen.addstr(y, x, CELL_TEXT[code], self.attrs[code])
+
+    def set_cell(self, row, column, code):
+        index = row * self.num_cols + column
+        if self.shown[index] != code:
+            self.shown[index] = code
+            self.draw_cell(row, column, code)
+
+    def make_snake_body(self, row, column):
+        """ Make cell in row, column into snake """
+        self.set_cell(row, column, BODY)
+
+    def make_snake_head(self, row, column):
+        """ Make cell in row, column into snake head """
+        self.set_cell(row, column, HEAD)
+
+    def make_nothing(self, row, column):
+        """ Make cell in row, column nothing"""
+        self.set_cell(row, column, EMPTY)
+
+    def make_food(self, row, column):
+        """ Make cell in row, column food """
+        self.set_cell(row, column, FOOD)
+
+    def reset(self):
+        """reset all cells to nothing"""
+        shown = self.shown
+        if self.screen is not None:
+            #the scan for drawn cells runs in C, only those get redrawn
+            for match in DRAWN.finditer(shown):
+                index = match.start()
+                self.draw_cell(index // self.num_cols, index % self.num_cols, EMPTY)
+        shown[:] = bytes(len(shown))
+        self.game_over.set(" ")
+        self.points_earned.set("Points: 0")
+
+    def draw_labels(self):
+        self.labels_changed = False
+        if self.screen is None:
+            return
+        text = '  '.join(var.get().strip() for var in (self.points_earned, self.time_diff,
+                                                       self.score_per_second, self.game_over))
+        width = 2 * self.num_cols + 2
+        self.screen.addstr(0, 0, text[:width].ljust(width))
+
+    def draw_status(self, text):
+        if self.screen is None:
+            return
+        width = 2 * self.num_cols + 2
+        self.screen.addstr(self.num_rows + 4, 0, text[:width].ljust(width))
+
+    def draw_all(self):
+        """ Paint the frame, the labels and every cell that is not empty """
+        screen = self.screen
+        screen.erase()
+        rows, cols = self.num_rows, self.num_cols
+        screen.addstr(1, 0, '+' + '-' * (2 * cols) + '+')
+        for row in range(rows):
+            screen.addstr(row + 2, 0, '|')
+            screen.addstr(row + 2, 2 * cols + 1, '|')
+        screen.addstr(rows + 2, 0, '+' + '-' * (2 * cols) + '+')
+        screen.addstr(rows + 3, 0, 'arrows s p r w a 0-9 q'[:2 * cols + 2])
+        for index, code in enumerate(self.shown):
+            if code != EMPTY:
+                self.draw_cell(index // cols, index % cols, code)
+        self.draw_labels()
+
+    def flush(self):
+        """ Send everything drawn since the last flush to the terminal,
+        redrawing the labels once if any of them changed """
+        if self.screen is not None:
+            if self.labels_changed:
+                self.draw_labels()
+            self.screen.noutrefresh()
+            curses.doupdate()
+
+    #event loop
+
+    def setup(self, screen):
+        """ Take over the terminal, screen being the curses window """
+        rows, cols = screen.getmaxyx()
+        if rows < self.num_rows + 5 or cols < 2 * self.num_cols + 3:
+            raise ValueError('terminal is %dx%d, the board needs %dx%d' % (cols, rows,
+                             2 * self.num_cols + 3, self.num_rows + 5))
+        self.screen = screen
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        if self.use_colors and curses.has_colors():
+            curses.start_color()
+            curses.use_default_colors()
+            for code, (fg, bg) in enumerate(((-1, -1), (curses.COLOR_WHITE, curses.COLOR_BLUE),
+                                             (curses.COLOR_WHITE, curses.COLOR_RED),
+                                             (curses.COLOR_WHITE, curses.COLOR_BLACK))):
+                if code:
+                    curses.init_pair(code, fg, bg)
+                    self.attrs[code] = curses.color_pair(code)
+        screen.keypad(True)
+        self.draw_all()
+
+    def run(self, screen):
+        """ Event loop: wait for a key or the step timer, whichever is first """
+        self.setup(screen)
+        stdout = sys.stdout
+        sys.stdout = StatusLine(self)
+        self.running = True
+        try:
+            while self.running:
+                self.flush()
+                if self.timer is None:
+                    screen.timeout(-1)
+                else:
+                    wait = int((self.timer[0] - time.monotonic()) * 1000)
+                    screen.timeout(max(0, wait))
+                key = screen.getch()
+                if key != -1:
+                    self.key(key)
+                if self.timer is not None and time.monotonic() >= self.timer[0]:
+                    handler = self.timer[1]
+                    self.timer = None
+                    handler()
+        finally:
+            sys.stdout = stdout
+            self.screen = None
+
+    def key(self, key):
+        """ Dispatch one key press to its handler """
+        arrows = {curses.KEY_UP: 'up', curses.KEY_DOWN: 'down',
+                  curses.KEY_LEFT: 'left', curses.KEY_RIGHT: 'right'}
+        if key in arrows:
+            self.call(arrows[key], key)
+        elif key in self.KEYS:
+            self.call(self.KEYS[key])
+        elif ord('0') <= key <= ord('9'):
+            self.speed = (key - ord('0')) or 10
+            self.call('step_speed', self.speed)
+        elif key in (ord('d'), curses.KEY_F12):
+            self.call('dump_profile', None)
+
+    def call(self, name, *args):
+        handler = self.handlers.get(name)
+        if handler is not None:
+            handler(*args)
+
+    def schedule_next_step(self, step_time_millis, step_handler):
+        """ schedule next step of the simulation """
+        self.timer = (time.monotonic() + step_time_millis / 1000, step_handler)
+
+    def cancel_next_step(self):
+        """ cancel the scheduled next step of simulation """
+        self.timer = None
+
+    def set_up_arrow_handler(self, handler):
+        self.handlers['up'] = handler
+
+    def set_down_arrow_handler(self, handler):
+        self.handlers['down'] = handler
+
+    def set_right_arrow_handler(self, handler):
+        self.handlers['right'] = handler
+
+    def set_left_arrow_handler(self, handler):
+        self.handlers['left'] = handler
+
+    def set_dump_profile_handler(self, handler):
+        self.handlers['dump_profile'] = handler
+
+    def set_start_handler(self, handler):
+        self.handlers['start'] = handler
+
+    def set_pause_handler(self, handler):
+        self.handlers['pause'] = handler
+
+    def set_reset_handler(self, handler):
+        self.handlers['reset'] = handler
+
+    def set_quit_handler(self, handler):
+        self.handlers['quit'] = handler
+
+    def set_step_speed_handler(self, handler):
+        self.handlers['step_speed'] = handler
+
+    def set_wraparound_handler(self, handler):
+        self.handlers['wraparound'] = handler
+
+    def set_autopilot_handler(self, handler):
+        self.handlers['autopilot'] = handler
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Greedy Snake in a terminal')
+    parser.add_argument('--rows', type = int, default = 30)
+    parser.add_argument('--cols', type = int, default = 30)
+    parser.add_argument('--no-color', action = 'store_true',
+                        help = 'plain characters, fewest bytes over a slow link')
+    parser.add_argument('--replay-dir')
+    parser.add_argument('--scores')
+    parser.add_argument('--profile', metavar = 'PATH',
+                        help = 'time each tick, writing the summary to PATH (d prints it)')
+    parser.add_argument('--profile-interval', type = float, default = 10.0, metavar = 'S')
+    args = parser.parse_args(argv)
+    view_class = lambda rows, cols: CursesSnakeView(rows, cols, colors = not args.no_color)
+    game = Snake.snake(view_class, replay_dir = args.replay_dir, num_rows = args.rows,
+                       num_cols = args.cols, scores_path = args.scores, mainloop = False)
+    if args.profile is not None:
+        game.enable_profiling(args.profile, args.profile_interval)
+    game.view.window.mainloop()
+
+class FakeScreen:
+    """ Records what would be written to the terminal """
+
+    def __init__(self, rows, cols):
+        self.lines = [[' '] * cols for i in range(rows)]
+        self.writes = 0
+        self.written = 0
+
+    def getmaxyx(self):
+        return len(self.lines), len(self.lines[0])
+
+    def addstr(self, y, x, text, attr = 0):
+        self.writes += 1
+        self.written += len(text)
+        self.lines[y][x:x + len(text)] = list(text)
+
+    def erase(self):
+        for line in self.lines:
+            line[:] = [' '] * len(line)
+
+    def keypad(self, flag):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+class CursesSnakeViewTest(unittest.TestCase):
+    def make_game(self):
+        #the controller seeds its games from the random module
+        state = Snake.rand.getstate()
+        Snake.rand.seed(103)
+        game = Snake.snake(lambda rows, cols: CursesSnakeView(rows, cols, colors = False),
+                           mainloop = False, num_rows = 12, num_cols = 15)
+        Snake.rand.setstate(state)
+        view = game.view
+        view.screen = FakeScreen(20, 40)
+        view.draw_all()
+        return game, view
+
+    def board(self, view):
+        codes = {text: code for code, text in enumerate(CELL_TEXT)}
+        board = []
+        for row in range(view.num_rows):
+            line = ''.join(view.screen.lines[row + 2])
+            board.append([codes[line[1 + 2 * c:3 + 2 * c]] for c in range(view.num_cols)])
+        return board
+
+    def test_screen_follows_model(self):
+        game, view = self.make_game()
+        game.GameState = Snake.GameState.Playing
+        game.time_elapsed = 1
+        game.wraparound_handler()
+        for i in range(200):
+            view.screen.writes = 0
+            view.key(curses.KEY_UP if i % 9 < 4 else curses.KEY_LEFT)
+            game.one_step()
+            # A tick writes a few cells and the labels, not the board
+            self.assertLessEqual(view.screen.writes, 3)
+            view.draw_labels()
+            if game.GameState != Snake.GameState.Playing:
+                break
+            model = game.model
+            for row, line in enumerate(self.board(view)):
+                for col, code in enumerate(line):
+                    cell = model.grid[row * model.num_cols + col]
+                    if (row, col) == model.snake[-1]:
+                        self.assertEqual(code, HEAD)
+                    else:
+                        self.assertEqual(code, (EMPTY, BODY, FOOD)[cell])
+        #the seed makes the snake eat, so those ticks are covered too
+        self.assertGreater(game.model.points_earned, 0)
+
+    def test_keys(self):
+        game, view = self.make_game()
+        calls = []
+        view.set_start_handler(lambda: calls.append('start'))
+        view.set_step_speed_handler(lambda value: calls.append(value))
+        view.key(ord('s'))
+        view.key(ord('0'))
+        view.key(ord('3'))
+        self.assertEqual(calls, ['start', 10, 3])
+        view.key(ord('r'))
+        self.assertEqual(sum(code != EMPTY for code in view.shown), 2)
+
+if __name__ == "__main__":
+    main()
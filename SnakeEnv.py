@@ -0,0 +1,211 @@
+"""
+Module: SnakeEnv
+
+Description:
+Reinforcement learning environments for the snake game, following the
+classic Gym interface: reset(seed) returns an observation and step(action)
+returns (observation, reward, done, info).  The reward is the change in
+points_earned, and done is set when the model raises GameOver or the step
+limit is reached.  gym itself is not needed.
+
+Observations are never built per step.  SnakeEnv returns a read-only NumPy
+view of the model's grid, one CellState byte per cell, so the same array
+changes in place as the game goes on; copy it to keep an old observation.
+SnakeVectorEnv runs many games in lockstep on top of SnakeBatch.BatchSnake
+and likewise returns a view of its boards, resetting finished games
+automatically.
+
+Actions are DirectionState values; -1 keeps going straight.
+"""
+import random as rand
+import unittest
+import numpy as np
+
+from Snake import SnakeModel, GameOver, DirectionState, Mode, SNAKE, FOOD
+from SnakeBatch import BatchSnake
+
+class SnakeEnv:
+    """ One snake game on a num_rows x num_cols board """
+
+    num_actions = 4
+
+    def __init__(self, num_rows = 30, num_cols = 30, mode = Mode.Norm,
+                 max_steps = None, death_reward = 0.0):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.mode = mode
+        self.max_steps = max_steps
+        self.death_reward = death_reward
+        self.observation_shape = (num_rows, num_cols)
+        self.rng = rand.Random()
+        self.model = SnakeModel(num_rows, num_cols)
+        self.obs = np.frombuffer(self.model.grid, dtype = np.uint8).reshape(num_rows, num_cols)
+        self.obs.flags.writeable = False
+        self.steps = 0
+        self.done = True
+
+    def reset(self, seed = None):
+        """ Start a new game, seeded for reproducibility if seed is given.
+        The model is restarted in place, so the observation array stays the
+        same object and only the cells of the last game are cleared. """
+        if seed is None:
+            seed = self.rng.randrange(2**63)
+        self.model.restart(seed)
+        self.model.mode = self.mode
+        self.steps = 0
+        self.done = False
+        return self.obs
+
+    def info(self):
+        model = self.model
+        return dict(head = divmod(model.body.head, self.num_cols),
+                    direction = model.direction, score = model.points_earned,
+                    steps = self.steps)
+
+    def step(self, action):
+        if self.done:
+            raise RuntimeError('the game is over, call reset()')
+        model = self.model
+        if action is not None and action >= 0:
+            model.turn(DirectionState(action))
+        points = model.points_earned
+        try:
+            model.one_step()
+        except GameOver as end:
+            self.done = True
+            info = self.info()
+            info['cause'] = str(end)
+            return self.obs, model.points_earned - points + self.death_reward, True, info
+        self.steps += 1
+        info = self.info()
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            self.done = True
+            info['truncated'] = True
+        return self.obs, model.points_earned - points, self.done, info
+
+class SnakeVectorEnv:
+    """
+    num_envs games stepped together.  step(actions) takes one action per
+    game and returns (observations, rewards, dones, info) as arrays; games
+    that finish are reset at once, so their observation is already the
+    start of the next game and info['final_score'] holds the score they
+    ended with.
+    """
+
+    num_actions = 4
+
+    def __init__(self, num_envs, num_rows = 30, num_cols = 30, mode = Mode.Norm,
+                 max_steps = None, death_reward = 0.0, seed = None):
+        self.num_envs = num_envs
+        self.max_steps = max_steps
+        self.death_reward = death_reward
+        self.observation_shape = (num_envs, num_rows, num_cols)
+        self.batch = BatchSnake(num_envs, num_rows, num_cols, mode, seed)
+        self.obs = self.batch.boards.reshape(self.observation_shape)
+        self.obs.flags.writeable = False
+        self.rewards = np.zeros(num_envs, dtype = np.float64)
+
+    def reset(self, seed = None):
+        batch = self.batch
+        if seed is not None:
+            batch.rng = np.random.default_rng(seed)
+        batch.reset_games(batch.games)
+        return self.obs
+
+    def step(self, actions):
+        batch = self.batch
+        before = batch.score.copy()
+        done, final_score = batch.step(actions)
+        truncated = np.zeros_like(done)
+        if self.max_steps is not None:
+            truncated = batch.steps >= self.max_steps
+            if truncated.any():
+                final_score = np.where(truncated, batch.score, final_score)
+                batch.reset_games(batch.games[truncated])
+        rewards = self.rewards
+        #finished games were reset, their last reward comes from final_score
+        np.subtract(np.where(done | truncated, final_score, batch.score), before, out = rewards)
+        if self.death_reward:
+            rewards[done] += self.death_reward
+        dones = done | truncated
+        return self.obs, rewards, dones, dict(final_score = final_score,
+                                              truncated = truncated)
+
+def rollout(env, steps, seed = 0):
+    """ Step env with random actions, returns the total reward, for
+    measuring env loop throughput """
+    rng = np.random.default_rng(seed)
+    total = 0.0
+    if isinstance(env, SnakeVectorEnv):
+        env.reset(seed)
+        for i in range(steps):
+            obs, rewards, dones, info = env.step(rng.integers(-1, 4, size = env.num_envs))
+            total += rewards.sum()
+        return total
+    env.reset(seed)
+    actions = rng.integers(-1, 4, size = steps).tolist()
+    for action in actions:
+        obs, reward, done, info = env.step(action)
+        total += reward
+        if done:
+            env.reset()
+    return total
+
+class SnakeEnvTest(unittest.TestCase):
+    def test_zero_copy(self):
+        env = SnakeEnv(10, 10, Mode.Wrap)
+        obs = env.reset(seed = 3)
+        grid = env.model.grid
+        for i in range(200):
+            new_obs, reward, done, info = env.step(i % 7 % 4)
+            # The same array, always showing the current board
+            self.assertIs(new_obs, obs)
+            self.assertEqual(obs.tobytes(), bytes(env.model.grid))
+            self.assertEqual(obs[info['head']], SNAKE)
+            if done:
+                self.assertIs(env.reset(), obs)
+                self.assertIs(env.model.grid, grid)
+        self.assertFalse(obs.flags.writeable)
+
+    def test_rewards(self):
+        env = SnakeEnv(6, 6, max_steps = 500)
+        for seed in range(10):
+            env.reset(seed)
+            model = SnakeModel(6, 6, seed)
+            total = 0
+            done = False
+            while not done:
+                obs, reward, done, info = env.step(seed % 4)
+                total += reward
+                model.turn(DirectionState(seed % 4))
+                try:
+                    model.one_step()
+                except GameOver as end:
+                    self.assertEqual(info['cause'], str(end))
+            self.assertEqual(total, model.points_earned)
+            self.assertEqual(obs.tobytes(), bytes(model.grid))
+            with self.assertRaises(RuntimeError):
+                env.step(0)
+
+class SnakeVectorEnvTest(unittest.TestCase):
+    def test_step(self):
+        env = SnakeVectorEnv(32, 6, 6, Mode.Wrap, max_steps = 50, seed = 1)
+        obs = env.reset()
+        rng = np.random.default_rng(2)
+        totals = np.zeros(32)
+        finished = []
+        for i in range(300):
+            new_obs, rewards, dones, info = env.step(rng.integers(-1, 4, size = 32))
+            self.assertIs(new_obs, obs)
+            totals += rewards
+            for game in np.flatnonzero(dones):
+                # The rewards of a game add up to its final score
+                self.assertEqual(totals[game], info['final_score'][game])
+                finished.append(totals[game])
+                totals[game] = 0
+            self.assertTrue(((obs == FOOD).sum(axis = (1, 2)) == 1).all())
+        self.assertTrue((env.batch.steps <= 50).all())
+        self.assertGreater(len(finished), 32)
+
+if __name__ == "__main__":
+    unittest.main()
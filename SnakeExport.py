@@ -0,0 +1,635 @@
+"""
+Module: SnakeExport
+
+Description:
+Turns headless games and replays into images without a display: PNG
+image sequences, animated PNG or GIF.  A FrameRenderer rasterizes the
+board in the colors SnakeView uses (blue body, black head, red food, white
+empty, black cell outlines once cells are big enough to show them) into one
+palette-indexed pixel buffer that is reused for every frame.  Only cells
+that changed since the last frame are repainted, and the animated formats
+only store the rectangle of pixels that changed, so a frame costs about as
+much as the cells the snake touched.
+
+Only the standard library is needed: PNG data is zlib compressed and GIF
+data goes through a small LZW encoder.  export_many spreads jobs over a
+process pool, one game or replay per job.
+
+Usage:
+    python SnakeExport.py --replays games/*.snkr --format gif --output frames
+    python SnakeExport.py --seeds 8 --size 30 --policy greedy --format apng
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+import random as rand
+import struct
+import tempfile
+import time
+import unittest
+import zlib
+
+from Snake import SnakeEngine, Mode, NOTHING, SNAKE, FOOD
+
+#palette indices, and the colors SnakeView paints them in
+WHITE = 0
+BLUE = 1
+RED = 2
+BLACK = 3
+PALETTE = [(255, 255, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0)]
+#pixel color of each model cell state, head drawn separately
+CELL_COLORS = {NOTHING: WHITE, SNAKE: BLUE, FOOD: RED}
+
+class FrameRenderer:
+    """
+    Pixel buffer of a num_rows x num_cols board, one palette index byte per
+    pixel, cell_size pixels per cell.  Call sync() or apply() to bring it
+    up to date, then take_dirty() for the rectangle that changed.
+    """
+
+    def __init__(self, num_rows, num_cols, cell_size = 4):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cell_size = cell_size
+        self.width = num_cols * cell_size
+        self.height = num_rows * cell_size
+        self.pixels = bytearray(self.width * self.height)
+        #palette index shown in each cell, and the cell drawn as the head
+        self.shown = bytearray(num_rows * num_cols)
+        self.head = -1
+        self.dirty = None
+        #the rows of pixels making up a cell of each color
+        outline = cell_size >= 6
+        self.patterns = []
+        for color in range(len(PALETTE)):
+            if outline:
+                edge = bytes([BLACK]) * cell_size
+                inner = bytes([BLACK]) + bytes([color]) * (cell_size - 2) + bytes([BLACK])
+                rows = [edge] + [inner] * (cell_size - 2) + [edge]
+            else:
+                rows = [bytes([color]) * cell_size] * cell_size
+            self.patterns.append(rows)
+        self.clear()
+
+    def clear(self):
+        """ Blank the board and mark all of it as changed """
+        rows = self.patterns[WHITE]
+        line = b''.join([rows[1 % self.cell_size]] * self.num_cols)
+        edge = b''.join([rows[0]] * self.num_cols)
+        block = b''.join(edge if r in (0, self.cell_size - 1) else line
+                         for r in range(self.cell_size))
+        self.pixels[:] = block * self.num_rows
+        self.shown[:] = bytes(len(self.shown))
+        self.head = -1
+        self.dirty = (0, 0, self.num_rows - 1, self.num_cols - 1)
+
+    def paint(self, cell, color):
+        """ Set one cell to a palette color, if it is not that color already """
+        if self.shown[cell] == color:
+            return
+        self.shown[cell] = color
+        row, col = divmod(cell, self.num_cols)
+        size = self.cell_size
+        width = self.width
+        start = row * size * width + col * size
+        for line in self.patterns[color]:
+            self.pixels[start:start + size] = line
+            start += width
+        if self.dirty is None:
+            self.dirty = (row, col, row, col)
+        else:
+            top, left, bottom, right = self.dirty
+            self.dirty = (min(top, row), min(left, col), max(bottom, row), max(right, col))
+
+    def set_head(self, head):
+        if head != self.head:
+            if self.head >= 0 and self.shown[self.head] == BLACK:
+                self.paint(self.head, BLUE)
+            self.head = head
+            self.paint(head, BLACK)
+
+    def apply(self, delta):
+        """ Paint the cells of a StepDelta """
+        cols = self.num_cols
+        for row, col, cell in delta.changes:
+            self.paint(row * cols + col, CELL_COLORS[cell])
+        self.set_head(delta.new_head[0] * cols + delta.new_head[1])
+
+    def sync(self, grid, head):
+        """ Repaint whatever differs from a flat grid of cell states and a
+        head cell.  Rows are compared whole first, so unchanged rows cost
+        one comparison. """
+        cols = self.num_cols
+        expected = grid.translate(CELL_TABLE)
+        if 0 <= self.head < len(expected) and expected[self.head] == BLUE:
+            #keep the old head black until set_head moves it
+            expected = bytearray(expected)
+            expected[self.head] = BLACK
+        shown = self.shown
+        for start in range(0, len(shown), cols):
+            if expected[start:start + cols] != shown[start:start + cols]:
+                for cell in range(start, start + cols):
+                    if expected[cell] != shown[cell]:
+                        self.paint(cell, expected[cell])
+        self.set_head(head)
+
+    def take_dirty(self):
+        """ The changed rectangle in pixels as (x, y, width, height, data),
+        data being its rows of palette indices, or None if nothing changed """
+        if self.dirty is None:
+            return None
+        top, left, bottom, right = self.dirty
+        self.dirty = None
+        size = self.cell_size
+        x, y = left * size, top * size
+        w, h = (right - left + 1) * size, (bottom - top + 1) * size
+        return (x, y, w, h, self.region(x, y, w, h))
+
+    def region(self, x, y, w, h):
+        width = self.width
+        pixels = self.pixels
+        return b''.join(pixels[(y + r) * width + x:(y + r) * width + x + w] for r in range(h))
+
+CELL_TABLE = bytes(CELL_COLORS.get(i, WHITE) for i in range(256))
+
+def png_chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data +
+            struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+def png_data(w, h, data):
+    """ zlib stream of indexed rows, each with filter type 0 """
+    rows = b''.join(b'\0' + data[r * w:(r + 1) * w] for r in range(h))
+    return zlib.compress(rows, 6)
+
+def png_header(width, height):
+    return (b'\x89PNG\r\n\x1a\n' +
+            png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)) +
+            png_chunk(b'PLTE', bytes(c for color in PALETTE for c in color)))
+
+class PNGSequenceWriter:
+    """ Every frame as a complete indexed PNG in directory """
+
+    def __init__(self, directory, renderer, delay = 100, prefix = 'frame'):
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.renderer = renderer
+        self.prefix = prefix
+        self.frames = 0
+
+    def add_frame(self):
+        renderer = self.renderer
+        renderer.take_dirty()
+        path = os.path.join(self.directory, '%s_%06d.png' % (self.prefix, self.frames))
+        with open(path, 'wb') as f:
+            f.write(png_header(renderer.width, renderer.height) +
+                    png_chunk(b'IDAT', png_data(renderer.width, renderer.height,
+                                                renderer.pixels)) +
+                    png_chunk(b'IEND', b''))
+        self.frames += 1
+
+    def close(self):
+        pass
+
+class APNGWriter:
+    """ An animated PNG, each frame after the first holding only the
+    rectangle that changed; delay is in milliseconds """
+
+    def __init__(self, path, renderer, delay = 100):
+        self.renderer = renderer
+        self.delay = delay
+        self.file = open(path, 'wb')
+        self.file.write(png_header(renderer.width, renderer.height))
+        #frame count is patched in by close()
+        self.actl_offset = self.file.tell()
+        self.file.write(png_chunk(b'acTL', struct.pack('>II', 0, 0)))
+        self.frames = 0
+        self.sequence = 0
+
+    def fctl(self, x, y, w, h):
+        data = struct.pack('>IIIIIHHBB', self.sequence, w, h, x, y, self.delay, 1000, 0, 0)
+        self.sequence += 1
+        return png_chunk(b'fcTL', data)
+
+    def add_frame(self):
+        renderer = self.renderer
+        dirty = renderer.take_dirty()
+        if self.frames == 0:
+            out = self.fctl(0, 0, renderer.width, renderer.height)
+            out += png_chunk(b'IDAT', png_data(renderer.width, renderer.height,
+                                               renderer.pixels))
+        else:
+            if dirty is None:
+                dirty = (0, 0, 1, 1, renderer.region(0, 0, 1, 1))
+            x, y, w, h, data = dirty
+            out = self.fctl(x, y, w, h)
+            out += png_chunk(b'fdAT', struct.pack('>I', self.sequence) + png_data(w, h, data))
+            self.sequence += 1
+        self.file.write(out)
+        self.frames += 1
+
+    def close(self):
+        self.file.write(png_chunk(b'IEND', b''))
+        self.file.seek(self.actl_offset)
+        self.file.write(png_chunk(b'acTL', struct.pack('>II', self.frames, 0)))
+        self.file.close()
+
+def lzw_encode(data, min_code_size = 2):
+    """ GIF flavoured LZW compression of palette indices """
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    bits = 0
+    nbits = 0
+    code_size = min_code_size + 1
+    table = {}
+    next_code = end + 1
+
+    def emit(code, code_size):
+        nonlocal bits, nbits
+        bits |= code << nbits
+        nbits += code_size
+        while nbits >= 8:
+            out.append(bits & 0xff)
+            bits >>= 8
+            nbits -= 8
+
+    emit(clear, code_size)
+    if data:
+        prefix = data[0]
+        for byte in data[1:]:
+            key = (prefix << 8) | byte
+            code = table.get(key)
+            if code is not None:
+                prefix = code
+                continue
+            emit(prefix, code_size)
+            if next_code < 4096:
+                table[key] = next_code
+                next_code += 1
+                if next_code > (1 << code_size) and code_size < 12:
+                    code_size += 1
+            else:
+                emit(clear, code_size)
+                table = {}
+                next_code = end + 1
+                code_size = min_code_size + 1
+            prefix = byte
+        emit(prefix, code_size)
+    emit(end, code_size)
+    if nbits:
+        out.append(bits & 0xff)
+    return bytes(out)
+
+class GIFWriter:
+    """ An animated GIF, each frame after the first holding only the
+    rectangle that changed; delay is in milliseconds """
+
+    def __init__(self, path, renderer, delay = 100):
+        self.renderer = renderer
+        self.delay = max(1, delay // 10)
+        self.file = open(path, 'wb')
+        #global color table of 4 entries, then loop forever
+        self.file.write(b'GIF89a' + struct.pack('<HHBBB', renderer.width, renderer.height,
+                                                0xf1, 0, 0) +
+                        bytes(c for color in PALETTE for c in color) +
+                        b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+        self.frames = 0
+
+    def add_frame(self):
+        renderer = self.renderer
+        dirty = renderer.take_dirty()
+        if self.frames == 0:
+            dirty = (0, 0, renderer.width, renderer.height, bytes(renderer.pixels))
+        elif dirty is None:
+            dirty = (0, 0, 1, 1, renderer.region(0, 0, 1, 1))
+        x, y, w, h, data = dirty
+        #graphic control: leave the frame in place, then the image itself
+        out = bytearray(b'!\xf9\x04\x04' + struct.pack('<H', self.delay) + b'\x00\x00')
+        out += b',' + struct.pack('<HHHHB', x, y, w, h, 0) + b'\x02'
+        compressed = lzw_encode(data)
+        for i in range(0, len(compressed), 255):
+            block = compressed[i:i + 255]
+            out.append(len(block))
+            out += block
+        out.append(0)
+        self.file.write(out)
+        self.frames += 1
+
+    def close(self):
+        self.file.write(b';')
+        self.file.close()
+
+WRITERS = {'png': PNGSequenceWriter, 'apng': APNGWriter, 'gif': GIFWriter}
+EXTENSIONS = {'png': '', 'apng': '.png', 'gif': '.gif'}
+
+ExportJob = collections.namedtuple('ExportJob',
+        ['source', 'output', 'format', 'cell_size', 'delay', 'every', 'max_frames'])
+ExportJob.__doc__ = """ One game to export: source is a replay file path or a
+SnakeTournament.GameSpec to play; every frame shows every'th tick """
+ExportJob.__new__.__defaults__ = ('gif', 4, 100, 1, 10000)
+
+def render_game(spec, writer, renderer, every = 1, max_frames = 10000):
+    """ Play the game of a GameSpec as SnakeTournament.play_game does,
+    adding a frame every every ticks; returns the number of frames """
+    from SnakeTournament import make_policy
+    engine = SnakeEngine(spec.num_rows, spec.num_cols, Mode(spec.mode), spec.seed)
+    policy = make_policy(spec.policy)
+    policy_rng = rand.Random('policy-%d' % spec.seed)
+    renderer.sync(engine.model.grid, engine.model.body.head)
+    writer.add_frame()
+    while engine.steps < spec.max_steps and writer.frames < max_frames:
+        direction = policy(engine.model, policy_rng)
+        if direction is not None:
+            engine.set_direction(direction)
+        delta = engine.step()
+        if delta is None:
+            break
+        renderer.apply(delta)
+        if engine.steps % every == 0:
+            writer.add_frame()
+    if renderer.dirty is not None and writer.frames < max_frames:
+        writer.add_frame()
+    return writer.frames
+
+def render_replay(replay, writer, renderer, every = 1, max_frames = 10000):
+    """ Re-simulate a SnakeReplay.Replay, adding a frame every every ticks;
+    returns the number of frames """
+    model = replay.initial_model()
+    renderer.sync(model.grid, model.body.head)
+    writer.add_frame()
+    on_step = lambda tick, model, delta: renderer.apply(delta)
+    last = replay.last_tick()
+    tick = 0
+    while writer.frames < max_frames and tick < last:
+        reached = replay.simulate(model, tick, min(tick + every, last), on_step)
+        if reached == tick:
+            break
+        tick = reached
+        writer.add_frame()
+    return writer.frames
+
+def export(job):
+    """ Run one ExportJob, returns (output, frames, seconds) """
+    start = time.perf_counter()
+    if isinstance(job.source, str):
+        from SnakeReplay import Replay
+        replay = Replay.load(job.source)
+        num_rows, num_cols = replay.num_rows, replay.num_cols
+    else:
+        replay = None
+        num_rows, num_cols = job.source.num_rows, job.source.num_cols
+    renderer = FrameRenderer(num_rows, num_cols, job.cell_size)
+    writer = WRITERS[job.format](job.output, renderer, job.delay)
+    try:
+        if replay is not None:
+            frames = render_replay(replay, writer, renderer, job.every, job.max_frames)
+        else:
+            frames = render_game(job.source, writer, renderer, job.every, job.max_frames)
+    finally:
+        writer.close()
+    return job.output, frames, time.perf_counter() - start
+
+def export_many(jobs, workers = None):
+    """ Run ExportJobs across a process pool, yielding export() results
+    as they finish """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            yield export(job)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        for future in concurrent.futures.as_completed([pool.submit(export, job)
+                                                       for job in jobs]):
+            yield future.result()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Export snake games as images')
+    parser.add_argument('--replays', nargs = '*', default = [], help = 'replay files to export')
+    parser.add_argument('--seeds', type = int, default = 0, help = 'headless games to play')
+    parser.add_argument('--size', type = int, default = 30)
+    parser.add_argument('--mode', default = 'Norm', choices = [mode.name for mode in Mode])
+    parser.add_argument('--policy', default = 'greedy')
+    parser.add_argument('--max-steps', type = int, default = 5000)
+    parser.add_argument('--format', default = 'gif', choices = sorted(WRITERS))
+    parser.add_argument('--cell-size', type = int, default = 4)
+    parser.add_argument('--delay', type = int, default = 100, help = 'ms per frame')
+    parser.add_argument('--every', type = int, default = 1, help = 'ticks per frame')
+    parser.add_argument('--output', default = 'export')
+    parser.add_argument('--workers', type = int, default = None)
+    args = parser.parse_args(argv)
+
+    from SnakeTournament import make_specs
+    os.makedirs(args.output, exist_ok = True)
+    sources = list(args.replays)
+    sources += make_specs(range(args.seeds), [(args.size, args.size)], [Mode[args.mode]],
+                          [args.policy], args.max_steps)
+    jobs = []
+    for source in sources:
+        if isinstance(source, str):
+            name = os.path.splitext(os.path.basename(source))[0]
+        else:
+            name = 'game-%d' % source.seed
+        jobs.append(ExportJob(source, os.path.join(args.output, name + EXTENSIONS[args.format]),
+                              args.format, args.cell_size, args.delay, args.every))
+    start = time.perf_counter()
+    total = 0
+    for output, frames, seconds in export_many(jobs, args.workers):
+        total += frames
+        print('%s: %d frames in %.2fs' % (output, frames, seconds))
+    elapsed = time.perf_counter() - start
+    print('%d frames in %.2fs, %.0f frames/s' % (total, elapsed, total / elapsed if elapsed else 0))
+
+def lzw_decode(data, min_code_size = 2):
+    """ Inverse of lzw_encode, for tests """
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    pos = bits = nbits = 0
+    code_size = min_code_size + 1
+    table = None
+    previous = None
+    while True:
+        while nbits < code_size:
+            bits |= data[pos] << nbits
+            pos += 1
+            nbits += 8
+        code = bits & ((1 << code_size) - 1)
+        bits >>= code_size
+        nbits -= code_size
+        if code == clear:
+            table = [bytes([i]) for i in range(clear)] + [b'', b'']
+            code_size = min_code_size + 1
+            previous = None
+            continue
+        if code == end:
+            return bytes(out)
+        if code < len(table):
+            entry = table[code]
+            if previous is not None:
+                table.append(previous + entry[:1])
+        else:
+            entry = previous + previous[:1]
+            table.append(entry)
+        out += entry
+        previous = entry
+        if len(table) == (1 << code_size) and code_size < 12:
+            code_size += 1
+
+def read_chunks(data):
+    pos = 8
+    while pos < len(data):
+        length, kind = struct.unpack_from('>I4s', data, pos)
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+class FrameRendererTest(unittest.TestCase):
+    def test_incremental_matches_full(self):
+        # Applying deltas gives the same pixels as painting the board afresh
+        for cell_size in (1, 3, 8):
+            engine = SnakeEngine(9, 11, Mode.Wrap, 4)
+            renderer = FrameRenderer(9, 11, cell_size)
+            renderer.sync(engine.model.grid, engine.model.body.head)
+            rng = rand.Random(0)
+            for i in range(300):
+                engine.set_direction(rng.randrange(4))
+                delta = engine.step()
+                if delta is None:
+                    break
+                renderer.apply(delta)
+                if i % 37 == 0:
+                    fresh = FrameRenderer(9, 11, cell_size)
+                    fresh.sync(engine.model.grid, engine.model.body.head)
+                    self.assertEqual(renderer.pixels, fresh.pixels)
+            x, y, w, h, data = renderer.take_dirty() or (0, 0, 0, 0, b'')
+            self.assertLessEqual(w * h, len(renderer.pixels))
+            self.assertIsNone(renderer.take_dirty())
+
+    def test_lzw(self):
+        rng = rand.Random(1)
+        for data in (b'', b'\0', bytes(5000), bytes(rng.randrange(4) for i in range(20000))):
+            self.assertEqual(lzw_decode(lzw_encode(data)), data)
+
+class SnakeExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def play(self, format):
+        from SnakeTournament import GameSpec
+        spec = GameSpec(0, 3, 8, 10, int(Mode.Norm), 'greedy', 200)
+        path = os.path.join(self.directory.name, 'game' + EXTENSIONS[format])
+        renderer = FrameRenderer(8, 10, 6)
+        writer = WRITERS[format](path, renderer)
+        frames = render_game(spec, writer, renderer)
+        writer.close()
+        return path, frames, renderer
+
+    def test_apng(self):
+        # Composing the stored rectangles rebuilds the last frame
+        path, frames, renderer = self.play('apng')
+        with open(path, 'rb') as f:
+            data = f.read()
+        canvas = None
+        count = 0
+        for kind, body in read_chunks(data):
+            if kind == b'acTL':
+                self.assertEqual(struct.unpack('>I', body[:4])[0], frames)
+            elif kind == b'fcTL':
+                w, h, x, y = struct.unpack_from('>IIII', body, 4)
+                count += 1
+            elif kind in (b'IDAT', b'fdAT'):
+                raw = zlib.decompress(body if kind == b'IDAT' else body[4:])
+                if canvas is None:
+                    canvas = bytearray(renderer.width * renderer.height)
+                for r in range(h):
+                    row = raw[r * (w + 1) + 1:(r + 1) * (w + 1)]
+                    start = (y + r) * renderer.width + x
+                    canvas[start:start + w] = row
+        self.assertEqual(count, frames)
+        self.assertEqual(canvas, renderer.pixels)
+
+    def test_gif(self):
+        path, frames, renderer = self.play('gif')
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'GIF89a') and data.endswith(b';'))
+        pos = 13 + 12 + 19
+        canvas = bytearray(renderer.width * renderer.height)
+        count = 0
+        while data[pos] != 0x3b:
+            if data[pos] == 0x21:
+                pos += 2
+                while data[pos]:
+                    pos += data[pos] + 1
+                pos += 1
+                continue
+            x, y, w, h = struct.unpack_from('<HHHH', data, pos + 1)
+            pos += 11
+            compressed = bytearray()
+            while data[pos]:
+                compressed += data[pos + 1:pos + 1 + data[pos]]
+                pos += data[pos] + 1
+            pos += 1
+            raw = lzw_decode(bytes(compressed))
+            for r in range(h):
+                start = (y + r) * renderer.width + x
+                canvas[start:start + w] = raw[r * w:(r + 1) * w]
+            count += 1
+        self.assertEqual(count, frames)
+        self.assertEqual(canvas, renderer.pixels)
+
+    def test_render_replay(self):
+        # Replays are painted from their deltas and stop at the recorded end
+        from SnakeReplay import Replay, ReplayRecorder
+        engine = SnakeEngine(10, 10, Mode.Wrap, 2)
+        recorder = ReplayRecorder(engine.model, 2)
+        for i in range(30):
+            engine.step()
+            recorder.record_step()
+        recorder.finish()
+        replay = Replay(recorder.to_bytes())
+        renderer = FrameRenderer(10, 10, 2)
+        frames = []
+        class Writer:
+            frames = 0
+            def add_frame(self):
+                self.frames += 1
+                frames.append(bytes(renderer.pixels))
+        syncs = []
+        sync = renderer.sync
+        renderer.sync = lambda grid, head: syncs.append(head) or sync(grid, head)
+        #the first frame and every 4 ticks up to tick 28, then tick 30
+        self.assertEqual(render_replay(replay, Writer(), renderer, every = 4), 9)
+        self.assertEqual(len(syncs), 1)
+        expected = FrameRenderer(10, 10, 2)
+        expected.sync(engine.model.grid, engine.model.body.head)
+        self.assertEqual(frames[-1], bytes(expected.pixels))
+
+    def test_export_many(self):
+        from SnakeTournament import make_specs
+        from SnakeReplay import ReplayRecorder
+        engine = SnakeEngine(10, 10, Mode.Norm, 7)
+        recorder = ReplayRecorder(engine.model, 7)
+        while engine.step() is not None:
+            recorder.record_step()
+        recorder.finish(engine.cause)
+        replay_path = os.path.join(self.directory.name, 'game.snkr')
+        recorder.save(replay_path)
+        jobs = [ExportJob(replay_path, os.path.join(self.directory.name, 'replay'), 'png')]
+        for spec in make_specs(range(3), [(10, 10)], [Mode.Norm], ['greedy'], 100):
+            jobs.append(ExportJob(spec, os.path.join(self.directory.name,
+                                                     'game-%d.gif' % spec.seed)))
+        results = sorted(export_many(jobs, workers = 2))
+        self.assertEqual(len(results), 4)
+        frames = dict((output, frames) for output, frames, seconds in results)
+        replay_frames = frames[os.path.join(self.directory.name, 'replay')]
+        self.assertEqual(replay_frames, engine.steps + 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory.name, 'replay'))),
+                         replay_frames)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Module: SnakeProfile
+
+Description:
+Per-phase tick profiling for the snake game.  A TickProfiler times the
+phases of each tick (input handling, model step, food placement, view
+update, label updates, scheduling delay) into LatencyHistograms, which use
+a fixed set of logarithmic buckets so memory stays bounded however long the
+game runs.  Results can be dumped on demand or written to a file
+periodically.
+
+Profiling is off unless a profiler is attached; the controller only checks
+for None when it is not, so the disabled cost is a few attribute tests per
+tick.
+"""
+import json
+import math
+import time
+import unittest
+
+class LatencyHistogram:
+    """
+    Histogram of durations in seconds with logarithmic buckets, each
+    bucket 2**(1/resolution) wider than the last, between min_value and
+    max_value.  Percentiles are accurate to within one bucket width.
+    """
+
+    def __init__(self, min_value = 1e-7, max_value = 100.0, resolution = 16):
+        self.min_value = min_value
+        self.resolution = resolution
+        self.log_min = math.log2(min_value)
+        self.num_buckets = int(math.ceil((math.log2(max_value) - self.log_min) * resolution)) + 1
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def bucket(self, value):
+        if value <= self.min_value:
+            return 0
+        index = int((math.log2(value) - self.log_min) * self.resolution)
+        return min(index, self.num_buckets - 1)
+
+    def record(self, value):
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def bucket_value(self, index):
+        """ Upper edge of a bucket """
+        return 2 ** (self.log_min + (index + 1) / self.resolution)
+
+    def percentile(self, p):
+        """ Value below which p percent of the recorded durations fall """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """ count, mean and percentiles in milliseconds """
+        return dict(count = self.count,
+                    mean_ms = 1000 * self.total / self.count if self.count else 0.0,
+                    p50_ms = 1000 * self.percentile(50),
+                    p95_ms = 1000 * self.percentile(95),
+                    p99_ms = 1000 * self.percentile(99),
+                    max_ms = 1000 * self.max)
+
+class TickProfiler:
+    """
+    Times the phases of every tick.  Callers take a start time with
+    clock() and call lap(phase, start), which records the time since start
+    and returns the current time for the next phase.
+    """
+
+    PHASES = ('input', 'model_step', 'food', 'view_update', 'label_update',
+              'schedule_delay', 'tick')
+
+    def __init__(self, path = None, interval = 10.0, clock = time.perf_counter):
+        """ path and interval set up periodic writes of the summary """
+        self.clock = clock
+        self.path = path
+        self.interval = interval
+        self.histograms = {phase: LatencyHistogram() for phase in self.PHASES}
+        self.last_write = clock()
+
+    def lap(self, phase, start):
+        now = self.clock()
+        self.record(phase, now - start)
+        return now
+
+    def record(self, phase, duration):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = LatencyHistogram()
+        histogram.record(duration)
+
+    def instrument(self, obj, method, phase):
+        """ Wrap obj.method so each call is timed as phase """
+        original = getattr(obj, method)
+        clock = self.clock
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(phase, clock() - start)
+        setattr(obj, method, timed)
+
+    def end_tick(self, start):
+        """ Record the whole tick and write the summary if it is due """
+        now = self.lap('tick', start)
+        if self.path is not None and now - self.last_write >= self.interval:
+            self.write()
+        return now
+
+    def summary(self):
+        return {phase: histogram.summary()
+                for phase, histogram in self.histograms.items() if histogram.count}
+
+    def report(self):
+        """ Summary as an aligned text table """
+        lines = ['%-15s %8s %9s %9s %9s %9s %9s' % ('phase', 'count', 'mean', 'p50',
+                                                   'p95', 'p99', 'max (ms)')]
+        for phase, stats in self.summary().items():
+            lines.append('%-15s %8d %9.3f %9.3f %9.3f %9.3f %9.3f' % (phase,
+                         stats['count'], stats['mean_ms'], stats['p50_ms'],
+                         stats['p95_ms'], stats['p99_ms'], stats['max_ms']))
+        return '\n'.join(lines)
+
+    def write(self, path = None):
+        """ Write the summary as JSON """
+        with open(path or self.path, 'w') as f:
+            json.dump(dict(time = time.time(), phases = self.summary()), f, indent = 1)
+        self.last_write = self.clock()
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1e6)       #1us to 1ms
+        width = 2 ** (1 / histogram.resolution)
+        for p in (50, 95, 99):
+            expected = p / 1e5
+            self.assertLessEqual(histogram.percentile(p), expected * width)
+            self.assertGreaterEqual(histogram.percentile(p), expected / width)
+        self.assertEqual(histogram.max, 1e-3)
+        self.assertEqual(histogram.percentile(100), 1e-3)
+
+    def test_bounded(self):
+        histogram = LatencyHistogram()
+        buckets = len(histogram.counts)
+        for value in (0, 1e-12, 5.0, 1e6):
+            histogram.record(value)
+        self.assertEqual(len(histogram.counts), buckets)
+        self.assertEqual(histogram.count, 4)
+
+class TickProfilerTest(unittest.TestCase):
+    def test_phases(self):
+        now = [0.0]
+        profiler = TickProfiler(clock = lambda: now[0])
+        class Model:
+            def place_food(self):
+                now[0] += 0.001
+                return 7
+        model = Model()
+        profiler.instrument(model, 'place_food', 'food')
+        start = profiler.clock()
+        self.assertEqual(model.place_food(), 7)
+        t = profiler.lap('model_step', start)
+        now[0] += 0.002
+        profiler.lap('view_update', t)
+        profiler.end_tick(start)
+        summary = profiler.summary()
+        self.assertAlmostEqual(summary['food']['max_ms'], 1.0)
+        self.assertAlmostEqual(summary['view_update']['max_ms'], 2.0)
+        self.assertAlmostEqual(summary['tick']['max_ms'], 3.0)
+        self.assertIn('view_update', profiler.report())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,417 @@
+"""
+Module: SnakeReplay
+
+Description:
+Compact replays of snake games.  A replay stores the seed, board size and
+starting mode of a game and then only the inputs: direction and mode
+changes, each tagged with the number of ticks since the previous one.
+Since a seeded SnakeModel is deterministic that is enough to rebuild the
+whole game.  Keyframe snapshots of the full model are stored every
+keyframe_interval ticks so a replay can seek to any tick by restoring the
+nearest keyframe and simulating at most keyframe_interval steps.  The
+interval grows with the board, so encoding keyframes costs about the same
+per tick whatever the board size.
+
+File layout, all integers little-endian:
+    header      magic 'SNKR', version, rows, cols, seed, mode
+    events      count, then per event: tick delta (varint), event code
+    keyframes   count, then per keyframe: tick, length (varints), zlib data
+
+Usage:
+    python SnakeReplay.py game.snkr      verify and fast-forward a replay
+"""
+import array
+import random as rand
+import struct
+import sys
+import time
+import unittest
+import zlib
+
+from Snake import (SnakeModel, SnakeEngine, SnakeBody, GameOver, DirectionState,
+                   Mode)
+
+MAGIC = b'SNKR'
+VERSION = 2
+HEADER = struct.Struct('<4sBIIQB')
+
+#event codes: 0-3 are DirectionState values
+MODE_NORM = 4
+MODE_WRAP = 5
+END = 6
+CAUSES = ['wall', 'self', 'full', 'unfinished']
+
+KEYFRAME = struct.Struct('<BBIiIIB')
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def little_endian(values):
+    """ Bytes of an array in little-endian order """
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def int_array(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode_model(model):
+    """ Full snapshot of a SnakeModel, including its RNG state """
+    version, mt, gauss = model.rng.getstate()
+    body = array.array('i', model.body.indices())
+    free = model.open_cells.cells
+    food = -1
+    if model.food_location:
+        food = model.food_location[0] * model.num_cols + model.food_location[1]
+    parts = [KEYFRAME.pack(model.direction, model.mode, model.points_earned, food,
+                           len(body), len(free), version),
+             little_endian(body), little_endian(free), bytes(model.grid),
+             little_endian(array.array('I', mt)),
+             struct.pack('<?d', gauss is not None, gauss or 0.0),
+             bytes([len(model.inputs)]), bytes(model.inputs)]
+    return zlib.compress(b''.join(parts), 1)
+
+def decode_model(data, num_rows, num_cols):
+    """ Rebuild a SnakeModel from encode_model output """
+    data = zlib.decompress(data)
+    direction, mode, points, food, body_len, free_len, version = KEYFRAME.unpack_from(data)
+    pos = KEYFRAME.size
+    body = int_array('i', data[pos:pos + 4 * body_len])
+    pos += 4 * body_len
+    free = int_array('i', data[pos:pos + 4 * free_len])
+    pos += 4 * free_len
+    cells = num_rows * num_cols
+    grid = data[pos:pos + cells]
+    pos += cells
+    mt = int_array('I', data[pos:pos + 4 * 625])
+    pos += 4 * 625
+    has_gauss, gauss = struct.unpack_from('<?d', data, pos)
+    pos += 9
+    inputs = data[pos + 1:pos + 1 + data[pos]]
+
+    model = SnakeModel(num_rows, num_cols)
+    model.grid[:] = grid
+    model.body = SnakeBody(num_cols)
+    for index in body:
+        model.body.push(index)
+    model.open_cells.cells = free
+    model.open_cells.position = array.array('i', [-1]) * cells
+    for slot, index in enumerate(free):
+        model.open_cells.position[index] = slot
+    #the free cell order came from elsewhere, a restart has to redo all of it
+    model.open_cells.low = 0
+    model.direction = DirectionState(direction)
+    model.mode = Mode(mode)
+    model.points_earned = points
+    model.food_location = divmod(food, num_cols) if food >= 0 else ()
+    model.rng.setstate((version, tuple(mt), gauss if has_gauss else None))
+    model.inputs.extend(DirectionState(direction) for direction in inputs)
+    return model
+
+def default_keyframe_interval(num_rows, num_cols):
+    """ Ticks between keyframes: 256 on small boards, and one keyframe per
+    64 cells of board per tick on large ones, where a keyframe takes
+    milliseconds to encode and megabytes to keep """
+    return max(256, num_rows * num_cols // 64)
+
+class ReplayRecorder:
+    """
+    Records a game as it is played.  Call record_direction and record_mode
+    when the input changes, record_step after every step the model takes,
+    and finish when the game ends.  keyframe_interval None picks one for
+    the board size, 0 stores no keyframes (for games that are only counted).
+    """
+
+    def __init__(self, model, seed, keyframe_interval = None):
+        if keyframe_interval is None:
+            keyframe_interval = default_keyframe_interval(model.num_rows, model.num_cols)
+        self.num_rows = model.num_rows
+        self.num_cols = model.num_cols
+        self.seed = seed
+        self.mode = int(model.mode)
+        self.model = model
+        self.keyframe_interval = keyframe_interval
+        self.tick = 0
+        self.last_event_tick = 0
+        self.event_count = 0
+        self.events = bytearray()
+        self.keyframes = []
+        self.cause = None
+
+    def record_event(self, code):
+        write_varint(self.events, self.tick - self.last_event_tick)
+        self.events.append(code)
+        self.last_event_tick = self.tick
+        self.event_count += 1
+
+    def record_direction(self, direction):
+        """ A turn accepted by SnakeModel.queue_direction """
+        self.record_event(int(direction))
+
+    def record_mode(self, mode):
+        self.record_event(MODE_WRAP if mode == Mode.Wrap else MODE_NORM)
+
+    def record_step(self):
+        self.tick += 1
+        if self.keyframe_interval and self.tick % self.keyframe_interval == 0:
+            self.keyframes.append((self.tick, encode_model(self.model)))
+
+    def finish(self, cause = 'unfinished'):
+        """ Mark the end of the game, cause is the GameOver message """
+        if self.cause is None:
+            self.cause = cause
+            self.record_event(END)
+            self.events.append(CAUSES.index(cause) if cause in CAUSES else 3)
+
+    def to_bytes(self):
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.num_rows, self.num_cols,
+                                    self.seed, self.mode))
+        write_varint(out, self.event_count)
+        out += self.events
+        write_varint(out, len(self.keyframes))
+        for tick, data in self.keyframes:
+            write_varint(out, tick)
+            write_varint(out, len(data))
+            out += data
+        return bytes(out)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+class Replay:
+    """ A loaded replay that can seek, fast-forward and verify itself """
+
+    def __init__(self, data):
+        magic, version, self.num_rows, self.num_cols, self.seed, self.mode = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a snake replay')
+        pos = HEADER.size
+        count, pos = read_varint(data, pos)
+        #events as (tick, code), applied before the step of that tick
+        self.events = []
+        self.end_tick = None
+        self.cause = None
+        tick = 0
+        for i in range(count):
+            delta, pos = read_varint(data, pos)
+            tick += delta
+            code = data[pos]
+            pos += 1
+            if code == END:
+                self.end_tick = tick
+                self.cause = CAUSES[data[pos]]
+                pos += 1
+            else:
+                self.events.append((tick, code))
+        count, pos = read_varint(data, pos)
+        #keyframes are decoded on demand, keep (tick, offset, length)
+        self.keyframes = []
+        for i in range(count):
+            tick, pos = read_varint(data, pos)
+            length, pos = read_varint(data, pos)
+            self.keyframes.append((tick, pos, length))
+            pos += length
+        self.data = data
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def initial_model(self):
+        model = SnakeModel(self.num_rows, self.num_cols, self.seed)
+        model.mode = Mode(self.mode)
+        return model
+
+    def keyframe(self, index):
+        tick, offset, length = self.keyframes[index]
+        return decode_model(self.data[offset:offset + length], self.num_rows, self.num_cols)
+
+    def first_event(self, tick):
+        """ Index of the first event at or after tick """
+        lo, hi = 0, len(self.events)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.events[mid][0] < tick:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def simulate(self, model, tick, target, on_step = None):
+        """
+        Step model from tick up to target, applying the recorded inputs,
+        calling on_step(tick, model, delta) with the StepDelta of each step.
+        Returns the tick reached, which is short of target if the game ended.
+        """
+        events = self.events
+        index = self.first_event(tick)
+        while tick < target:
+            while index < len(events) and events[index][0] == tick:
+                code = events[index][1]
+                if code == MODE_NORM:
+                    model.mode = Mode.Norm
+                elif code == MODE_WRAP:
+                    model.mode = Mode.Wrap
+                else:
+                    model.queue_direction(DirectionState(code))
+                index += 1
+            try:
+                delta = model.one_step()
+            except GameOver:
+                return tick
+            tick += 1
+            if on_step is not None:
+                on_step(tick, model, delta)
+        return tick
+
+    def last_tick(self):
+        """ The tick to simulate up to: the recorded end of an unfinished
+        game, one past the end of a game that ended (its final step raises
+        GameOver), or the last keyframe if the recording just stops """
+        if self.end_tick is None:
+            return max((tick for tick, offset, length in self.keyframes), default = 0)
+        if self.cause is None or self.cause == 'unfinished':
+            return self.end_tick
+        return self.end_tick + 1
+
+    def seek(self, tick):
+        """ The model as it was after tick steps, restored from the nearest
+        keyframe at or before tick """
+        start = 0
+        model = None
+        for index in range(len(self.keyframes) - 1, -1, -1):
+            if self.keyframes[index][0] <= tick:
+                start = self.keyframes[index][0]
+                model = self.keyframe(index)
+                break
+        if model is None:
+            model = self.initial_model()
+        self.simulate(model, start, tick)
+        return model
+
+    def verify(self):
+        """
+        Re-simulate the whole game from tick 0 and check that every keyframe
+        and the recorded ending are reproduced exactly.  Returns the final
+        model, raises AssertionError on any mismatch.
+        """
+        keyframes = {tick: (offset, length) for tick, offset, length in self.keyframes}
+        def check(tick, model, delta):
+            if tick in keyframes:
+                offset, length = keyframes[tick]
+                expected = zlib.decompress(self.data[offset:offset + length])
+                if zlib.decompress(encode_model(model)) != expected:
+                    raise AssertionError('replay diverged at tick %d' % tick)
+        model = self.initial_model()
+        reached = self.simulate(model, 0, self.last_tick(), check)
+        if self.cause is None or self.cause == 'unfinished':
+            return model
+        #the game ended during the step after end_tick
+        if reached != self.end_tick:
+            raise AssertionError('replay ended at tick %d, recorded %d' % (reached, self.end_tick))
+        return model
+
+def main(argv = None):
+    for path in (argv if argv is not None else sys.argv[1:]):
+        replay = Replay.load(path)
+        start = time.perf_counter()
+        model = replay.verify()
+        elapsed = time.perf_counter() - start
+        ticks = replay.end_tick or 0
+        print('%s: %dx%d, %d ticks, score %d, %s, verified in %.3fs (%.0f ticks/s)'
+              % (path, replay.num_rows, replay.num_cols, ticks, model.points_earned,
+                 replay.cause, elapsed, ticks / elapsed if elapsed else 0))
+
+class SnakeReplayTest(unittest.TestCase):
+    def record_game(self, seed, steps = 2000):
+        from SnakeTournament import random_policy, safe_directions
+        engine = SnakeEngine(12, 12, Mode.Norm, seed)
+        recorder = ReplayRecorder(engine.model, seed, keyframe_interval = 16)
+        rng = rand.Random(seed)
+        states = [bytes(engine.model.grid)]
+        while engine.steps < steps:
+            direction = None
+            if rng.random() < 0.2 or engine.model.direction not in safe_directions(engine.model):
+                direction = random_policy(engine.model, rng)
+            if direction is not None and engine.set_direction(direction):
+                recorder.record_direction(direction)
+            if rng.random() < 0.02:
+                engine.model.mode = Mode(1 - engine.model.mode)
+                recorder.record_mode(engine.model.mode)
+            if engine.step() is None:
+                recorder.finish(engine.cause)
+                break
+            recorder.record_step()
+            states.append(bytes(engine.model.grid))
+        return Replay(recorder.to_bytes()), states, engine
+
+    def test_verify(self):
+        for seed in range(5):
+            replay, states, engine = self.record_game(seed)
+            model = replay.verify()
+            self.assertEqual(model.points_earned, engine.score)
+            self.assertEqual(replay.cause, engine.cause)
+
+    def test_seek(self):
+        for seed in range(5):
+            replay, states, engine = self.record_game(seed)
+            for tick in range(0, len(states), 7):
+                self.assertEqual(bytes(replay.seek(tick).grid), states[tick])
+
+    def test_restart_decoded(self):
+        # A model rebuilt from a keyframe restarts like a new one
+        replay, states, engine = self.record_game(1)
+        for tick in range(0, len(states), 50):
+            model = replay.seek(tick)
+            model.restart(9)
+            fresh = SnakeModel(12, 12, 9)
+            self.assertEqual(bytes(model.grid), bytes(fresh.grid))
+            self.assertEqual(model.open_cells.cells, fresh.open_cells.cells)
+            self.assertEqual(model.open_cells.position, fresh.open_cells.position)
+            self.assertEqual(model.food_location, fresh.food_location)
+
+    def test_keyframe_interval(self):
+        self.assertEqual(default_keyframe_interval(30, 30), 256)
+        self.assertEqual(default_keyframe_interval(1000, 1000), 15625)
+        # Without keyframes the game can still be verified from its inputs
+        engine = SnakeEngine(8, 8, Mode.Wrap, 4)
+        recorder = ReplayRecorder(engine.model, 4, keyframe_interval = 0)
+        for i in range(600):
+            engine.step()
+            recorder.record_step()
+        recorder.finish()
+        self.assertEqual(recorder.keyframes, [])
+        self.assertEqual(recorder.tick, 600)
+        model = Replay(recorder.to_bytes()).verify()
+        self.assertEqual(bytes(model.grid), bytes(engine.model.grid))
+
+    def test_compact(self):
+        replay, states, engine = self.record_game(3)
+        # Apart from keyframes a replay costs a few bytes per input event
+        keyframe_bytes = sum(length + 6 for tick, offset, length in replay.keyframes)
+        self.assertLess(len(replay.data) - keyframe_bytes, 40 + 3 * len(replay.events))
+
+if __name__ == "__main__":
+    main()
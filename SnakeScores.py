@@ -0,0 +1,303 @@
+"""
+Module: SnakeScores
+
+Description:
+Leaderboard and results store for finished games, kept in a local SQLite
+database.  Every game is one row: score, steps, duration, points per
+second, mode, board size, seed, how it ended, the policy that played it
+and the replay file it was saved to, if any.  An index on (mode, rows,
+cols, score) serves top-N queries for a board setting straight from the
+index, and a table counting the games per (mode, rows, cols, score),
+kept up to date in the same transactions, answers counts and percentiles
+in time proportional to the number of distinct scores rather than games.
+
+Writes never happen on the game loop: a ScoreWriter queues results and a
+background thread inserts them in batches, one transaction per batch, so
+submitting a result costs about as much as appending to a list.
+
+Usage:
+    python SnakeScores.py scores.db --mode Norm --size 30 30 --top 10
+"""
+import argparse
+import collections
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+ScoreRecord = collections.namedtuple('ScoreRecord',
+        ['score', 'steps', 'duration', 'points_per_second', 'mode', 'num_rows',
+         'num_cols', 'seed', 'cause', 'policy', 'replay', 'finished'])
+ScoreRecord.__new__.__defaults__ = ('human', None, None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    points_per_second REAL NOT NULL,
+    mode TEXT NOT NULL,
+    num_rows INTEGER NOT NULL,
+    num_cols INTEGER NOT NULL,
+    seed INTEGER,
+    cause TEXT,
+    policy TEXT,
+    replay TEXT,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_board_score ON games (mode, num_rows, num_cols, score);
+CREATE INDEX IF NOT EXISTS games_finished ON games (finished);
+CREATE TABLE IF NOT EXISTS score_counts (
+    mode TEXT NOT NULL,
+    num_rows INTEGER NOT NULL,
+    num_cols INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (mode, num_rows, num_cols, score)
+) WITHOUT ROWID;
+"""
+
+INSERT = ('INSERT INTO games (score, steps, duration, points_per_second, mode, num_rows, '
+          'num_cols, seed, cause, policy, replay, finished) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+COUNT = ('INSERT INTO score_counts (mode, num_rows, num_cols, score, games) '
+         'VALUES (?, ?, ?, ?, ?) ON CONFLICT (mode, num_rows, num_cols, score) '
+         'DO UPDATE SET games = games + excluded.games')
+
+def connect(path):
+    """ Open the database at path, creating the schema if needed """
+    db = sqlite3.connect(path)
+    #WAL lets queries run while the writer thread inserts
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.executescript(SCHEMA)
+    #databases from before score_counts existed get it filled in once
+    with db:
+        if db.execute('SELECT 1 FROM games LIMIT 1').fetchone() and \
+                not db.execute('SELECT 1 FROM score_counts LIMIT 1').fetchone():
+            db.execute('INSERT INTO score_counts SELECT mode, num_rows, num_cols, score, '
+                       'COUNT(*) FROM games GROUP BY mode, num_rows, num_cols, score')
+    return db
+
+def batch_counts(records):
+    """ Rows for COUNT, one per (mode, rows, cols, score) in records """
+    counts = collections.Counter((record.mode, record.num_rows, record.num_cols,
+                                  record.score) for record in records)
+    return [key + (games,) for key, games in counts.items()]
+
+class ScoreWriter:
+    """
+    Inserts ScoreRecords into the database at path from a background
+    thread.  submit() and submit_many() only queue; the thread takes up to
+    batch_size records at a time and inserts them in one transaction.
+    """
+
+    def __init__(self, path, batch_size = 5000):
+        self.path = path
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.error = None
+        self.written = 0
+        #created here so the schema exists before the caller queries
+        connect(path).close()
+        self.thread = threading.Thread(target = self.run, name = 'ScoreWriter', daemon = True)
+        self.thread.start()
+
+    def submit(self, record):
+        """ Queue one ScoreRecord, a finished time of None means now """
+        if record.finished is None:
+            record = record._replace(finished = time.time())
+        self.queue.put([record])
+
+    def submit_many(self, records):
+        """ Queue a list of ScoreRecords as one item, for headless runs """
+        now = time.time()
+        self.queue.put([record if record.finished is not None
+                        else record._replace(finished = now) for record in records])
+
+    def run(self):
+        db = connect(self.path)
+        stop = False
+        while not stop:
+            items = [self.queue.get()]
+            count = len(items[0]) if items[0] is not None else 0
+            while count < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                count += len(item) if item is not None else 0
+            batch = []
+            for item in items:
+                if item is None:
+                    stop = True
+                else:
+                    batch.extend(item)
+            try:
+                if batch:
+                    with db:
+                        db.executemany(INSERT, batch)
+                        db.executemany(COUNT, batch_counts(batch))
+                    self.written += len(batch)
+            except sqlite3.Error as error:
+                self.error = error
+            finally:
+                for item in items:
+                    self.queue.task_done()
+        db.close()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def flush(self):
+        """ Wait until everything queued so far is in the database """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        """ Write what is left and stop the thread """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.check()
+
+class ScoreStore:
+    """ Queries over the results in the database at path """
+
+    def __init__(self, path):
+        self.db = connect(path)
+
+    def close(self):
+        self.db.close()
+
+    def count(self, mode, num_rows, num_cols):
+        return self.db.execute('SELECT COALESCE(SUM(games), 0) FROM score_counts WHERE '
+                               'mode = ? AND num_rows = ? AND num_cols = ?',
+                               (mode, num_rows, num_cols)).fetchone()[0]
+
+    def top(self, mode, num_rows, num_cols, n = 10):
+        """ The n best games for a mode and board size, best first """
+        rows = self.db.execute('SELECT * FROM games WHERE mode = ? AND num_rows = ? AND '
+                               'num_cols = ? ORDER BY score DESC LIMIT ?',
+                               (mode, num_rows, num_cols, n)).fetchall()
+        return [ScoreRecord(*row[1:]) for row in rows]
+
+    def percentile(self, mode, num_rows, num_cols, p):
+        """ Score below which p percent of the games for a mode and board
+        size fall, by the nearest rank, None if there are none """
+        counts = self.db.execute('SELECT score, games FROM score_counts WHERE mode = ? AND '
+                                 'num_rows = ? AND num_cols = ? ORDER BY score',
+                                 (mode, num_rows, num_cols)).fetchall()
+        count = sum(games for score, games in counts)
+        if count == 0:
+            return None
+        rank = min(count - 1, max(0, int(-(-p * count // 100)) - 1))
+        for score, games in counts:
+            if rank < games:
+                return score
+            rank -= games
+
+    def boards(self):
+        """ Every (mode, rows, cols) with results, and its game count """
+        return self.db.execute('SELECT mode, num_rows, num_cols, SUM(games) FROM score_counts '
+                               'GROUP BY mode, num_rows, num_cols').fetchall()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Show the snake leaderboard')
+    parser.add_argument('database')
+    parser.add_argument('--mode', default = 'Norm')
+    parser.add_argument('--size', type = int, nargs = 2, default = [30, 30],
+                        metavar = ('ROWS', 'COLS'))
+    parser.add_argument('--top', type = int, default = 10)
+    args = parser.parse_args(argv)
+    store = ScoreStore(args.database)
+    rows, cols = args.size
+    print('%d games, p50 %s, p90 %s, p99 %s' % (store.count(args.mode, rows, cols),
+          store.percentile(args.mode, rows, cols, 50),
+          store.percentile(args.mode, rows, cols, 90),
+          store.percentile(args.mode, rows, cols, 99)))
+    for place, record in enumerate(store.top(args.mode, rows, cols, args.top), 1):
+        print('%3d. %6d points  %8d steps  %-8s %-10s %s' % (place, record.score,
+              record.steps, record.cause, record.policy, record.replay or ''))
+    store.close()
+
+class SnakeScoresTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'scores.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_queries(self):
+        writer = ScoreWriter(self.path, batch_size = 64)
+        for score in range(1, 101):
+            writer.submit(ScoreRecord(score, score * 10, 1.0, score, 'Norm', 30, 30,
+                                      score, 'wall'))
+        writer.submit_many([ScoreRecord(500, 1, 1.0, 1, 'Wrap', 30, 30, 0, 'self', 'bot')])
+        writer.flush()
+        store = ScoreStore(self.path)
+        self.assertEqual(store.count('Norm', 30, 30), 100)
+        self.assertEqual([record.score for record in store.top('Norm', 30, 30, 3)],
+                         [100, 99, 98])
+        self.assertEqual(store.percentile('Norm', 30, 30, 50), 50)
+        self.assertEqual(store.percentile('Norm', 30, 30, 99), 99)
+        self.assertEqual(store.percentile('Norm', 30, 30, 100), 100)
+        self.assertEqual(store.percentile('Norm', 10, 10, 50), None)
+        self.assertEqual(store.top('Wrap', 30, 30)[0].policy, 'bot')
+        #the board index serves the leaderboard queries
+        plan = store.db.execute('EXPLAIN QUERY PLAN SELECT * FROM games WHERE mode = ? AND '
+                                'num_rows = ? AND num_cols = ? ORDER BY score DESC LIMIT 5',
+                                ('Norm', 30, 30)).fetchall()
+        self.assertIn('games_board_score', str(plan))
+        store.close()
+        writer.close()
+
+    def test_counts_backfilled(self):
+        # A database written before score_counts gets its counts on opening
+        db = sqlite3.connect(self.path)
+        db.executescript(SCHEMA.split('CREATE TABLE IF NOT EXISTS score_counts')[0])
+        with db:
+            db.executemany(INSERT, [ScoreRecord(score % 10, 1, 1.0, 1.0, 'Norm', 20, 20,
+                                                score, 'wall', 'bot', None, 0.0)
+                                    for score in range(1000)])
+        db.close()
+        store = ScoreStore(self.path)
+        self.assertEqual(store.count('Norm', 20, 20), 1000)
+        self.assertEqual(store.percentile('Norm', 20, 20, 50), 4)
+        self.assertEqual(store.percentile('Norm', 20, 20, 100), 9)
+        self.assertEqual(store.boards(), [('Norm', 20, 20, 1000)])
+        store.close()
+        # and new games add to them
+        writer = ScoreWriter(self.path)
+        writer.submit_many([ScoreRecord(50, 1, 1.0, 1.0, 'Norm', 20, 20, 0, 'wall')] * 1000)
+        writer.close()
+        store = ScoreStore(self.path)
+        self.assertEqual(store.count('Norm', 20, 20), 2000)
+        self.assertEqual(store.percentile('Norm', 20, 20, 51), 50)
+        store.close()
+
+    def test_submit_is_cheap(self):
+        writer = ScoreWriter(self.path)
+        record = ScoreRecord(1, 1, 0.1, 10.0, 'Norm', 10, 10, 1, 'wall', 'random')
+        start = time.perf_counter()
+        for i in range(20000):
+            writer.submit(record)
+        elapsed = time.perf_counter() - start
+        writer.close()
+        self.assertEqual(writer.written, 20000)
+        store = ScoreStore(self.path)
+        self.assertEqual(store.count('Norm', 10, 10), 20000)
+        store.close()
+        self.assertLess(elapsed / 20000, 1e-4)
+
+if __name__ == "__main__":
+    main()
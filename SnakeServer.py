@@ -0,0 +1,465 @@
+"""
+Module: SnakeServer
+
+Description:
+Hosts many snake games from one process.  An asyncio TCP server keeps a
+room per game name; every client in a room sees the same game and any of
+them can steer it.  Rooms are not given a task or a timer each: all of
+them hang off one TimerWheel, and a single task wakes once per wheel slot
+and ticks every room that is due, so thousands of rooms cost one wakeup
+per slot rather than one per room per tick.
+
+After each tick a room sends its clients only the cells that changed.
+
+Protocol, one line of space separated fields per message:
+    client  JOIN <room>               join a room, creating it if needed
+            DIR <direction>           queue a turn, a DirectionState value
+            STATS                     ask for server counters
+    server  S <tick> <rows> <cols> <score> <food> <body cells...>
+                                      full state, sent on join and new games
+            D <tick> <stamp> <score> <cell>:<state>...
+                                      cells changed by one tick
+            E <tick> <cause> <score>  the game ended, a new one follows
+            STATS <rooms> <clients> <ticks> <uptime> <late p99 ms>
+Cells are flat indices row*cols+col, states are CellState values, and
+stamp is the server's time.monotonic() in milliseconds when the tick was
+sent, which a client on the same machine can use to measure latency.
+
+Usage:
+    python SnakeServer.py serve --port 7777 --period 100
+    python SnakeServer.py load --port 7777 --rooms 1000 --duration 10
+"""
+import argparse
+import asyncio
+import collections
+import random as rand
+import time
+import unittest
+
+from Snake import SnakeEngine, DirectionState, Mode, SNAKE, FOOD
+from SnakeProfile import LatencyHistogram
+
+#drop clients that stop reading once this much output is queued for them
+MAX_BUFFERED = 1 << 20
+
+class TimerWheel:
+    """
+    Hashed timer wheel with num_slots slots of slot_time seconds each.
+    Items are filed under the slot they fall due in, so scheduling is O(1)
+    and each slot only looks at its own items.  Delays longer than the
+    wheel wait for later turns of the wheel in the same slot.
+    """
+
+    def __init__(self, slot_time = 0.01, num_slots = 512, clock = time.monotonic):
+        self.slot_time = slot_time
+        self.slots = [[] for i in range(num_slots)]
+        self.clock = clock
+        self.start = clock()
+        #number of slots expired so far
+        self.current = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, item, delay):
+        """ Fire item after delay seconds, at the earliest in the next slot """
+        due = self.current + max(1, int(round(delay / self.slot_time)))
+        self.slots[due % len(self.slots)].append((due, item))
+        self.count += 1
+
+    def next_time(self):
+        """ When the next slot falls due """
+        return self.start + (self.current + 1) * self.slot_time
+
+    def expire(self, now = None):
+        """ Advance through every slot due by now, returns the items due in them """
+        if now is None:
+            now = self.clock()
+        due = []
+        while self.next_time() <= now:
+            self.current += 1
+            slot = self.slots[self.current % len(self.slots)]
+            if not slot:
+                continue
+            later = []
+            for entry in slot:
+                if entry[0] <= self.current:
+                    due.append(entry[1])
+                else:
+                    later.append(entry)
+            slot[:] = later
+        self.count -= len(due)
+        return due
+
+class Room:
+    """ One game and the clients watching it """
+
+    def __init__(self, name, num_rows, num_cols, mode, period, rng):
+        self.name = name
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.mode = mode
+        self.period = period
+        self.rng = rng
+        self.clients = set()
+        self.tick = 0
+        self.closed = False
+        self.engine = None
+        self.new_game()
+
+    def new_game(self):
+        seed = self.rng.randrange(2**63)
+        if self.engine is None:
+            self.engine = SnakeEngine(self.num_rows, self.num_cols, self.mode, seed)
+        else:
+            self.engine.restart(seed, self.mode)
+
+    def full_state(self):
+        model = self.engine.model
+        food = model.food_location[0] * self.num_cols + model.food_location[1]
+        return ('S %d %d %d %d %d %s\n' % (self.tick, self.num_rows, self.num_cols,
+                model.points_earned, food,
+                ' '.join(map(str, model.body.indices())))).encode()
+
+    def step(self, stamp):
+        """ Tick the game once, returns the message for the clients """
+        self.tick += 1
+        engine = self.engine
+        delta = engine.step()
+        if delta is None:
+            message = 'E %d %s %d\n' % (self.tick, engine.cause, engine.score)
+            self.new_game()
+            return message.encode() + self.full_state()
+        cols = self.num_cols
+        changes = ' '.join('%d:%d' % (row * cols + col, cell)
+                           for row, col, cell in delta.changes)
+        return ('D %d %.3f %d %s\n' % (self.tick, stamp, engine.score, changes)).encode()
+
+    def broadcast(self, message):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                self.clients.discard(writer)
+                writer.close()
+            else:
+                writer.write(message)
+
+class SnakeServer:
+    """
+    Serves rooms of num_rows x num_cols games ticking every period seconds.
+    Call start() inside a running event loop, then close() to stop.
+    """
+
+    def __init__(self, num_rows = 30, num_cols = 30, mode = Mode.Wrap, period = 0.1,
+                 slot_time = 0.005, seed = None):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.mode = mode
+        self.period = period
+        self.rng = rand.Random(seed)
+        self.rooms = {}
+        self.wheel = TimerWheel(slot_time)
+        #how late each slot was processed, and room ticks done
+        self.lateness = LatencyHistogram()
+        self.ticks = 0
+        self.clients = 0
+        self.server = None
+        self.ticker = None
+
+    async def start(self, host = '127.0.0.1', port = 0):
+        """ Listen on host and port, returns the port actually bound """
+        self.wheel = TimerWheel(self.wheel.slot_time)
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.ticker = asyncio.ensure_future(self.run())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.ticker.cancel()
+        self.server.close()
+        for room in self.rooms.values():
+            for writer in room.clients:
+                writer.close()
+        await self.server.wait_closed()
+
+    def room(self, name):
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = Room(name, self.num_rows, self.num_cols,
+                                           self.mode, self.period, self.rng)
+            self.wheel.schedule(room, room.period)
+        return room
+
+    async def run(self):
+        """ The one task that ticks every room """
+        wheel = self.wheel
+        clock = wheel.clock
+        while True:
+            now = clock()
+            due = wheel.expire(now)
+            if due:
+                self.lateness.record(now - (wheel.next_time() - wheel.slot_time))
+                stamp = clock() * 1000
+                for room in due:
+                    if room.closed:
+                        continue
+                    room.broadcast(room.step(stamp))
+                    wheel.schedule(room, room.period)
+                self.ticks += len(due)
+            await asyncio.sleep(max(0.0, wheel.next_time() - clock()))
+
+    async def handle_client(self, reader, writer):
+        room = None
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                fields = line.split()
+                if not fields:
+                    continue
+                command = fields[0]
+                if command == b'DIR' and room is not None:
+                    room.engine.set_direction(DirectionState(int(fields[1])))
+                elif command == b'JOIN':
+                    if room is not None:
+                        self.leave(room, writer)
+                    room = self.room(fields[1].decode())
+                    room.clients.add(writer)
+                    writer.write(room.full_state())
+                elif command == b'STATS':
+                    writer.write(self.stats_line())
+        except (ConnectionError, ValueError, IndexError):
+            pass
+        finally:
+            self.clients -= 1
+            if room is not None:
+                self.leave(room, writer)
+            writer.close()
+
+    def leave(self, room, writer):
+        """ Remove a client, and the room once nobody is left in it """
+        room.clients.discard(writer)
+        if not room.clients:
+            room.closed = True
+            #several dropped clients may leave an emptied room, which may
+            #already have been replaced by a new one of the same name
+            if self.rooms.get(room.name) is room:
+                del self.rooms[room.name]
+
+    def stats_line(self):
+        uptime = self.wheel.clock() - self.wheel.start
+        return ('STATS %d %d %d %.3f %.3f\n' % (len(self.rooms), self.clients,
+                self.ticks, uptime, 1000 * self.lateness.percentile(99))).encode()
+
+class BoardMirror:
+    """ A client's copy of a room's board, kept up to date from messages """
+
+    def __init__(self):
+        self.grid = None
+        self.tick = 0
+        self.score = 0
+        self.games = 0
+
+    def apply(self, fields):
+        """ Apply one message, given as its split fields, returns its stamp or None """
+        kind = fields[0]
+        if kind == b'D':
+            grid = self.grid
+            self.tick = int(fields[1])
+            self.score = int(fields[3])
+            for change in fields[4:]:
+                cell, state = change.split(b':')
+                grid[int(cell)] = int(state)
+            return float(fields[2])
+        if kind == b'S':
+            self.tick = int(fields[1])
+            rows, cols = int(fields[2]), int(fields[3])
+            self.score = int(fields[4])
+            self.grid = bytearray(rows * cols)
+            self.grid[int(fields[5])] = FOOD
+            for cell in fields[6:]:
+                self.grid[int(cell)] = SNAKE
+        elif kind == b'E':
+            self.games += 1
+        return None
+
+async def load_client(host, port, room, histogram, counts, stop, rng, turn_chance):
+    """ One simulated player: joins room, mirrors the board and turns at random """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'JOIN %s\n' % room.encode())
+    mirror = BoardMirror()
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            stamp = mirror.apply(line.split())
+            if stamp is not None:
+                histogram.record(max(0.0, time.monotonic() - stamp / 1000))
+                counts['ticks'] += 1
+                if rng.random() < turn_chance:
+                    writer.write(b'DIR %d\n' % rng.randrange(4))
+    finally:
+        writer.close()
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'STATS\n')
+    fields = (await reader.readline()).split()
+    writer.close()
+    return dict(rooms = int(fields[1]), clients = int(fields[2]), ticks = int(fields[3]),
+                uptime = float(fields[4]), late_p99_ms = float(fields[5]))
+
+async def run_load(host, port, rooms, clients_per_room = 1, duration = 10.0,
+                   turn_chance = 0.1, seed = 0):
+    """
+    Connect rooms x clients_per_room players and let them play for
+    duration seconds.  Returns ticks received per second, the server's
+    ticks per second and the broadcast latency percentiles.
+    """
+    rng = rand.Random(seed)
+    histogram = LatencyHistogram()
+    counts = collections.Counter()
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(load_client(host, port, 'load-%d' % room, histogram,
+                                               counts, stop, rng, turn_chance))
+             for room in range(rooms) for client in range(clients_per_room)]
+    #let every client join before measuring
+    await asyncio.sleep(min(1.0, duration / 4))
+    before = await query_stats(host, port)
+    received = counts['ticks']
+    start = time.monotonic()
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - start
+    after = await query_stats(host, port)
+    received = counts['ticks'] - received
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+    result = dict(rooms = after['rooms'], clients = after['clients'],
+                  received_ticks_per_s = received / elapsed,
+                  server_ticks_per_s = (after['ticks'] - before['ticks'])
+                                       / (after['uptime'] - before['uptime']),
+                  server_late_p99_ms = after['late_p99_ms'])
+    result.update(('latency_' + key, value) for key, value in histogram.summary().items())
+    return result
+
+async def serve(args):
+    server = SnakeServer(args.rows, args.cols, Mode[args.mode], args.period / 1000)
+    port = await server.start(args.host, args.port)
+    print('serving on %s:%d' % (args.host, port))
+    await asyncio.Event().wait()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Multi-room snake server')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    serve_parser = commands.add_parser('serve', help = 'run the server')
+    serve_parser.add_argument('--rows', type = int, default = 30)
+    serve_parser.add_argument('--cols', type = int, default = 30)
+    serve_parser.add_argument('--mode', default = 'Wrap', choices = [mode.name for mode in Mode])
+    serve_parser.add_argument('--period', type = float, default = 100, help = 'tick in ms')
+    load_parser = commands.add_parser('load', help = 'load test a running server')
+    load_parser.add_argument('--rooms', type = int, default = 100)
+    load_parser.add_argument('--clients', type = int, default = 1, help = 'per room')
+    load_parser.add_argument('--duration', type = float, default = 10.0)
+    for sub in (serve_parser, load_parser):
+        sub.add_argument('--host', default = '127.0.0.1')
+        sub.add_argument('--port', type = int, default = 7777)
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        asyncio.run(serve(args))
+    else:
+        result = asyncio.run(run_load(args.host, args.port, args.rooms, args.clients,
+                                      args.duration))
+        for key, value in result.items():
+            print('%-24s %s' % (key, round(value, 3)))
+
+class TimerWheelTest(unittest.TestCase):
+    def test_expire(self):
+        now = [0.0]
+        wheel = TimerWheel(0.01, 8, clock = lambda: now[0])
+        wheel.schedule('a', 0.03)
+        wheel.schedule('b', 0.2)       #more than one turn of the wheel
+        wheel.schedule('c', 0.0)
+        self.assertEqual(len(wheel), 3)
+        now[0] = 0.0101
+        self.assertEqual(wheel.expire(), ['c'])
+        now[0] = 0.0301
+        self.assertEqual(wheel.expire(), ['a'])
+        now[0] = 0.1
+        self.assertEqual(wheel.expire(), [])
+        now[0] = 0.2001
+        self.assertEqual(wheel.expire(), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+class SnakeServerTest(unittest.TestCase):
+    def test_rooms(self):
+        # Clients mirror their room exactly from the deltas they receive
+        async def scenario():
+            server = SnakeServer(8, 8, Mode.Wrap, period = 0.01, slot_time = 0.002, seed = 1)
+            port = await server.start()
+            players = []
+            for i in range(6):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b'JOIN room-%d\n' % (i % 3))
+                players.append((reader, writer, BoardMirror()))
+            stamps = []
+            for step in range(40):
+                for reader, writer, mirror in players:
+                    stamp = mirror.apply((await reader.readline()).split())
+                    if stamp is not None:
+                        stamps.append(stamp)
+                    if step % 5 == 0:
+                        writer.write(b'DIR %d\n' % (step // 5 % 4))
+            self.assertEqual(len(server.rooms), 3)
+            self.assertGreater(len(stamps), 100)
+            #stop ticking, then drain what is in flight and compare
+            server.ticker.cancel()
+            await asyncio.sleep(0.05)
+            for reader, writer, mirror in players:
+                while True:
+                    try:
+                        line = await asyncio.wait_for(reader.readline(), 0.05)
+                    except asyncio.TimeoutError:
+                        break
+                    mirror.apply(line.split())
+            for i, (reader, writer, mirror) in enumerate(players):
+                room = server.rooms['room-%d' % (i % 3)]
+                self.assertEqual(mirror.grid, room.engine.model.grid)
+                self.assertEqual(mirror.tick, room.tick)
+            for reader, writer, mirror in players:
+                writer.close()
+            await asyncio.sleep(0.05)
+            self.assertEqual(server.rooms, {})
+            await server.close()
+        asyncio.run(scenario())
+
+    def test_leave_emptied_room(self):
+        # Clients dropped together all leave, without touching a newer room
+        server = SnakeServer(6, 6, seed = 3)
+        room = server.room('a')
+        first, second = object(), object()
+        room.clients.update((first, second))
+        room.clients.clear()
+        server.leave(room, first)
+        self.assertTrue(room.closed)
+        newer = server.room('a')
+        server.leave(room, second)
+        self.assertIs(server.rooms['a'], newer)
+
+    def test_load(self):
+        async def scenario():
+            server = SnakeServer(10, 10, period = 0.02, seed = 2)
+            port = await server.start()
+            result = await run_load('127.0.0.1', port, rooms = 20, duration = 0.5)
+            await server.close()
+            return result
+        result = asyncio.run(scenario())
+        self.assertEqual(result['rooms'], 20)
+        self.assertGreater(result['received_ticks_per_s'], 0)
+        self.assertGreater(result['server_ticks_per_s'], 0)
+
+if __name__ == "__main__":
+    main()
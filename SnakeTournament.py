@@ -0,0 +1,213 @@
+"""
+Module: SnakeTournament
+
+Description:
+Runs large sweeps of headless snake games (seeds x board sizes x modes x
+policies) across a process pool.  Every game gets its own explicit seed,
+used for both the SnakeModel and the policy, so a sweep gives the same
+results on every run no matter how the games are spread over workers.
+Results stream back as soon as each batch of games finishes.
+
+Usage:
+    python SnakeTournament.py --seeds 100 --sizes 10 30 --policies greedy random
+"""
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import random as rand
+import sys
+import time
+import unittest
+
+from Snake import SnakeEngine, CellState, DirectionState, Mode
+from SnakeAutopilot import Autopilot
+
+GameSpec = collections.namedtuple('GameSpec',
+        ['index', 'seed', 'num_rows', 'num_cols', 'mode', 'policy', 'max_steps'])
+GameResult = collections.namedtuple('GameResult',
+        ['spec', 'score', 'steps', 'cause', 'wall_time'])
+
+def next_cell(model, direction):
+    """ Cell the head would move into going in direction, None if it hits a wall """
+    row, col = model.snake[-1]
+    if direction == DirectionState.up:
+        row -= 1
+    elif direction == DirectionState.down:
+        row += 1
+    elif direction == DirectionState.left:
+        col -= 1
+    else:
+        col += 1
+    if 0 <= row < model.num_rows and 0 <= col < model.num_cols:
+        return (row, col)
+    if model.mode == Mode.Wrap:
+        return (row % model.num_rows, col % model.num_cols)
+    return None
+
+def safe_directions(model):
+    """ Directions that do not end the game on the next step """
+    safe = []
+    for direction in DirectionState:
+        cell = next_cell(model, direction)
+        if cell is not None and model.state[cell[0]][cell[1]] != CellState.Snake:
+            safe.append(direction)
+    return safe
+
+def straight_policy(model, rng):
+    """ Never turn """
+    return None
+
+def random_policy(model, rng):
+    """ Pick a random direction that survives the next step """
+    safe = safe_directions(model)
+    return rng.choice(safe) if safe else None
+
+def greedy_policy(model, rng):
+    """ Step towards the food by Manhattan distance, staying safe """
+    safe = safe_directions(model)
+    if not safe:
+        return None
+    food_row, food_col = model.food_location
+    def distance(direction):
+        row, col = next_cell(model, direction)
+        return abs(row - food_row) + abs(col - food_col)
+    return min(safe, key = distance)
+
+POLICIES = {'straight': straight_policy,
+            'random': random_policy,
+            'greedy': greedy_policy,
+            'autopilot': Autopilot}
+
+def make_policy(name):
+    """ The policy for one game, stateful policies get a fresh instance """
+    policy = POLICIES[name]
+    if policy is Autopilot:
+        #no time budget, so results do not depend on machine speed
+        return Autopilot(time_budget = None)
+    return policy
+
+def play_game(spec, engine = None):
+    """ Play one game to the end and return its GameResult.  An engine
+    for the same board size is restarted instead of building a new one. """
+    start = time.perf_counter()
+    if engine is None:
+        engine = SnakeEngine(spec.num_rows, spec.num_cols, Mode(spec.mode), spec.seed)
+    else:
+        engine.restart(spec.seed, Mode(spec.mode))
+    policy = make_policy(spec.policy)
+    policy_rng = rand.Random('policy-%d' % spec.seed)
+    while engine.steps < spec.max_steps:
+        direction = policy(engine.model, policy_rng)
+        if direction is not None:
+            engine.set_direction(direction)
+        if engine.step() is None:
+            break
+    cause = engine.cause if engine.game_over else 'max_steps'
+    return GameResult(spec, engine.score, engine.steps, cause,
+                      time.perf_counter() - start)
+
+def play_games(specs):
+    """ Play a batch of games in one worker, one engine per board size """
+    engines = {}
+    results = []
+    for spec in specs:
+        size = (spec.num_rows, spec.num_cols)
+        if size not in engines:
+            engines[size] = SnakeEngine(spec.num_rows, spec.num_cols)
+        results.append(play_game(spec, engines[size]))
+    return results
+
+def make_specs(seeds, sizes, modes, policies, max_steps = 10000):
+    """ Every combination of seed, (rows, cols) size, mode and policy """
+    specs = []
+    for index, (seed, size, mode, policy) in enumerate(
+            itertools.product(seeds, sizes, modes, policies)):
+        specs.append(GameSpec(index, seed, size[0], size[1], int(mode), policy, max_steps))
+    return specs
+
+def run_tournament(specs, workers = None, batch_size = 16):
+    """
+    Play every spec across a pool of worker processes, yielding each
+    GameResult as its batch finishes.  Games are sent to workers in
+    batches of batch_size to keep inter-process overhead low.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    batches = [specs[i:i + batch_size] for i in range(0, len(specs), batch_size)]
+    if workers == 1:
+        for batch in batches:
+            yield from play_games(batch)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(play_games, batch) for batch in batches]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+def result_record(result):
+    """ Flatten a GameResult into a dict for JSON output """
+    record = result.spec._asdict()
+    record['mode'] = Mode(record['mode']).name
+    record.update(score = result.score, steps = result.steps,
+                  cause = result.cause, wall_time = round(result.wall_time, 6))
+    return record
+
+def score_record(result):
+    """ A GameResult as a SnakeScores.ScoreRecord """
+    import SnakeScores
+    spec = result.spec
+    return SnakeScores.ScoreRecord(result.score, result.steps, result.wall_time,
+                                   result.score / result.wall_time if result.wall_time else 0.0,
+                                   Mode(spec.mode).name, spec.num_rows, spec.num_cols,
+                                   spec.seed, result.cause, spec.policy)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Run a headless snake tournament')
+    parser.add_argument('--seeds', type = int, default = 10, help = 'seeds per setting')
+    parser.add_argument('--first-seed', type = int, default = 0)
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [30],
+                        help = 'square board sizes')
+    parser.add_argument('--modes', nargs = '+', default = ['Norm', 'Wrap'],
+                        choices = [mode.name for mode in Mode])
+    parser.add_argument('--policies', nargs = '+', default = sorted(POLICIES),
+                        choices = sorted(POLICIES))
+    parser.add_argument('--max-steps', type = int, default = 10000)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--scores', help = 'also store every result in this leaderboard database')
+    args = parser.parse_args(argv)
+
+    specs = make_specs(range(args.first_seed, args.first_seed + args.seeds),
+                       [(size, size) for size in args.sizes],
+                       [Mode[name] for name in args.modes],
+                       args.policies, args.max_steps)
+    scores = None
+    if args.scores:
+        import SnakeScores
+        scores = SnakeScores.ScoreWriter(args.scores)
+    for result in run_tournament(specs, args.workers):
+        sys.stdout.write(json.dumps(result_record(result)) + '\n')
+        if scores is not None:
+            scores.submit(score_record(result))
+    if scores is not None:
+        scores.close()
+
+class SnakeTournamentTest(unittest.TestCase):
+    def test_reproducible(self):
+        # The same spec always plays out the same way
+        specs = make_specs(range(5), [(8, 8)], [Mode.Norm, Mode.Wrap], sorted(POLICIES), 500)
+        first = [play_game(spec)[:4] for spec in specs]
+        second = [play_game(spec)[:4] for spec in specs]
+        self.assertEqual(first, second)
+
+    def test_pool_matches_serial(self):
+        specs = make_specs(range(4), [(6, 6), (9, 9)], [Mode.Wrap], ['greedy'], 300)
+        serial = sorted(result[:4] for result in run_tournament(specs, workers = 1))
+        pooled = sorted(result[:4] for result in run_tournament(specs, workers = 2,
+                                                                batch_size = 3))
+        self.assertEqual(serial, pooled)
+        self.assertEqual(len(pooled), len(specs))
+
+if __name__ == "__main__":
+    main()